@@ -1,12 +1,29 @@
-from app.agent.base import BaseAgent
-from app.agent.browser import BrowserAgent
-from app.agent.mcp import MCPAgent
-from app.agent.react import ReActAgent
-from app.agent.swe import SWEAgent
-from app.agent.toolcall import ToolCallAgent
+import importlib
+
+
+# Agents are imported on first access, so importing one agent does not load
+# the tool dependencies of all the others
+_LAZY_AGENTS = {
+    "BaseAgent": "app.agent.base",
+    "AgentPool": "app.agent.pool",
+    "BrowserAgent": "app.agent.browser",
+    "MCPAgent": "app.agent.mcp",
+    "ReActAgent": "app.agent.react",
+    "SWEAgent": "app.agent.swe",
+    "ToolCallAgent": "app.agent.toolcall",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_AGENTS:
+        value = getattr(importlib.import_module(_LAZY_AGENTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
+    "AgentPool",
     "BaseAgent",
     "BrowserAgent",
     "ReActAgent",
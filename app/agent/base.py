@@ -1,3 +1,4 @@
+import sys
 from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager
 from typing import List, Optional
@@ -5,11 +6,21 @@ from typing import List, Optional
 from pydantic import BaseModel, Field, model_validator
 
 from app.llm import LLM
+from app.llm_router import get_llm
 from app.logger import logger
-from app.sandbox.client import SANDBOX_CLIENT
+from app.metrics import metrics_labels
 from app.schema import ROLE_TYPE, AgentState, Memory, Message
 
 
+STUCK_PROMPT = (
+    "Observed duplicate responses. Consider new strategies and avoid repeating "
+    "ineffective paths already attempted."
+)
+
+# Prompts an agent may rewrite while running; reset restores them
+PROMPT_FIELDS = ("system_prompt", "next_step_prompt")
+
+
 class BaseAgent(BaseModel, ABC):
     """Abstract base class for managing agent state and execution.
 
@@ -30,7 +41,7 @@ class BaseAgent(BaseModel, ABC):
     )
 
     # Dependencies
-    llm: LLM = Field(default_factory=LLM, description="Language model instance")
+    llm: LLM = Field(default_factory=get_llm, description="Language model instance")
     memory: Memory = Field(default_factory=Memory, description="Agent's memory store")
     state: AgentState = Field(
         default=AgentState.IDLE, description="Current agent state"
@@ -41,6 +52,18 @@ class BaseAgent(BaseModel, ABC):
     current_step: int = Field(default=0, description="Current step in execution")
 
     duplicate_threshold: int = 2
+    loop_window: int = Field(
+        default=6,
+        description="Recent assistant responses checked for duplicates and for a repeating pattern of tool calls; 0 disables both",
+    )
+    max_stuck_steps: int = Field(
+        default=3,
+        description="Consecutive stuck steps answered with a change-strategy prompt before the run is stopped",
+    )
+
+    _stuck_steps: int = 0
+    # Prompts as constructed, before any rewrite during a run
+    _initial_prompts: dict = {}
 
     class Config:
         arbitrary_types_allowed = True
@@ -50,9 +73,10 @@ class BaseAgent(BaseModel, ABC):
     def initialize_agent(self) -> "BaseAgent":
         """Initialize agent with default settings if not provided."""
         if self.llm is None or not isinstance(self.llm, LLM):
-            self.llm = LLM(config_name=self.name.lower())
+            self.llm = get_llm(self.name.lower())
         if not isinstance(self.memory, Memory):
             self.memory = Memory()
+        self._initial_prompts = {name: getattr(self, name) for name in PROMPT_FIELDS}
         return self
 
     @asynccontextmanager
@@ -138,11 +162,14 @@ class BaseAgent(BaseModel, ABC):
             ):
                 self.current_step += 1
                 logger.info(f"Executing step {self.current_step}/{self.max_steps}")
-                step_result = await self.step()
+                with metrics_labels(agent=self.name, step=self.current_step):
+                    step_result = await self.step()
 
                 # Check for stuck state
                 if self.is_stuck():
                     self.handle_stuck_state()
+                elif self._stuck_steps:
+                    self._clear_stuck_state()
 
                 results.append(f"Step {self.current_step}: {step_result}")
 
@@ -150,9 +177,31 @@ class BaseAgent(BaseModel, ABC):
                 self.current_step = 0
                 self.state = AgentState.IDLE
                 results.append(f"Terminated: Reached max steps ({self.max_steps})")
-        await SANDBOX_CLIENT.cleanup()
+        # The sandbox client is loaded by the tools that use it; if none did,
+        # there is nothing to clean up and docker is never imported
+        sandbox_client = sys.modules.get("app.sandbox.client")
+        if sandbox_client is not None:
+            await sandbox_client.SANDBOX_CLIENT.cleanup()
         return "\n".join(results) if results else "No steps executed"
 
+    def reset(self) -> None:
+        """Clear memory and execution state so the agent can take a new task.
+
+        Tools and the connections they hold (browser contexts, MCP sessions)
+        are kept. Prompts are restored to their values at construction, undoing
+        stuck-state hints and other rewrites made while running.
+        """
+        self.memory = Memory(max_messages=self.memory.max_messages)
+        self.state = AgentState.IDLE
+        self.current_step = 0
+        self._stuck_steps = 0
+        for name, value in self.initial_prompts().items():
+            setattr(self, name, value)
+
+    def initial_prompts(self) -> dict:
+        """The system and next step prompts the agent was constructed with"""
+        return dict(self._initial_prompts)
+
     @abstractmethod
     async def step(self) -> str:
         """Execute a single step in the agent's workflow.
@@ -161,30 +210,51 @@ class BaseAgent(BaseModel, ABC):
         """
 
     def handle_stuck_state(self):
-        """Handle stuck state by adding a prompt to change strategy"""
-        stuck_prompt = "\
-        Observed duplicate responses. Consider new strategies and avoid repeating ineffective paths already attempted."
-        self.next_step_prompt = f"{stuck_prompt}\n{self.next_step_prompt}"
-        logger.warning(f"Agent detected stuck state. Added prompt: {stuck_prompt}")
+        """Handle stuck state by adding a prompt to change strategy, stopping the
+        run once the agent has been stuck for more than `max_stuck_steps` steps"""
+        self._stuck_steps += 1
+        if self._stuck_steps > self.max_stuck_steps:
+            logger.warning(
+                f"Agent stuck for {self._stuck_steps} consecutive steps, stopping the run"
+            )
+            self.state = AgentState.FINISHED
+            return
+
+        if not (self.next_step_prompt or "").startswith(STUCK_PROMPT):
+            self.next_step_prompt = f"{STUCK_PROMPT}\n{self.next_step_prompt}"
+        logger.warning(f"Agent detected stuck state. Added prompt: {STUCK_PROMPT}")
+
+    def _clear_stuck_state(self) -> None:
+        """Drop the change-strategy prompt once the agent is no longer stuck"""
+        self._stuck_steps = 0
+        if self.next_step_prompt:
+            self.next_step_prompt = self.next_step_prompt.removeprefix(
+                f"{STUCK_PROMPT}\n"
+            )
 
     def is_stuck(self) -> bool:
-        """Check if the agent is stuck in a loop by detecting duplicate content"""
-        if len(self.memory.messages) < 2:
-            return False
+        """Check if the agent is stuck in a loop.
+
+        The agent is stuck if its latest response (content and tool calls)
+        already occurred `duplicate_threshold` times among the `loop_window`
+        responses before it, or if its last `loop_window` responses repeat a
+        shorter pattern, such as the same two tool calls alternating. Terminate
+        calls are ignored. Both checks use the fingerprints kept by memory, so
+        their cost does not grow with the length of the history.
+        """
+        if self.memory.duplicate_count(self.loop_window) >= self.duplicate_threshold:
+            return True
 
-        last_message = self.memory.messages[-1]
-        if not last_message.content:
+        if self.loop_window < 2:
             return False
-
-        # Count identical content occurrences
-        duplicate_count = sum(
-            1
-            for msg in reversed(self.memory.messages[:-1])
-            if msg.role == "assistant" and msg.content == last_message.content
+        recent = self.memory.recent_fingerprints(self.loop_window)
+        if len(recent) < self.loop_window or None in recent:
+            return False
+        return any(
+            all(recent[i] == recent[i - period] for i in range(period, len(recent)))
+            for period in range(1, self.loop_window // 2 + 1)
         )
 
-        return duplicate_count >= self.duplicate_threshold
-
     @property
     def messages(self) -> List[Message]:
         """Retrieve a list of messages from the agent's memory."""
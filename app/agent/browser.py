@@ -7,13 +7,17 @@ from app.agent.toolcall import ToolCallAgent
 from app.logger import logger
 from app.prompt.browser import NEXT_STEP_PROMPT, SYSTEM_PROMPT
 from app.schema import Message, ToolChoice
-from app.tool import BrowserUseTool, Terminate, ToolCollection
+from app.tool import BaseTool, Terminate, ToolCollection
 
 
 # Avoid circular import if BrowserAgent needs BrowserContextHelper
 if TYPE_CHECKING:
     from app.agent.base import BaseAgent  # Or wherever memory is defined
 
+# Name of BrowserUseTool, kept here so that looking the tool up does not import
+# browser_use
+BROWSER_USE_TOOL_NAME = "browser_use"
+
 
 class BrowserContextHelper:
     def __init__(self, agent: "BaseAgent"):
@@ -21,7 +25,7 @@ class BrowserContextHelper:
         self._current_base64_image: Optional[str] = None
 
     async def get_browser_state(self) -> Optional[dict]:
-        browser_tool = self.agent.available_tools.get_tool(BrowserUseTool().name)
+        browser_tool = self.agent.available_tools.get_tool(BROWSER_USE_TOOL_NAME)
         if not browser_tool or not hasattr(browser_tool, "get_current_state"):
             logger.warning("BrowserUseTool not found or doesn't have get_current_state")
             return None
@@ -57,7 +61,14 @@ class BrowserContextHelper:
             if pixels_below > 0:
                 content_below_info = f" ({pixels_below} pixels)"
 
-            if self._current_base64_image:
+            if self._current_base64_image and getattr(
+                self.agent, "stable_prefix", False
+            ):
+                # Send the screenshot with the next step prompt only, so the
+                # history stays append-only
+                self.agent._tail_base64_image = self._current_base64_image
+                self._current_base64_image = None
+            elif self._current_base64_image:
                 image_message = Message.user_message(
                     content="Current browser screenshot:",
                     base64_image=self._current_base64_image,
@@ -74,11 +85,18 @@ class BrowserContextHelper:
         )
 
     async def cleanup_browser(self):
-        browser_tool = self.agent.available_tools.get_tool(BrowserUseTool().name)
+        browser_tool = self.agent.available_tools.get_tool(BROWSER_USE_TOOL_NAME)
         if browser_tool and hasattr(browser_tool, "cleanup"):
             await browser_tool.cleanup()
 
 
+def create_browser_use_tool() -> BaseTool:
+    """Create a BrowserUseTool, importing browser_use only when it is needed"""
+    from app.tool.browser_use_tool import BrowserUseTool
+
+    return BrowserUseTool()
+
+
 class BrowserAgent(ToolCallAgent):
     """
     A browser agent that uses the browser_use library to control a browser.
@@ -98,7 +116,7 @@ class BrowserAgent(ToolCallAgent):
 
     # Configure the available tools
     available_tools: ToolCollection = Field(
-        default_factory=lambda: ToolCollection(BrowserUseTool(), Terminate())
+        default_factory=lambda: ToolCollection(create_browser_use_tool(), Terminate())
     )
 
     # Use Auto for tool choice to allow both tool usage and free-form responses
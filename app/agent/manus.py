@@ -2,14 +2,17 @@ from typing import Dict, List, Optional
 
 from pydantic import Field, model_validator
 
-from app.agent.browser import BrowserContextHelper
+from app.agent.browser import (
+    BROWSER_USE_TOOL_NAME,
+    BrowserContextHelper,
+    create_browser_use_tool,
+)
 from app.agent.toolcall import ToolCallAgent
 from app.config import config
 from app.logger import logger
 from app.prompt.manus import NEXT_STEP_PROMPT, SYSTEM_PROMPT
 from app.tool import Terminate, ToolCollection
 from app.tool.ask_human import AskHuman
-from app.tool.browser_use_tool import BrowserUseTool
 from app.tool.mcp import MCPClients, MCPClientTool
 from app.tool.python_execute import PythonExecute
 from app.tool.str_replace_editor import StrReplaceEditor
@@ -34,7 +37,7 @@ class Manus(ToolCallAgent):
     available_tools: ToolCollection = Field(
         default_factory=lambda: ToolCollection(
             PythonExecute(),
-            BrowserUseTool(),
+            create_browser_use_tool(),
             StrReplaceEditor(),
             AskHuman(),
             Terminate(),
@@ -146,7 +149,7 @@ class Manus(ToolCallAgent):
         original_prompt = self.next_step_prompt
         recent_messages = self.memory.messages[-3:] if self.memory.messages else []
         browser_in_use = any(
-            tc.function.name == BrowserUseTool().name
+            tc.function.name == BROWSER_USE_TOOL_NAME
             for msg in recent_messages
             if msg.tool_calls
             for tc in msg.tool_calls
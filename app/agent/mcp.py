@@ -113,6 +113,10 @@ class MCPAgent(ToolCallAgent):
         # Update stored schemas
         self.tool_schemas = current_tools
 
+        # Serialized tool params must be rebuilt after any schema change
+        if added_tools or removed_tools or changed_tools:
+            self.mcp_clients.invalidate_params()
+
         # Log and notify about changes
         if added_tools:
             logger.info(f"Added MCP tools: {added_tools}")
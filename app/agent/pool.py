@@ -0,0 +1,165 @@
+import asyncio
+import copy
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from app.agent.base import BaseAgent
+from app.logger import logger
+
+
+AgentFactory = Callable[[], Union[BaseAgent, Awaitable[BaseAgent]]]
+
+# Fields holding an agent's run state or live resources (tools, MCP and browser
+# connections); copies made by `copy_factory` get fresh ones
+_INSTANCE_FIELDS = {
+    "memory",
+    "state",
+    "current_step",
+    "tool_calls",
+    "available_tools",
+    "mcp_clients",
+    "connected_servers",
+    "tool_schemas",
+    "browser_context_helper",
+}
+
+
+def copy_factory(template: BaseAgent) -> AgentFactory:
+    """
+    Factory for agents configured like `template`: same class, LLM, prompts,
+    limits and other settings, with their own memory and tools.
+
+    Prompts are taken as the template was constructed, without rewrites made
+    while it ran. Tools come from the class defaults, so an agent whose tools
+    were changed after construction (e.g. by connecting MCP servers) needs a
+    factory of its own registered with the pool instead.
+    """
+    settings = {
+        name: copy.copy(getattr(template, name))
+        for name in type(template).model_fields
+        if name not in _INSTANCE_FIELDS and name != "llm"
+    }
+    settings.update(template.initial_prompts())
+    return lambda: type(template)(llm=template.llm, **settings)
+
+
+class AgentPool:
+    """
+    Hands out agent instances by agent type, so that concurrent flows and
+    parallel plan steps each get an agent of their own.
+
+    Checked-in agents are reset (memory and step state cleared) and kept for the
+    next checkout. With `keep_warm`, their tools stay open between tasks, so
+    browser contexts and MCP sessions are reused instead of being set up again.
+    At most `max_idle` agents per type are kept; extra ones are cleaned up.
+
+    Whoever creates the pool owns it and must call `close` when done; users
+    such as PlanningFlow only check agents out and back in.
+    """
+
+    def __init__(self, max_idle: int = 4, keep_warm: bool = True):
+        self.max_idle = max_idle
+        self.keep_warm = keep_warm
+        self._factories: Dict[str, AgentFactory] = {}
+        self._idle: Dict[str, List[BaseAgent]] = {}
+        self._created: Dict[str, int] = {}
+        self._checked_out: Dict[str, int] = {}
+
+    def register(self, key: str, factory: AgentFactory, replace: bool = False) -> None:
+        """Register how to create agents of a type; a factory may be async"""
+        if key in self._factories and not replace:
+            return
+        self._factories[key] = factory
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._factories
+
+    async def _create(self, key: str) -> BaseAgent:
+        agent = self._factories[key]()
+        if asyncio.iscoroutine(agent):
+            agent = await agent
+        if hasattr(agent, "keep_warm"):
+            agent.keep_warm = self.keep_warm
+        self._created[key] = self._created.get(key, 0) + 1
+        logger.info(f"Created pooled agent '{key}' ({self._created[key]} in total)")
+        return agent
+
+    async def prewarm(self, key: str, count: int) -> None:
+        """Create agents of a type up front until `count` are idle, at most
+        `max_idle`, so the first checkouts do not wait for tool setup
+
+        Raises:
+            KeyError: If no factory is registered for the type
+        """
+        if key not in self._factories:
+            raise KeyError(f"No agent factory registered for '{key}'")
+        idle = self._idle.setdefault(key, [])
+        missing = min(count, self.max_idle) - len(idle)
+        if missing > 0:
+            idle.extend(
+                await asyncio.gather(*(self._create(key) for _ in range(missing)))
+            )
+
+    async def acquire(self, key: str) -> BaseAgent:
+        """Check out an idle agent of a type, creating one if none is idle
+
+        Raises:
+            KeyError: If no factory is registered for the type
+        """
+        if key not in self._factories:
+            raise KeyError(f"No agent factory registered for '{key}'")
+        idle = self._idle.get(key)
+        agent = idle.pop() if idle else await self._create(key)
+        self._checked_out[key] = self._checked_out.get(key, 0) + 1
+        return agent
+
+    async def release(self, key: str, agent: BaseAgent) -> None:
+        """Check an agent back in, resetting it for the next task"""
+        self._checked_out[key] = max(0, self._checked_out.get(key, 0) - 1)
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.max_idle:
+            agent.reset()
+            idle.append(agent)
+            return
+        await self._cleanup(agent)
+
+    async def discard(self, key: str, agent: BaseAgent) -> None:
+        """Check an agent back in without reusing it, e.g. after its task was
+        interrupted, cleaning up its tools"""
+        self._checked_out[key] = max(0, self._checked_out.get(key, 0) - 1)
+        await self._cleanup(agent)
+
+    @asynccontextmanager
+    async def checkout(self, key: str):
+        """Use an agent of a type for the duration of the block."""
+        agent = await self.acquire(key)
+        try:
+            yield agent
+        finally:
+            await self.release(key, agent)
+
+    @staticmethod
+    async def _cleanup(agent: BaseAgent) -> None:
+        if hasattr(agent, "cleanup"):
+            try:
+                await agent.cleanup()
+            except Exception as e:
+                logger.warning(f"Error cleaning up pooled agent '{agent.name}': {e}")
+
+    async def close(self, key: Optional[str] = None) -> None:
+        """Clean up idle agents of one type, or of all types"""
+        keys = [key] if key is not None else list(self._idle)
+        for name in keys:
+            for agent in self._idle.pop(name, []):
+                await self._cleanup(agent)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Created, idle and checked-out agents per type"""
+        return {
+            key: {
+                "created": self._created.get(key, 0),
+                "idle": len(self._idle.get(key, [])),
+                "checked_out": self._checked_out.get(key, 0),
+            }
+            for key in self._factories
+        }
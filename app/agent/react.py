@@ -5,6 +5,7 @@ from pydantic import Field
 
 from app.agent.base import BaseAgent
 from app.llm import LLM
+from app.llm_router import get_llm
 from app.schema import AgentState, Memory
 
 
@@ -15,7 +16,7 @@ class ReActAgent(BaseAgent, ABC):
     system_prompt: Optional[str] = None
     next_step_prompt: Optional[str] = None
 
-    llm: Optional[LLM] = Field(default_factory=LLM)
+    llm: Optional[LLM] = Field(default_factory=get_llm)
     memory: Memory = Field(default_factory=Memory)
     state: AgentState = AgentState.IDLE
 
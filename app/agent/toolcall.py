@@ -1,10 +1,11 @@
 import asyncio
 import json
-from typing import Any, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from pydantic import Field
 
 from app.agent.react import ReActAgent
+from app.context import ContextBuilder
 from app.exceptions import TokenLimitExceeded
 from app.logger import logger
 from app.prompt.toolcall import NEXT_STEP_PROMPT, SYSTEM_PROMPT
@@ -33,36 +34,92 @@ class ToolCallAgent(ReActAgent):
     tool_calls: List[ToolCall] = Field(default_factory=list)
     _current_base64_image: Optional[str] = None
 
+    # Tool executions started for the current step, keyed by tool call id
+    _tool_tasks: Dict[str, asyncio.Task] = {}
+    # Last sequential execution, and parallel-safe executions started after it
+    _barrier_task: Optional[asyncio.Task] = None
+    _parallel_tasks: List[asyncio.Task] = []
+    _tool_semaphore: Optional[asyncio.Semaphore] = None
+    # Set once a streamed call must wait for the complete response
+    _stream_sequential: bool = False
+
     max_steps: int = 30
     max_observe: Optional[Union[int, bool]] = None
 
+    stream_tool_calls: bool = Field(
+        default=False,
+        description="Stream tool calls and start executing each one as soon as it is complete",
+    )
+    parallel_tool_calls: bool = Field(
+        default=False,
+        description="Run consecutive calls of parallel-safe tools concurrently",
+    )
+    max_parallel_tools: int = Field(
+        default=4, description="Maximum number of tool calls running concurrently"
+    )
+    stable_prefix: bool = Field(
+        default=False,
+        description="Keep the request prefix byte-stable for provider prompt caching: "
+        "tools sorted by name, append-only history, per-step prompt only at the tail",
+    )
+
+    # Screenshot to send with the next step prompt when stable_prefix is on
+    _tail_base64_image: Optional[str] = None
+
+    keep_warm: bool = Field(
+        default=False,
+        description="Keep tool resources (browser contexts, MCP sessions) open after run; "
+        "the owner, such as an AgentPool, calls cleanup instead",
+    )
+
     async def think(self) -> bool:
         """Process current state and decide next actions using tools"""
+        tail_msgs = []
         if self.next_step_prompt:
-            user_msg = Message.user_message(self.next_step_prompt)
-            self.messages += [user_msg]
+            user_msg = Message.user_message(
+                self.next_step_prompt,
+                base64_image=self._tail_base64_image if self.stable_prefix else None,
+            )
+            if self.stable_prefix:
+                # Volatile per-step context is sent once and not kept in memory
+                tail_msgs.append(user_msg)
+            else:
+                self.memory.add_message(user_msg)
+        self._tail_base64_image = None
+
+        self._cancel_tool_tasks()
+        self._stream_sequential = False
+        stream = self.stream_tool_calls and self.tool_choices != ToolChoice.NONE
+
+        system_msgs = (
+            [Message.system_message(self.system_prompt)] if self.system_prompt else None
+        )
+        tools = self.available_tools.to_params(sort_by_name=self.stable_prefix)
 
         try:
+            # Fit older context into the per-request token budget
+            messages = ContextBuilder(self.llm).build(
+                self.messages + tail_msgs, system_msgs, tools
+            )
+
             # Get response with tool options
             response = await self.llm.ask_tool(
-                messages=self.messages,
-                system_msgs=(
-                    [Message.system_message(self.system_prompt)]
-                    if self.system_prompt
-                    else None
-                ),
-                tools=self.available_tools.to_params(),
+                messages=messages,
+                system_msgs=system_msgs,
+                tools=tools,
                 tool_choice=self.tool_choices,
+                stream=stream,
+                on_tool_call=self._on_streamed_tool_call if stream else None,
             )
         except ValueError:
             raise
         except Exception as e:
-            # Check if this is a RetryError containing TokenLimitExceeded
-            if hasattr(e, "__cause__") and isinstance(e.__cause__, TokenLimitExceeded):
-                token_limit_error = e.__cause__
-                logger.error(
-                    f"🚨 Token limit error (from RetryError): {token_limit_error}"
-                )
+            # TokenLimitExceeded is not retried, but may still arrive wrapped
+            token_limit_error = (
+                e if isinstance(e, TokenLimitExceeded) else getattr(e, "__cause__", None)
+            )
+            if isinstance(token_limit_error, TokenLimitExceeded):
+                logger.error(f"🚨 Token limit error: {token_limit_error}")
                 self.memory.add_message(
                     Message.assistant_message(
                         f"Maximum token limit reached, cannot continue execution: {str(token_limit_error)}"
@@ -75,6 +132,8 @@ class ToolCallAgent(ReActAgent):
         self.tool_calls = tool_calls = (
             response.tool_calls if response and response.tool_calls else []
         )
+        # Drop executions started for calls that are not in the final response
+        self._cancel_tool_tasks(keep={call.id for call in tool_calls})
         content = response.content if response and response.content else ""
 
         # Log response info
@@ -137,40 +196,116 @@ class ToolCallAgent(ReActAgent):
             # Return last message content if no tool calls
             return self.messages[-1].content or "No content or commands to execute"
 
-        results = []
+        # Calls not already started while streaming are scheduled now
         for command in self.tool_calls:
-            # Reset base64_image for each tool call
-            self._current_base64_image = None
+            self._schedule_tool_call(command)
 
-            result = await self.execute_tool(command)
+        results = []
+        try:
+            for command in self.tool_calls:
+                result, base64_image = await self._tool_tasks[command.id]
 
-            if self.max_observe:
-                result = result[: self.max_observe]
+                if self.max_observe:
+                    result = result[: self.max_observe]
 
-            logger.info(
-                f"🎯 Tool '{command.function.name}' completed its mission! Result: {result}"
-            )
+                logger.info(
+                    f"🎯 Tool '{command.function.name}' completed its mission! Result: {result}"
+                )
 
-            # Add tool response to memory
-            tool_msg = Message.tool_message(
-                content=result,
-                tool_call_id=command.id,
-                name=command.function.name,
-                base64_image=self._current_base64_image,
-            )
-            self.memory.add_message(tool_msg)
-            results.append(result)
+                # Add tool response to memory
+                tool_msg = Message.tool_message(
+                    content=result,
+                    tool_call_id=command.id,
+                    name=command.function.name,
+                    base64_image=base64_image,
+                )
+                self.memory.add_message(tool_msg)
+                results.append(result)
+        finally:
+            self._cancel_tool_tasks()
 
         return "\n\n".join(results)
 
+    def _on_streamed_tool_call(self, command: ToolCall) -> None:
+        """Start a call while the response is still streaming, if that is safe.
+
+        Only calls of parallel-safe tools, with no other call before them, start
+        early. A stream that fails is retried and its calls arrive again under
+        new ids, so a tool with side effects must not run until the response is
+        complete; act() schedules it and every call after it then, in order.
+        """
+        if self._stream_sequential or not self._is_parallel_safe(command):
+            self._stream_sequential = True
+            return
+        self._schedule_tool_call(command)
+
+    def _schedule_tool_call(self, command: ToolCall) -> None:
+        """Start executing a tool call once the calls it depends on have finished.
+
+        Calls of tools that are not parallel-safe wait for every call scheduled
+        before them. With `parallel_tool_calls`, calls of parallel-safe tools only
+        wait for the last sequential call and otherwise run concurrently, at most
+        `max_parallel_tools` at a time.
+        """
+        if command.id in self._tool_tasks:
+            return
+
+        parallel = self.parallel_tool_calls and self._is_parallel_safe(command)
+        wait_for = [self._barrier_task] if self._barrier_task else []
+        if not parallel:
+            wait_for += self._parallel_tasks
+        if parallel and self._tool_semaphore is None:
+            self._tool_semaphore = asyncio.Semaphore(self.max_parallel_tools)
+        semaphore = self._tool_semaphore
+
+        async def run() -> Tuple[str, Optional[str]]:
+            if wait_for:
+                await asyncio.wait(wait_for)
+            if not parallel:
+                return await self._run_tool(command)
+            async with semaphore:
+                return await self._run_tool(command)
+
+        task = asyncio.create_task(run())
+        self._tool_tasks[command.id] = task
+        if parallel:
+            self._parallel_tasks.append(task)
+        else:
+            self._barrier_task = task
+            self._parallel_tasks = []
+
+    def _is_parallel_safe(self, command: ToolCall) -> bool:
+        """Check if the tool of a call declares itself safe to run concurrently"""
+        tool = self.available_tools.get_tool(command.function.name)
+        return bool(tool and getattr(tool, "parallel_safe", False))
+
+    def _cancel_tool_tasks(self, keep: Optional[set] = None) -> None:
+        """Cancel started tool executions, except the ids in `keep`."""
+        keep = keep or set()
+        for call_id, task in list(self._tool_tasks.items()):
+            if call_id not in keep:
+                task.cancel()
+                del self._tool_tasks[call_id]
+        if not self._tool_tasks:
+            self._barrier_task = None
+            self._parallel_tasks = []
+
     async def execute_tool(self, command: ToolCall) -> str:
         """Execute a single tool call with robust error handling"""
+        observation, base64_image = await self._run_tool(command)
+        if base64_image:
+            # Store the base64_image for later use in tool_message
+            self._current_base64_image = base64_image
+        return observation
+
+    async def _run_tool(self, command: ToolCall) -> Tuple[str, Optional[str]]:
+        """Execute a tool call, returning its observation and optional base64 image"""
         if not command or not command.function or not command.function.name:
-            return "Error: Invalid command format"
+            return "Error: Invalid command format", None
 
         name = command.function.name
         if name not in self.available_tools.tool_map:
-            return f"Error: Unknown tool '{name}'"
+            return f"Error: Unknown tool '{name}'", None
 
         try:
             # Parse arguments
@@ -184,9 +319,7 @@ class ToolCallAgent(ReActAgent):
             await self._handle_special_tool(name=name, result=result)
 
             # Check if result is a ToolResult with base64_image
-            if hasattr(result, "base64_image") and result.base64_image:
-                # Store the base64_image for later use in tool_message
-                self._current_base64_image = result.base64_image
+            base64_image = getattr(result, "base64_image", None) or None
 
             # Format result for display (standard case)
             observation = (
@@ -195,17 +328,17 @@ class ToolCallAgent(ReActAgent):
                 else f"Cmd `{name}` completed with no output"
             )
 
-            return observation
+            return observation, base64_image
         except json.JSONDecodeError:
             error_msg = f"Error parsing arguments for {name}: Invalid JSON format"
             logger.error(
                 f"📝 Oops! The arguments for '{name}' don't make sense - invalid JSON, arguments:{command.function.arguments}"
             )
-            return f"Error: {error_msg}"
+            return f"Error: {error_msg}", None
         except Exception as e:
             error_msg = f"⚠️ Tool '{name}' encountered a problem: {str(e)}"
             logger.exception(error_msg)
-            return f"Error: {error_msg}"
+            return f"Error: {error_msg}", None
 
     async def _handle_special_tool(self, name: str, result: Any, **kwargs):
         """Handle special tool execution and state changes"""
@@ -229,6 +362,7 @@ class ToolCallAgent(ReActAgent):
     async def cleanup(self):
         """Clean up resources used by the agent's tools."""
         logger.info(f"🧹 Cleaning up resources for agent '{self.name}'...")
+        self._cancel_tool_tasks()
         for tool_name, tool_instance in self.available_tools.tool_map.items():
             if hasattr(tool_instance, "cleanup") and asyncio.iscoroutinefunction(
                 tool_instance.cleanup
@@ -242,9 +376,20 @@ class ToolCallAgent(ReActAgent):
                     )
         logger.info(f"✨ Cleanup complete for agent '{self.name}'.")
 
+    def reset(self) -> None:
+        """Clear memory, pending tool calls and screenshots for a new task."""
+        self._cancel_tool_tasks()
+        super().reset()
+        self.tool_calls = []
+        self._current_base64_image = None
+        self._tail_base64_image = None
+
     async def run(self, request: Optional[str] = None) -> str:
-        """Run the agent with cleanup when done."""
+        """Run the agent with cleanup when done, unless it is kept warm."""
         try:
             return await super().run(request)
         finally:
-            await self.cleanup()
+            if self.keep_warm:
+                self._cancel_tool_tasks()
+            else:
+                await self.cleanup()
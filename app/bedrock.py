@@ -1,11 +1,16 @@
+import asyncio
 import json
 import sys
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Literal, Optional
+from functools import partial
+from typing import AsyncIterator, Dict, List, Literal, Optional, Union
 
 import boto3
+from botocore.config import Config
 
 
 # Global variables to track the current tool use ID across function calls
@@ -36,11 +41,15 @@ class OpenAIResponse:
 
 # Main client class for interacting with Amazon Bedrock
 class BedrockClient:
-    def __init__(self):
-        # Initialize Bedrock client, you need to configure AWS env first
+    def __init__(self, max_workers: int = 8):
+        # Initialize Bedrock client, you need to configure AWS env first.
+        # boto3 is blocking, so calls run on a bounded pool of worker threads.
         try:
-            self.client = boto3.client("bedrock-runtime")
-            self.chat = Chat(self.client)
+            self.client = boto3.client(
+                "bedrock-runtime",
+                config=Config(max_pool_connections=max_workers),
+            )
+            self.chat = Chat(self.client, max_workers)
         except Exception as e:
             print(f"Error initializing Bedrock client: {e}")
             sys.exit(1)
@@ -48,14 +57,20 @@ class BedrockClient:
 
 # Chat interface class
 class Chat:
-    def __init__(self, client):
-        self.completions = ChatCompletions(client)
+    def __init__(self, client, max_workers: int = 8):
+        self.completions = ChatCompletions(client, max_workers)
 
 
 # Core class handling chat completions functionality
 class ChatCompletions:
-    def __init__(self, client):
+    TOOLS_CACHE_SIZE = 32
+
+    def __init__(self, client, max_workers: int = 8):
         self.client = client
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bedrock"
+        )
+        self._tools_cache: Dict[int, tuple] = {}
 
     def _convert_openai_tools_to_bedrock_format(self, tools):
         # Convert OpenAI function calling format to Bedrock tool format
@@ -192,31 +207,138 @@ class ChatCompletions:
         }
         return OpenAIResponse(openai_format)
 
-    async def _invoke_bedrock(
+    def _converse_kwargs(
         self,
         model: str,
         messages: List[Dict[str, str]],
         max_tokens: int,
         temperature: float,
         tools: Optional[List[dict]] = None,
-        tool_choice: Literal["none", "auto", "required"] = "auto",
-        **kwargs,
-    ) -> OpenAIResponse:
-        # Non-streaming invocation of Bedrock model
+    ) -> dict:
+        # Build the arguments shared by converse and converse_stream
         (
             system_prompt,
             bedrock_messages,
         ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
+        kwargs = {
+            "modelId": model,
+            "system": system_prompt,
+            "messages": bedrock_messages,
+            "inferenceConfig": {"temperature": temperature, "maxTokens": max_tokens},
+        }
+        if tools:
+            kwargs["toolConfig"] = {"tools": tools}
+        return kwargs
+
+    async def _invoke_bedrock(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        tools: Optional[List[dict]] = None,
+        tool_choice: Literal["none", "auto", "required"] = "auto",
+        **kwargs,
+    ) -> OpenAIResponse:
+        # Non-streaming invocation of Bedrock model, run on the worker pool so the
+        # event loop is not blocked for the round trip
+        converse_kwargs = self._converse_kwargs(
+            model, messages, max_tokens, temperature, tools
+        )
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            self._executor, partial(self.client.converse, **converse_kwargs)
         )
         openai_response = self._convert_bedrock_response_to_openai_format(response)
         return openai_response
 
+    @staticmethod
+    def _stream_chunk(
+        content: Optional[str] = None,
+        tool_call: Optional[dict] = None,
+        finish_reason: Optional[str] = None,
+        usage: Optional[dict] = None,
+    ) -> OpenAIResponse:
+        # Build an OpenAI-style chat.completion.chunk
+        choices = []
+        if content is not None or tool_call is not None or finish_reason is not None:
+            choices.append(
+                {
+                    "index": 0,
+                    "delta": {
+                        "role": "assistant",
+                        "content": content,
+                        "tool_calls": [tool_call] if tool_call else None,
+                    },
+                    "finish_reason": finish_reason,
+                }
+            )
+        return OpenAIResponse(
+            {
+                "id": f"chatcmpl-{uuid.uuid4()}",
+                "created": int(time.time()),
+                "object": "chat.completion.chunk",
+                "choices": choices,
+                "usage": OpenAIResponse(usage) if usage else None,
+            }
+        )
+
+    def _convert_bedrock_event_to_chunk(
+        self, event: dict, tool_indexes: Dict[int, int]
+    ) -> Optional[OpenAIResponse]:
+        # Convert one converse_stream event to an OpenAI-style chunk, if it has one
+        if "contentBlockStart" in event:
+            block = event["contentBlockStart"]
+            tool_use = block.get("start", {}).get("toolUse")
+            if not tool_use:
+                return None
+            global CURRENT_TOOLUSE_ID
+            CURRENT_TOOLUSE_ID = tool_use["toolUseId"]
+            index = tool_indexes.setdefault(
+                block.get("contentBlockIndex", 0), len(tool_indexes)
+            )
+            return self._stream_chunk(
+                tool_call={
+                    "index": index,
+                    "id": tool_use["toolUseId"],
+                    "type": "function",
+                    "function": {"name": tool_use["name"], "arguments": ""},
+                }
+            )
+        if "contentBlockDelta" in event:
+            block = event["contentBlockDelta"]
+            delta = block.get("delta", {})
+            if "text" in delta:
+                return self._stream_chunk(content=delta["text"])
+            if "toolUse" in delta:
+                index = tool_indexes.get(block.get("contentBlockIndex", 0), 0)
+                return self._stream_chunk(
+                    tool_call={
+                        "index": index,
+                        "id": None,
+                        "type": "function",
+                        "function": {
+                            "name": None,
+                            "arguments": delta["toolUse"].get("input", ""),
+                        },
+                    }
+                )
+            return None
+        if "messageStop" in event:
+            return self._stream_chunk(
+                finish_reason=event["messageStop"].get("stopReason", "end_turn")
+            )
+        if "metadata" in event:
+            usage = event["metadata"].get("usage", {})
+            return self._stream_chunk(
+                usage={
+                    "completion_tokens": usage.get("outputTokens", 0),
+                    "prompt_tokens": usage.get("inputTokens", 0),
+                    "total_tokens": usage.get("totalTokens", 0),
+                }
+            )
+        return None
+
     async def _invoke_bedrock_stream(
         self,
         model: str,
@@ -226,78 +348,66 @@ class ChatCompletions:
         tools: Optional[List[dict]] = None,
         tool_choice: Literal["none", "auto", "required"] = "auto",
         **kwargs,
-    ) -> OpenAIResponse:
-        # Streaming invocation of Bedrock model
-        (
-            system_prompt,
-            bedrock_messages,
-        ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse_stream(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
+    ) -> AsyncIterator[OpenAIResponse]:
+        # Streaming invocation of Bedrock model. The blocking event stream is read
+        # on the worker pool and handed to the event loop through a queue.
+        converse_kwargs = self._converse_kwargs(
+            model, messages, max_tokens, temperature, tools
         )
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+        done = object()
 
-        # Initialize response structure
-        bedrock_response = {
-            "output": {"message": {"role": "", "content": []}},
-            "stopReason": "",
-            "usage": {},
-            "metrics": {},
-        }
-        bedrock_response_text = ""
-        bedrock_response_tool_input = ""
+        def read_stream() -> None:
+            try:
+                response = self.client.converse_stream(**converse_kwargs)
+                stream = response.get("stream")
+                try:
+                    for event in stream or []:
+                        if stopped.is_set():
+                            break
+                        loop.call_soon_threadsafe(queue.put_nowait, event)
+                finally:
+                    if stream is not None:
+                        stream.close()
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
 
-        # Process streaming response
-        stream = response.get("stream")
-        if stream:
-            for event in stream:
-                if event.get("messageStart", {}).get("role"):
-                    bedrock_response["output"]["message"]["role"] = event[
-                        "messageStart"
-                    ]["role"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("text"):
-                    bedrock_response_text += event["contentBlockDelta"]["delta"]["text"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["text"], end="", flush=True
-                    )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 0:
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"text": bedrock_response_text}
-                    )
-                if event.get("contentBlockStart", {}).get("start", {}).get("toolUse"):
-                    bedrock_tool_use = event["contentBlockStart"]["start"]["toolUse"]
-                    tool_use = {
-                        "toolUseId": bedrock_tool_use["toolUseId"],
-                        "name": bedrock_tool_use["name"],
-                    }
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"toolUse": tool_use}
-                    )
-                    global CURRENT_TOOLUSE_ID
-                    CURRENT_TOOLUSE_ID = bedrock_tool_use["toolUseId"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("toolUse"):
-                    bedrock_response_tool_input += event["contentBlockDelta"]["delta"][
-                        "toolUse"
-                    ]["input"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["toolUse"]["input"],
-                        end="",
-                        flush=True,
-                    )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 1:
-                    bedrock_response["output"]["message"]["content"][1]["toolUse"][
-                        "input"
-                    ] = json.loads(bedrock_response_tool_input)
-        print()
-        openai_response = self._convert_bedrock_response_to_openai_format(
-            bedrock_response
-        )
-        return openai_response
+        loop.run_in_executor(self._executor, read_stream)
+        tool_indexes: Dict[int, int] = {}
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                chunk = self._convert_bedrock_event_to_chunk(item, tool_indexes)
+                if chunk is not None:
+                    yield chunk
+        finally:
+            # Let the reader thread stop at the next event if we exit early
+            stopped.set()
 
-    def create(
+    def _get_bedrock_tools(self, tools: Optional[List[dict]]) -> List[dict]:
+        # Tool lists are usually reused across calls (ToolCollection memoizes
+        # them), so conversions are cached by list identity. The cache keeps a
+        # reference to each list so an id is not reused while cached.
+        if not tools:
+            return []
+        cached = self._tools_cache.get(id(tools))
+        if cached is not None and cached[0] is tools:
+            return cached[1]
+
+        bedrock_tools = self._convert_openai_tools_to_bedrock_format(tools)
+        if len(self._tools_cache) >= self.TOOLS_CACHE_SIZE:
+            self._tools_cache.pop(next(iter(self._tools_cache)))
+        self._tools_cache[id(tools)] = (tools, bedrock_tools)
+        return bedrock_tools
+
+    async def create(
         self,
         model: str,
         messages: List[Dict[str, str]],
@@ -307,11 +417,10 @@ class ChatCompletions:
         tools: Optional[List[dict]] = None,
         tool_choice: Literal["none", "auto", "required"] = "auto",
         **kwargs,
-    ) -> OpenAIResponse:
-        # Main entry point for chat completion
-        bedrock_tools = []
-        if tools is not None:
-            bedrock_tools = self._convert_openai_tools_to_bedrock_format(tools)
+    ) -> Union[OpenAIResponse, AsyncIterator[OpenAIResponse]]:
+        # Main entry point for chat completion. Like the OpenAI client, a streaming
+        # call returns an async iterator of chunks.
+        bedrock_tools = self._get_bedrock_tools(tools)
         if stream:
             return self._invoke_bedrock_stream(
                 model,
@@ -323,7 +432,7 @@ class ChatCompletions:
                 **kwargs,
             )
         else:
-            return self._invoke_bedrock(
+            return await self._invoke_bedrock(
                 model,
                 messages,
                 max_tokens,
@@ -0,0 +1,184 @@
+"""Content-addressed store for large message payloads such as screenshots."""
+import atexit
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from app.config import config
+from app.image import base64_image_dimensions
+from app.logger import logger
+
+
+class BlobStore:
+    """
+    Stores base64 payloads once, keyed by their SHA-256 digest.
+
+    Payloads stay in memory up to `max_memory_bytes`; beyond that the least
+    recently used ones are spilled to a per-process directory under `spill_dir`,
+    or kept in memory if no spill directory is set. Spilled payloads are only
+    readable by the process that wrote them, so the directory is removed at exit
+    and directories left by processes that no longer run are removed at startup.
+    Storing the same payload twice returns the same reference. Image
+    dimensions are read from a payload's header once and kept with it.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 64 * 2**20,
+        spill_dir: Optional[Path] = None,
+        max_derived: int = 1024,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_derived = max_derived
+        self.spill_dir = None
+        if spill_dir:
+            self._remove_stale_spill_dirs(Path(spill_dir))
+            self.spill_dir = Path(spill_dir) / str(os.getpid())
+            atexit.register(shutil.rmtree, self.spill_dir, ignore_errors=True)
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled: Set[str] = set()
+        self._derived: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._dimensions: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _remove_stale_spill_dirs(root: Path) -> None:
+        """Remove spill directories of processes that are no longer running"""
+        if not root.is_dir():
+            return
+        for path in root.iterdir():
+            if not path.is_dir() or not path.name.isdigit():
+                # Blobs spilled directly into the root by earlier versions
+                if path.is_file():
+                    path.unlink(missing_ok=True)
+                continue
+            pid = int(path.name)
+            if pid != os.getpid() and not _process_exists(pid):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def put(self, data: str, dimensions: Optional[Tuple[int, int]] = None) -> str:
+        """Store a payload and return its reference
+
+        Pass the (width, height) of an image if known, so that it is not read
+        from the payload later.
+        """
+        ref = hashlib.sha256(data.encode("ascii")).hexdigest()
+        with self._lock:
+            if dimensions is not None:
+                self._dimensions[ref] = tuple(dimensions)
+            if ref in self._memory:
+                self._memory.move_to_end(ref)
+            elif ref not in self._spilled:
+                self._memory[ref] = data
+                self._memory_bytes += len(data)
+                self._spill()
+        return ref
+
+    def get(self, ref: str) -> str:
+        """Get a payload by reference
+
+        Raises:
+            KeyError: If the reference is unknown
+        """
+        with self._lock:
+            data = self._memory.get(ref)
+            if data is not None:
+                self._memory.move_to_end(ref)
+                return data
+            spilled = ref in self._spilled
+        if not spilled:
+            raise KeyError(ref)
+        return (self.spill_dir / ref).read_text(encoding="ascii")
+
+    def dimensions(self, ref: str) -> Optional[Tuple[int, int]]:
+        """(width, height) of a stored image, read from its header on first use
+
+        Returns None if the payload is not an image in a known format.
+
+        Raises:
+            KeyError: If the reference is unknown
+        """
+        with self._lock:
+            if ref in self._dimensions:
+                return self._dimensions[ref]
+        dimensions = base64_image_dimensions(self.get(ref))
+        with self._lock:
+            self._dimensions[ref] = dimensions
+        return dimensions
+
+    def get_derived(self, ref: str, name: str, derive: Callable[[str], str]) -> str:
+        """
+        Get a payload derived from a stored one, e.g. a resized image.
+
+        The derived payload is computed once per (ref, name) and stored like any
+        other payload.
+        """
+        return self.get(self.derive(ref, name, derive))
+
+    def derive(self, ref: str, name: str, derive: Callable[[str], str]) -> str:
+        """Like `get_derived`, but return the reference of the derived payload"""
+        key = (ref, name)
+        with self._lock:
+            derived_ref = self._derived.get(key)
+            if derived_ref is not None:
+                self._derived.move_to_end(key)
+        if derived_ref is not None and derived_ref in self:
+            return derived_ref
+
+        derived_ref = self.put(derive(self.get(ref)))
+        with self._lock:
+            self._derived[key] = derived_ref
+            self._derived.move_to_end(key)
+            while len(self._derived) > self.max_derived:
+                self._derived.popitem(last=False)
+        return derived_ref
+
+    def __contains__(self, ref: str) -> bool:
+        return ref in self._memory or ref in self._spilled
+
+    def _spill(self) -> None:
+        if self.spill_dir is None:
+            return
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            ref, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            try:
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                (self.spill_dir / ref).write_text(data, encoding="ascii")
+            except OSError as e:
+                logger.warning(f"Failed to spill blob to disk, keeping it in memory: {e}")
+                self._memory[ref] = data
+                self._memory.move_to_end(ref, last=False)
+                self._memory_bytes += len(data)
+                return
+            self._spilled.add(ref)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number and size of stored payloads"""
+        return {
+            "memory_blobs": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "spilled_blobs": len(self._spilled),
+            "derived_refs": len(self._derived),
+        }
+
+
+def _process_exists(pid: int) -> bool:
+    if os.name == "nt":
+        # Signal 0 does not probe a process on Windows; leave its directory alone
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+blob_store = BlobStore(spill_dir=config.workspace_root / ".cache" / "blobs")
@@ -25,9 +25,111 @@ class LLMSettings(BaseModel):
         None,
         description="Maximum input tokens to use across all requests (None for unlimited)",
     )
+    max_context_tokens: Optional[int] = Field(
+        None,
+        description="Input tokens per request; older agent context is compacted to fit (None to disable)",
+    )
+    max_images: Optional[int] = Field(
+        None,
+        description="Most recent message images sent per request (None for all)",
+    )
+    image_detail: Optional[str] = Field(
+        None,
+        description="Image detail level (low or high); images are downscaled to match",
+    )
     temperature: float = Field(1.0, description="Sampling temperature")
     api_type: str = Field(..., description="Azure, Openai, or Ollama")
     api_version: str = Field(..., description="Azure Openai version if AzureOpenai")
+    http2: bool = Field(
+        False, description="Use HTTP/2 for API connections (requires the h2 package)"
+    )
+    max_connections: int = Field(
+        100, description="Maximum number of concurrent connections in the shared pool"
+    )
+    max_keepalive_connections: int = Field(
+        20, description="Maximum number of idle keep-alive connections kept open"
+    )
+    keepalive_expiry: float = Field(
+        30.0, description="Seconds an idle keep-alive connection is kept open"
+    )
+    requests_per_minute: Optional[int] = Field(
+        None, description="Client-side request budget per minute (None for unlimited)"
+    )
+    tokens_per_minute: Optional[int] = Field(
+        None, description="Client-side token budget per minute (None for unlimited)"
+    )
+    max_concurrent_requests: Optional[int] = Field(
+        None, description="Maximum number of in-flight requests (None for unlimited)"
+    )
+    cache_enabled: bool = Field(
+        False, description="Cache completions of identical requests on disk"
+    )
+    cache_path: Optional[str] = Field(
+        None, description="Response cache file (defaults to a file in the workspace)"
+    )
+    cache_ttl: Optional[int] = Field(
+        86400, description="Seconds a cached response stays valid (None for no expiry)"
+    )
+    cache_max_entries: int = Field(
+        10000, description="Maximum cached responses before LRU eviction"
+    )
+    retry_max_attempts: int = Field(
+        6, description="Maximum attempts per request for transient API errors"
+    )
+    retry_deadline: Optional[float] = Field(
+        300.0,
+        description="Seconds a request may spend across all retry attempts (None for no limit)",
+    )
+    batch_concurrency: int = Field(
+        8, description="Requests ask_batch keeps in flight at once"
+    )
+    batch_completion_window: str = Field(
+        "24h", description="Completion window requested for Batch API jobs"
+    )
+    batch_poll_interval: float = Field(
+        10.0, description="Seconds between Batch API job status checks"
+    )
+    transcript_path: Optional[str] = Field(
+        None, description="File to record LLM exchanges to as JSONL for offline replay"
+    )
+
+
+class LLMRouterSettings(BaseModel):
+    endpoints: List[str] = Field(
+        ..., description="Names of the [llm.*] configurations to route between"
+    )
+    strategy: str = Field(
+        "ordered", description="Endpoint selection: ordered, weighted, or fastest"
+    )
+    weights: Optional[List[float]] = Field(
+        None, description="Relative endpoint weights for the weighted strategy"
+    )
+    hedge: bool = Field(
+        False,
+        description="Send a duplicate request to the next endpoint when the first is slow",
+    )
+    hedge_quantile: float = Field(
+        0.95, description="Latency quantile of an endpoint after which to hedge"
+    )
+    hedge_min_samples: int = Field(
+        20, description="Latency samples an endpoint needs before hedging against it"
+    )
+    hedge_delay: Optional[float] = Field(
+        None,
+        description="Seconds after which to hedge against an endpoint that does not "
+        "have hedge_min_samples latency samples yet",
+    )
+    use_for_agents: bool = Field(
+        False,
+        description="Serve agents and flows that have no [llm.<name>] configuration "
+        "of their own through the router",
+    )
+    ewma_alpha: float = Field(
+        0.2, description="Smoothing factor of the latency and error moving averages"
+    )
+    failure_cooldown: float = Field(
+        30.0, description="Seconds a failed endpoint is tried only as a last resort"
+    )
 
 
 class ProxySettings(BaseModel):
@@ -66,6 +168,25 @@ class RunflowSettings(BaseModel):
     )
 
 
+class MetricsSettings(BaseModel):
+    ring_buffer_size: int = Field(
+        1000, description="Number of recent LLM call records kept in memory"
+    )
+    jsonl_path: Optional[str] = Field(
+        None, description="File to append LLM call records to as JSON lines"
+    )
+
+
+class CheckpointSettings(BaseModel):
+    enabled: bool = Field(
+        False, description="Record plan state, step results and agent memory after each plan step"
+    )
+    path: Optional[str] = Field(
+        None,
+        description="SQLite checkpoint database; defaults to workspace/.cache/checkpoints.sqlite",
+    )
+
+
 class BrowserSettings(BaseModel):
     headless: bool = Field(False, description="Whether to run browser in headless mode")
     disable_security: bool = Field(
@@ -167,6 +288,15 @@ class AppConfig(BaseModel):
     run_flow_config: Optional[RunflowSettings] = Field(
         None, description="Run flow configuration"
     )
+    llm_router: Optional[LLMRouterSettings] = Field(
+        None, description="Multi-endpoint LLM router configuration"
+    )
+    metrics_config: Optional[MetricsSettings] = Field(
+        None, description="LLM telemetry configuration"
+    )
+    checkpoint_config: Optional[CheckpointSettings] = Field(
+        None, description="Plan checkpoint configuration"
+    )
 
     class Config:
         arbitrary_types_allowed = True
@@ -221,9 +351,29 @@ class Config:
             "api_key": base_llm.get("api_key"),
             "max_tokens": base_llm.get("max_tokens", 4096),
             "max_input_tokens": base_llm.get("max_input_tokens"),
+            "max_context_tokens": base_llm.get("max_context_tokens"),
+            "max_images": base_llm.get("max_images"),
+            "image_detail": base_llm.get("image_detail"),
             "temperature": base_llm.get("temperature", 1.0),
             "api_type": base_llm.get("api_type", ""),
             "api_version": base_llm.get("api_version", ""),
+            "http2": base_llm.get("http2", False),
+            "max_connections": base_llm.get("max_connections", 100),
+            "max_keepalive_connections": base_llm.get("max_keepalive_connections", 20),
+            "keepalive_expiry": base_llm.get("keepalive_expiry", 30.0),
+            "requests_per_minute": base_llm.get("requests_per_minute"),
+            "tokens_per_minute": base_llm.get("tokens_per_minute"),
+            "max_concurrent_requests": base_llm.get("max_concurrent_requests"),
+            "cache_enabled": base_llm.get("cache_enabled", False),
+            "cache_path": base_llm.get("cache_path"),
+            "cache_ttl": base_llm.get("cache_ttl", 86400),
+            "cache_max_entries": base_llm.get("cache_max_entries", 10000),
+            "retry_max_attempts": base_llm.get("retry_max_attempts", 6),
+            "retry_deadline": base_llm.get("retry_deadline", 300.0),
+            "batch_concurrency": base_llm.get("batch_concurrency", 8),
+            "batch_completion_window": base_llm.get("batch_completion_window", "24h"),
+            "batch_poll_interval": base_llm.get("batch_poll_interval", 10.0),
+            "transcript_path": base_llm.get("transcript_path"),
         }
 
         # handle browser config.
@@ -283,6 +433,23 @@ class Config:
             run_flow_settings = RunflowSettings(**run_flow_config)
         else:
             run_flow_settings = RunflowSettings()
+
+        llm_router_config = raw_config.get("llm_router")
+        llm_router_settings = (
+            LLMRouterSettings(**llm_router_config) if llm_router_config else None
+        )
+
+        metrics_config = raw_config.get("metrics")
+        if metrics_config:
+            metrics_settings = MetricsSettings(**metrics_config)
+        else:
+            metrics_settings = MetricsSettings()
+
+        checkpoint_config = raw_config.get("checkpoint")
+        if checkpoint_config:
+            checkpoint_settings = CheckpointSettings(**checkpoint_config)
+        else:
+            checkpoint_settings = CheckpointSettings()
         config_dict = {
             "llm": {
                 "default": default_settings,
@@ -296,6 +463,9 @@ class Config:
             "search_config": search_settings,
             "mcp_config": mcp_settings,
             "run_flow_config": run_flow_settings,
+            "llm_router": llm_router_settings,
+            "metrics_config": metrics_settings,
+            "checkpoint_config": checkpoint_settings,
         }
 
         self._config = AppConfig(**config_dict)
@@ -326,6 +496,21 @@ class Config:
         """Get the Run Flow configuration"""
         return self._config.run_flow_config
 
+    @property
+    def llm_router(self) -> Optional[LLMRouterSettings]:
+        """Get the LLM router configuration"""
+        return self._config.llm_router
+
+    @property
+    def metrics_config(self) -> MetricsSettings:
+        """Get the LLM telemetry configuration"""
+        return self._config.metrics_config
+
+    @property
+    def checkpoint_config(self) -> CheckpointSettings:
+        """Get the plan checkpoint configuration"""
+        return self._config.checkpoint_config
+
     @property
     def workspace_root(self) -> Path:
         """Get the workspace root directory"""
@@ -0,0 +1,135 @@
+"""Token-budget-aware selection of agent memory for LLM requests."""
+from typing import List, Optional
+
+from app.llm import LLM, MULTIMODAL_MODELS, TokenCounter
+from app.logger import logger
+from app.schema import Message, Role
+
+
+def group_messages(messages: List[Message]) -> List[List[Message]]:
+    """
+    Split messages into groups that must be kept or dropped together.
+
+    An assistant message with tool calls forms one group with the tool results
+    that follow it; every other message is a group of its own.
+    """
+    groups: List[List[Message]] = []
+    for message in messages:
+        if (
+            message.role == Role.TOOL
+            and groups
+            and groups[-1][0].role == Role.ASSISTANT
+            and groups[-1][0].tool_calls
+        ):
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+class ContextBuilder:
+    """
+    Builds the message list for a request so that it fits a token budget.
+
+    System messages, the first user message (the task) and the latest turn (from
+    the last assistant message onwards) are always kept. Older messages are
+    compacted first: long contents are truncated and images are dropped. If that
+    is not enough, the oldest groups are dropped, keeping tool calls together
+    with their results. Memory itself is never modified.
+    """
+
+    def __init__(
+        self, llm: LLM, budget: Optional[int] = None, max_old_chars: int = 2000
+    ):
+        self.llm = llm
+        self.budget = budget if budget is not None else llm.max_context_tokens
+        self.max_old_chars = max_old_chars
+        self.supports_images = llm.model in MULTIMODAL_MODELS
+
+    def _count(self, messages: List[Message]) -> int:
+        return sum(self.llm.count_message(msg, self.supports_images) for msg in messages)
+
+    def _compact(self, message: Message) -> Message:
+        """Return a copy of the message with a truncated content and no image"""
+        content = message.content
+        if content and len(content) > self.max_old_chars:
+            omitted = len(content) - self.max_old_chars
+            content = f"{content[: self.max_old_chars]}\n... [{omitted} characters omitted]"
+        if message.has_image:
+            content = f"{content or ''}\n[image omitted]".lstrip("\n")
+
+        if content == message.content and not message.has_image:
+            return message
+        return Message(
+            **{
+                **dict(message),
+                "content": content,
+                "base64_image": None,
+                "image_ref": None,
+            }
+        )
+
+    def build(
+        self,
+        messages: List[Message],
+        system_msgs: Optional[List[Message]] = None,
+        tools: Optional[List[dict]] = None,
+    ) -> List[Message]:
+        """
+        Select and compact messages to fit the budget.
+
+        Args:
+            messages: The agent's memory, oldest first
+            system_msgs: System messages that will be sent with the request
+            tools: Tool definitions that will be sent with the request
+
+        Returns:
+            List[Message]: The messages to send, possibly compacted copies
+        """
+        if not self.budget:
+            return messages
+
+        reserved = TokenCounter.FORMAT_TOKENS + self._count(system_msgs or [])
+        if tools:
+            reserved += self.llm.count_tools_tokens(tools)
+        if reserved + self._count(messages) <= self.budget:
+            return messages
+
+        groups = group_messages(messages)
+        latest = max(
+            (i for i, group in enumerate(groups) if group[0].role == Role.ASSISTANT),
+            default=len(groups) - 1,
+        )
+        first_user = next(
+            (i for i, group in enumerate(groups) if group[0].role == Role.USER), None
+        )
+        protected = {
+            i
+            for i, group in enumerate(groups)
+            if i >= latest or i == first_user or group[0].role == Role.SYSTEM
+        }
+
+        # Compact every older group, then drop the oldest until the request fits
+        groups = [
+            group if i in protected else [self._compact(msg) for msg in group]
+            for i, group in enumerate(groups)
+        ]
+        tokens = reserved + sum(self._count(group) for group in groups)
+        dropped = 0
+        for i, group in enumerate(groups):
+            if tokens <= self.budget:
+                break
+            if i in protected:
+                continue
+            tokens -= self._count(group)
+            groups[i] = []
+            dropped += len(group)
+
+        if tokens > self.budget:
+            logger.warning(
+                f"Context still exceeds the budget after compaction ({tokens} > {self.budget} tokens)"
+            )
+        logger.info(
+            f"Compacted context to {tokens} tokens, dropped {dropped} older messages"
+        )
+        return [msg for group in groups for msg in group]
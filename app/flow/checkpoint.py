@@ -0,0 +1,235 @@
+"""Durable checkpoints of planning flow runs, for resuming after a crash or timeout."""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.config import config
+from app.logger import logger
+from app.schema import Memory, Message
+
+
+class StepCheckpoint(BaseModel):
+    """Result of a completed plan step and the memory of the agent that ran it"""
+
+    step_index: int
+    result: str
+    agent_key: Optional[str] = None
+    memory: List[dict] = Field(default_factory=list)
+    completed_at: float
+
+
+class PlanCheckpoint(BaseModel):
+    """Last recorded state of a plan and the steps completed so far"""
+
+    plan_id: str
+    request: Optional[str] = None
+    plan: Dict[str, Any]
+    steps: Dict[int, StepCheckpoint] = Field(default_factory=dict)
+    updated_at: float
+
+
+def dump_memory(memory: Memory) -> List[dict]:
+    """Serialize memory messages without their images
+
+    Images are left out: they would make every checkpoint as large as all
+    screenshots taken so far, and blob store references do not outlive the
+    process. A resumed agent takes new screenshots as it needs them.
+    """
+    return [
+        message.model_dump(exclude_none=True, exclude={"base64_image", "image_ref"})
+        for message in memory.messages
+    ]
+
+
+def load_memory(messages: List[dict], max_messages: int) -> Memory:
+    return Memory(
+        messages=[Message(**message) for message in messages],
+        max_messages=max_messages,
+    )
+
+
+class CheckpointStore:
+    """A SQLite store of plan state, step results and agent memory.
+
+    The plan is rewritten and one row is added per completed step. Only the
+    latest memory of each agent is needed to resume, so recording a step clears
+    the memory kept with earlier steps of the same agent. Writes are committed
+    before the flow moves on, so a crash loses at most the steps that were still
+    running. Checkpoints of finished plans are deleted by the flow.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                "plan_id TEXT PRIMARY KEY, request TEXT, plan TEXT NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS steps ("
+                "plan_id TEXT NOT NULL, step_index INTEGER NOT NULL, "
+                "result TEXT NOT NULL, agent_key TEXT, memory TEXT NOT NULL, "
+                "completed_at REAL NOT NULL, PRIMARY KEY (plan_id, step_index))"
+            )
+
+    def _save_plan(
+        self, plan_id: str, plan: Dict[str, Any], request: Optional[str]
+    ) -> None:
+        # COALESCE keeps the original request when a later save does not pass it
+        self._conn.execute(
+            "INSERT INTO plans (plan_id, request, plan, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (plan_id) DO UPDATE SET "
+            "request = COALESCE(excluded.request, plans.request), "
+            "plan = excluded.plan, updated_at = excluded.updated_at",
+            (plan_id, request, json.dumps(plan, ensure_ascii=False), time.time()),
+        )
+
+    def _record_plan(
+        self, plan_id: str, plan: Dict[str, Any], request: Optional[str]
+    ) -> None:
+        with self._lock, self._conn:
+            self._save_plan(plan_id, plan, request)
+
+    def _record_step(
+        self, plan_id: str, plan: Dict[str, Any], step: StepCheckpoint
+    ) -> None:
+        with self._lock, self._conn:
+            self._save_plan(plan_id, plan, None)
+            if step.agent_key is not None:
+                self._conn.execute(
+                    "UPDATE steps SET memory = '[]' WHERE plan_id = ? AND agent_key = ?",
+                    (plan_id, step.agent_key),
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO steps "
+                "(plan_id, step_index, result, agent_key, memory, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    plan_id,
+                    step.step_index,
+                    step.result,
+                    step.agent_key,
+                    json.dumps(step.memory, ensure_ascii=False),
+                    step.completed_at,
+                ),
+            )
+
+    def _load(self, plan_id: str) -> Optional[PlanCheckpoint]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT request, plan, updated_at FROM plans WHERE plan_id = ?",
+                (plan_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            step_rows = self._conn.execute(
+                "SELECT step_index, result, agent_key, memory, completed_at "
+                "FROM steps WHERE plan_id = ? ORDER BY completed_at",
+                (plan_id,),
+            ).fetchall()
+
+        request, plan, updated_at = row
+        steps = {
+            step_index: StepCheckpoint(
+                step_index=step_index,
+                result=result,
+                agent_key=agent_key,
+                memory=json.loads(memory),
+                completed_at=completed_at,
+            )
+            for step_index, result, agent_key, memory, completed_at in step_rows
+        }
+        return PlanCheckpoint(
+            plan_id=plan_id,
+            request=request,
+            plan=json.loads(plan),
+            steps=steps,
+            updated_at=updated_at,
+        )
+
+    async def record_plan(
+        self, plan_id: str, plan: Dict[str, Any], request: Optional[str] = None
+    ) -> None:
+        """Record the current state of a plan"""
+        try:
+            await asyncio.to_thread(self._record_plan, plan_id, plan, request)
+        except sqlite3.Error as e:
+            logger.warning(f"Checkpoint write failed for plan {plan_id}: {e}")
+
+    async def record_step(
+        self, plan_id: str, plan: Dict[str, Any], step: StepCheckpoint
+    ) -> None:
+        """Record a completed step together with the plan state after it"""
+        try:
+            await asyncio.to_thread(self._record_step, plan_id, plan, step)
+        except sqlite3.Error as e:
+            logger.warning(
+                f"Checkpoint write failed for step {step.step_index} of plan {plan_id}: {e}"
+            )
+
+    async def load(self, plan_id: str) -> Optional[PlanCheckpoint]:
+        """Get the last checkpoint of a plan, or None if there is none"""
+        try:
+            return await asyncio.to_thread(self._load, plan_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Checkpoint read failed for plan {plan_id}: {e}")
+            return None
+
+    def list_plans(self) -> List[Dict[str, Any]]:
+        """Checkpointed plans, most recently updated first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.plan_id, p.request, p.updated_at, COUNT(s.step_index) "
+                "FROM plans p LEFT JOIN steps s ON s.plan_id = p.plan_id "
+                "GROUP BY p.plan_id ORDER BY p.updated_at DESC"
+            ).fetchall()
+        return [
+            {
+                "plan_id": plan_id,
+                "request": request,
+                "updated_at": updated_at,
+                "completed_steps": completed_steps,
+            }
+            for plan_id, request, updated_at, completed_steps in rows
+        ]
+
+    def _delete(self, plan_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM steps WHERE plan_id = ?", (plan_id,))
+            self._conn.execute("DELETE FROM plans WHERE plan_id = ?", (plan_id,))
+
+    async def delete(self, plan_id: str) -> None:
+        """Remove the checkpoint of a plan"""
+        try:
+            await asyncio.to_thread(self._delete, plan_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Checkpoint delete failed for plan {plan_id}: {e}")
+
+
+_checkpoint_stores: Dict[Path, CheckpointStore] = {}
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """Get the configured checkpoint store, or None if checkpointing is off."""
+    settings = config.checkpoint_config
+    if not settings.enabled:
+        return None
+
+    path = (
+        Path(settings.path)
+        if settings.path
+        else config.workspace_root / ".cache" / "checkpoints.sqlite"
+    )
+    if path not in _checkpoint_stores:
+        _checkpoint_stores[path] = CheckpointStore(path)
+    return _checkpoint_stores[path]
@@ -1,16 +1,28 @@
+import asyncio
 import json
 import time
 from enum import Enum
-from typing import Dict, List, Optional, Union
+from typing import Collection, Dict, List, Optional, Tuple, Union
 
 from pydantic import Field
 
 from app.agent.base import BaseAgent
+from app.agent.pool import AgentPool, copy_factory
 from app.flow.base import BaseFlow
+from app.flow.checkpoint import (
+    CheckpointStore,
+    StepCheckpoint,
+    dump_memory,
+    get_checkpoint_store,
+    load_memory,
+)
 from app.llm import LLM
+from app.llm_router import get_llm
 from app.logger import logger
+from app.metrics import metrics_labels
 from app.schema import AgentState, Message, ToolChoice
 from app.tool import PlanningTool
+from app.tool.planning import Plan
 
 
 class PlanStepStatus(str, Enum):
@@ -45,11 +57,24 @@ class PlanStepStatus(str, Enum):
 class PlanningFlow(BaseFlow):
     """A flow that manages planning and execution of tasks using agents."""
 
-    llm: LLM = Field(default_factory=lambda: LLM())
+    llm: LLM = Field(default_factory=get_llm)
     planning_tool: PlanningTool = Field(default_factory=PlanningTool)
     executor_keys: List[str] = Field(default_factory=list)
     active_plan_id: str = Field(default_factory=lambda: f"plan_{int(time.time())}")
     current_step_index: Optional[int] = None
+    max_parallel_steps: int = Field(
+        default=4,
+        description="Maximum number of independent plan steps executed concurrently",
+    )
+    agent_pool: Optional[AgentPool] = Field(
+        default=None,
+        description="Pool for extra executor instances when parallel steps need an agent that is busy; "
+        "owned by the caller, which closes it",
+    )
+    checkpoint_store: Optional[CheckpointStore] = Field(
+        default_factory=get_checkpoint_store,
+        description="Store recording the plan and each completed step, for resuming a run",
+    )
 
     def __init__(
         self, agents: Union[BaseAgent, List[BaseAgent], Dict[str, BaseAgent]], **data
@@ -74,64 +99,104 @@ class PlanningFlow(BaseFlow):
         if not self.executor_keys:
             self.executor_keys = list(self.agents.keys())
 
-    def get_executor(self, step_type: Optional[str] = None) -> BaseAgent:
+    def get_executor(
+        self, step_type: Optional[str] = None, busy: Collection[BaseAgent] = ()
+    ) -> Optional[BaseAgent]:
         """
         Get an appropriate executor agent for the current step.
         Can be extended to select agents based on step type/requirements.
+
+        A step runs on the agent named by its type, or else on the first
+        executor. If that agent is in `busy`, running another step, returns None
+        rather than another agent that may lack the tools the step needs.
         """
-        # If step type is provided and matches an agent key, use that agent
+        key = self._executor_key(step_type)
+        agent = self.agents.get(key) if key else None
+        if agent is None or any(agent is busy_agent for busy_agent in busy):
+            return None
+        return agent
+
+    def _executor_key(self, step_type: Optional[str] = None) -> Optional[str]:
+        """Key of the agent type that should run a step"""
         if step_type and step_type in self.agents:
-            return self.agents[step_type]
-
-        # Otherwise use the first available executor or fall back to primary agent
-        for key in self.executor_keys:
-            if key in self.agents:
-                return self.agents[key]
-
-        # Fallback to primary agent
-        return self.primary_agent
-
-    async def execute(self, input_text: str) -> str:
-        """Execute the planning flow with agents."""
-        try:
-            if not self.primary_agent:
-                raise ValueError("No primary agent available")
+            return step_type
+        return next(
+            (key for key in self.executor_keys if key in self.agents),
+            self.primary_agent_key,
+        )
 
-            # Create initial plan if input provided
-            if input_text:
-                await self._create_initial_plan(input_text)
+    async def _acquire_pooled_executor(
+        self, step_type: Optional[str]
+    ) -> Optional[Tuple[str, BaseAgent]]:
+        """
+        Check out another instance of the step's agent type from the pool. Unless
+        a factory was registered for the type, instances copy the flow's agent.
+        """
+        key = self._executor_key(step_type)
+        if self.agent_pool is None or key is None:
+            return None
+        if key not in self.agent_pool:
+            self.agent_pool.register(key, copy_factory(self.agents[key]))
+        return key, await self.agent_pool.acquire(key)
+
+    async def execute(
+        self, input_text: str, resume_plan_id: Optional[str] = None
+    ) -> str:
+        """Execute the planning flow with agents.
+
+        With `resume_plan_id`, the plan, the results of its completed steps and
+        the agents' memory are restored from the checkpoint store and the run
+        continues with the remaining steps. If there is no checkpoint for the
+        plan, a new plan is created from `input_text` under that ID, or the run
+        fails if `input_text` is empty. The checkpoint is deleted once the plan
+        is finalized or an executor ends the flow.
+        """
+        with metrics_labels(flow=type(self).__name__):
+            try:
+                if not self.primary_agent:
+                    raise ValueError("No primary agent available")
+
+                restored_results: Dict[int, str] = {}
+                if resume_plan_id:
+                    self.active_plan_id = resume_plan_id
+                    restored = await self._restore_checkpoint(resume_plan_id)
+                    if restored is not None:
+                        restored_results = restored
+                        # The plan is restored; don't create a new one
+                        input_text = ""
+                    elif not input_text:
+                        logger.error(f"No checkpoint found for plan {resume_plan_id}")
+                        return f"Execution failed: no checkpoint found for plan {resume_plan_id}"
+                    else:
+                        logger.warning(
+                            f"No checkpoint found for plan {resume_plan_id}, starting it afresh"
+                        )
 
-                # Verify plan was created successfully
-                if self.active_plan_id not in self.planning_tool.plans:
-                    logger.error(
-                        f"Plan creation failed. Plan ID {self.active_plan_id} not found in planning tool."
-                    )
-                    return f"Failed to create plan for: {input_text}"
+                # Create initial plan if input provided
+                if input_text:
+                    await self._create_initial_plan(input_text)
 
-            result = ""
-            while True:
-                # Get current step to execute
-                self.current_step_index, step_info = await self._get_current_step_info()
+                    # Verify plan was created successfully
+                    if self.active_plan_id not in self.planning_tool.plans:
+                        logger.error(
+                            f"Plan creation failed. Plan ID {self.active_plan_id} not found in planning tool."
+                        )
+                        return f"Failed to create plan for: {input_text}"
+                    await self._checkpoint_plan(request=input_text)
 
-                # Exit if no more steps or plan completed
-                if self.current_step_index is None:
+                step_results, terminated = await self._execute_plan_steps()
+                step_results = {**restored_results, **step_results}
+                result = "".join(
+                    step_results[index] + "\n" for index in sorted(step_results)
+                )
+                if not terminated:
                     result += await self._finalize_plan()
-                    break
-
-                # Execute current step with appropriate agent
-                step_type = step_info.get("type") if step_info else None
-                executor = self.get_executor(step_type)
-                step_result = await self._execute_step(executor, step_info)
-                result += step_result + "\n"
-
-                # Check if agent wants to terminate
-                if hasattr(executor, "state") and executor.state == AgentState.FINISHED:
-                    break
-
-            return result
-        except Exception as e:
-            logger.error(f"Error in PlanningFlow: {str(e)}")
-            return f"Execution failed: {str(e)}"
+                if self.checkpoint_store is not None:
+                    await self.checkpoint_store.delete(self.active_plan_id)
+                return result
+            except Exception as e:
+                logger.error(f"Error in PlanningFlow: {str(e)}")
+                return f"Execution failed: {str(e)}"
 
     async def _create_initial_plan(self, request: str) -> None:
         """Create an initial plan based on the request using the flow's LLM and PlanningTool."""
@@ -158,6 +223,10 @@ class PlanningFlow(BaseFlow):
                 f"The infomation of them are below: {json.dumps(agents_description)}\n"
                 "When creating steps in the planning tool, please specify the agent names using the format '[agent_name]'."
             )
+        system_message_content += (
+            "\nIf some steps do not depend on each other, set step_dependencies so "
+            "that they can be executed in parallel."
+        )
 
         # Create a system message for plan creation
         system_message = Message.system_message(system_message_content)
@@ -210,75 +279,201 @@ class PlanningFlow(BaseFlow):
             }
         )
 
-    async def _get_current_step_info(self) -> tuple[Optional[int], Optional[dict]]:
+    async def _execute_plan_steps(self) -> Tuple[Dict[int, str], bool]:
         """
-        Parse the current plan to identify the first non-completed step's index and info.
-        Returns (None, None) if no active step is found.
+        Run the plan's steps, each as soon as its dependencies are completed.
+
+        Ready steps run concurrently on different executor agents, up to
+        `max_parallel_steps` at a time. When the agent a step needs is busy, an
+        extra instance is checked out of `agent_pool` if one is set. Returns the result of each executed step
+        by step index, and whether an executor asked to terminate the flow.
+        """
+        results: Dict[int, str] = {}
+        # Step index, executor, and the pool key if the executor is pooled
+        running: Dict[asyncio.Task, Tuple[int, BaseAgent, Optional[str]]] = {}
+        terminated = False
+
+        try:
+            while True:
+                if not terminated:
+                    running_steps = {index for index, _, _ in running.values()}
+                    for index, step_info in await self._get_ready_steps():
+                        if len(running) >= self.max_parallel_steps:
+                            break
+                        if index in running_steps:
+                            continue
+                        executor = self.get_executor(
+                            step_info.get("type"),
+                            busy=[agent for _, agent, _ in running.values()],
+                        )
+                        pool_key = None
+                        if executor is None:
+                            pooled = await self._acquire_pooled_executor(
+                                step_info.get("type")
+                            )
+                            if pooled is None:
+                                continue
+                            pool_key, executor = pooled
+
+                        await self._mark_step(index, PlanStepStatus.IN_PROGRESS)
+                        self.current_step_index = index
+                        task = asyncio.create_task(
+                            self._execute_step(executor, step_info, index)
+                        )
+                        running[task] = (index, executor, pool_key)
+
+                # Done when nothing is running and nothing more could be started
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    index, executor, pool_key = running.pop(task)
+                    results[index] = task.result()
+                    # Record the step before a pooled executor's memory is reset
+                    await self._checkpoint_step(
+                        index, results[index], executor, pool_key
+                    )
+
+                    # Check if agent wants to terminate; running steps still finish
+                    if hasattr(executor, "state") and executor.state == AgentState.FINISHED:
+                        terminated = True
+                    if pool_key is not None:
+                        await self.agent_pool.release(pool_key, executor)
+        finally:
+            # On an error or cancellation (e.g. a timeout around execute), stop
+            # the running steps and wait for them so that no step keeps running
+            # and pooled agents are handed back with their tools closed
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            for _, executor, pool_key in running.values():
+                if pool_key is not None:
+                    await self.agent_pool.discard(pool_key, executor)
+
+        return results, terminated
+
+    async def _checkpoint_plan(self, request: Optional[str] = None) -> None:
+        """Record the current plan in the checkpoint store, if there is one"""
+        plan = self.planning_tool.plans.get(self.active_plan_id)
+        if self.checkpoint_store is None or plan is None:
+            return
+        await self.checkpoint_store.record_plan(
+            self.active_plan_id, plan.model_dump(), request
+        )
+
+    async def _checkpoint_step(
+        self,
+        step_index: int,
+        result: str,
+        executor: BaseAgent,
+        pool_key: Optional[str] = None,
+    ) -> None:
+        """Record a finished step with the plan state and the executor's memory.
+
+        Only completed steps are recorded as such; for a failed step just the
+        plan is updated, so the step runs again on resume.
+        """
+        plan = self.planning_tool.plans.get(self.active_plan_id)
+        if self.checkpoint_store is None or plan is None:
+            return
+        if plan.step_statuses[step_index] != PlanStepStatus.COMPLETED.value:
+            await self._checkpoint_plan()
+            return
+
+        agent_key = pool_key or next(
+            (key for key, agent in self.agents.items() if agent is executor), None
+        )
+        await self.checkpoint_store.record_step(
+            self.active_plan_id,
+            plan.model_dump(),
+            StepCheckpoint(
+                step_index=step_index,
+                result=result,
+                agent_key=agent_key,
+                memory=dump_memory(executor.memory),
+                completed_at=time.time(),
+            ),
+        )
+
+    async def _restore_checkpoint(self, plan_id: str) -> Optional[Dict[int, str]]:
+        """
+        Restore a plan and the agents' memory from its checkpoint. Returns the
+        results of the completed steps, or None if the plan has no checkpoint.
+        """
+        if self.checkpoint_store is None:
+            return None
+        checkpoint = await self.checkpoint_store.load(plan_id)
+        if checkpoint is None:
+            return None
+
+        plan = Plan(**checkpoint.plan)
+        for index, status in enumerate(plan.step_statuses):
+            if index in checkpoint.steps:
+                plan.set_status(index, PlanStepStatus.COMPLETED.value)
+            elif status != PlanStepStatus.NOT_STARTED.value:
+                # The step was interrupted or failed; run it again
+                plan.set_status(index, PlanStepStatus.NOT_STARTED.value)
+        self.planning_tool.plans[plan_id] = plan
+        await self.planning_tool.execute(command="set_active", plan_id=plan_id)
+
+        # Each agent gets its memory as of the last step it completed
+        memories: Dict[str, List[dict]] = {}
+        for step in sorted(checkpoint.steps.values(), key=lambda s: s.completed_at):
+            if step.agent_key:
+                memories[step.agent_key] = step.memory
+        for key, messages in memories.items():
+            agent = self.agents.get(key)
+            if agent is not None:
+                agent.memory = load_memory(messages, agent.memory.max_messages)
+
+        logger.info(
+            f"Resuming plan {plan_id} with {len(checkpoint.steps)}/{len(plan.steps)} steps completed"
+        )
+        return {index: step.result for index, step in checkpoint.steps.items()}
+
+    async def _get_ready_steps(self) -> List[Tuple[int, dict]]:
+        """
+        Get the steps whose dependencies are completed, in plan order, with their
+        info (text and optional type).
         """
         if (
             not self.active_plan_id
             or self.active_plan_id not in self.planning_tool.plans
         ):
             logger.error(f"Plan with ID {self.active_plan_id} not found")
-            return None, None
+            return []
 
         try:
-            # Direct access to plan data from planning tool storage
-            plan_data = self.planning_tool.plans[self.active_plan_id]
-            steps = plan_data.get("steps", [])
-            step_statuses = plan_data.get("step_statuses", [])
-
-            # Find first non-completed step
-            for i, step in enumerate(steps):
-                if i >= len(step_statuses):
-                    status = PlanStepStatus.NOT_STARTED.value
-                else:
-                    status = step_statuses[i]
-
-                if status in PlanStepStatus.get_active_statuses():
-                    # Extract step type/category if available
-                    step_info = {"text": step}
-
-                    # Try to extract step type from the text (e.g., [SEARCH] or [CODE])
-                    import re
-
-                    type_match = re.search(r"\[([A-Z_]+)\]", step)
-                    if type_match:
-                        step_info["type"] = type_match.group(1).lower()
-
-                    # Mark current step as in_progress
-                    try:
-                        await self.planning_tool.execute(
-                            command="mark_step",
-                            plan_id=self.active_plan_id,
-                            step_index=i,
-                            step_status=PlanStepStatus.IN_PROGRESS.value,
-                        )
-                    except Exception as e:
-                        logger.warning(f"Error marking step as in_progress: {e}")
-                        # Update step status directly if needed
-                        if i < len(step_statuses):
-                            step_statuses[i] = PlanStepStatus.IN_PROGRESS.value
-                        else:
-                            while len(step_statuses) < i:
-                                step_statuses.append(PlanStepStatus.NOT_STARTED.value)
-                            step_statuses.append(PlanStepStatus.IN_PROGRESS.value)
-
-                        plan_data["step_statuses"] = step_statuses
-
-                    return i, step_info
-
-            return None, None  # No active step found
+            plan = self.planning_tool.plans[self.active_plan_id]
+            ready_steps = []
+            for index in plan.ready_steps():
+                step_info = {"text": plan.steps[index]}
+
+                # Step type tag from the text (e.g., [SEARCH] or [CODE])
+                step_type = plan.step_type(index)
+                if step_type:
+                    step_info["type"] = step_type
+                ready_steps.append((index, step_info))
+            return ready_steps
 
         except Exception as e:
-            logger.warning(f"Error finding current step index: {e}")
-            return None, None
+            logger.warning(f"Error finding ready steps: {e}")
+            return []
+
+    async def _execute_step(
+        self, executor: BaseAgent, step_info: dict, step_index: Optional[int] = None
+    ) -> str:
+        """Execute a step with the specified agent using agent.run()."""
+        if step_index is None:
+            step_index = self.current_step_index
 
-    async def _execute_step(self, executor: BaseAgent, step_info: dict) -> str:
-        """Execute the current step with the specified agent using agent.run()."""
         # Prepare context for the agent with current plan status
         plan_status = await self._get_plan_text()
-        step_text = step_info.get("text", f"Step {self.current_step_index}")
+        step_text = step_info.get("text", f"Step {step_index}")
 
         # Create a prompt for the agent to execute the current step
         step_prompt = f"""
@@ -286,7 +481,7 @@ class PlanningFlow(BaseFlow):
         {plan_status}
 
         YOUR CURRENT TASK:
-        You are now working on step {self.current_step_index}: "{step_text}"
+        You are now working on step {step_index}: "{step_text}"
 
         Please only execute this current step using the appropriate tools. When you're done, provide a summary of what you accomplished.
         """
@@ -296,43 +491,44 @@ class PlanningFlow(BaseFlow):
             step_result = await executor.run(step_prompt)
 
             # Mark the step as completed after successful execution
-            await self._mark_step_completed()
+            await self._mark_step_completed(step_index)
 
             return step_result
         except Exception as e:
-            logger.error(f"Error executing step {self.current_step_index}: {e}")
-            return f"Error executing step {self.current_step_index}: {str(e)}"
-
-    async def _mark_step_completed(self) -> None:
-        """Mark the current step as completed."""
-        if self.current_step_index is None:
+            logger.error(f"Error executing step {step_index}: {e}")
+            # Block the step so that it is not retried; steps depending on it stay pending
+            await self._mark_step(step_index, PlanStepStatus.BLOCKED, notes=str(e))
+            return f"Error executing step {step_index}: {str(e)}"
+
+    async def _mark_step_completed(self, step_index: Optional[int] = None) -> None:
+        """Mark a step (the current step by default) as completed."""
+        if step_index is None:
+            step_index = self.current_step_index
+        if step_index is None:
             return
+        await self._mark_step(step_index, PlanStepStatus.COMPLETED)
 
+    async def _mark_step(
+        self, step_index: int, status: PlanStepStatus, notes: Optional[str] = None
+    ) -> None:
+        """Set the status of a step, updating plan storage directly if the tool fails."""
         try:
-            # Mark the step as completed
             await self.planning_tool.execute(
                 command="mark_step",
                 plan_id=self.active_plan_id,
-                step_index=self.current_step_index,
-                step_status=PlanStepStatus.COMPLETED.value,
+                step_index=step_index,
+                step_status=status.value,
+                step_notes=notes,
             )
             logger.info(
-                f"Marked step {self.current_step_index} as completed in plan {self.active_plan_id}"
+                f"Marked step {step_index} as {status.value} in plan {self.active_plan_id}"
             )
         except Exception as e:
             logger.warning(f"Failed to update plan status: {e}")
             # Update step status directly in planning tool storage
-            if self.active_plan_id in self.planning_tool.plans:
-                plan_data = self.planning_tool.plans[self.active_plan_id]
-                step_statuses = plan_data.get("step_statuses", [])
-
-                # Ensure the step_statuses list is long enough
-                while len(step_statuses) <= self.current_step_index:
-                    step_statuses.append(PlanStepStatus.NOT_STARTED.value)
-
-                # Update the status
-                step_statuses[self.current_step_index] = PlanStepStatus.COMPLETED.value
-                plan_data["step_statuses"] = step_statuses
+            plan = self.planning_tool.plans.get(self.active_plan_id)
+            if plan is not None and 0 <= step_index < len(plan.steps):
+                plan.set_status(step_index, status.value)
 
     async def _get_plan_text(self) -> str:
         """Get the current plan as formatted text."""
@@ -351,54 +547,7 @@ class PlanningFlow(BaseFlow):
             if self.active_plan_id not in self.planning_tool.plans:
                 return f"Error: Plan with ID {self.active_plan_id} not found"
 
-            plan_data = self.planning_tool.plans[self.active_plan_id]
-            title = plan_data.get("title", "Untitled Plan")
-            steps = plan_data.get("steps", [])
-            step_statuses = plan_data.get("step_statuses", [])
-            step_notes = plan_data.get("step_notes", [])
-
-            # Ensure step_statuses and step_notes match the number of steps
-            while len(step_statuses) < len(steps):
-                step_statuses.append(PlanStepStatus.NOT_STARTED.value)
-            while len(step_notes) < len(steps):
-                step_notes.append("")
-
-            # Count steps by status
-            status_counts = {status: 0 for status in PlanStepStatus.get_all_statuses()}
-
-            for status in step_statuses:
-                if status in status_counts:
-                    status_counts[status] += 1
-
-            completed = status_counts[PlanStepStatus.COMPLETED.value]
-            total = len(steps)
-            progress = (completed / total) * 100 if total > 0 else 0
-
-            plan_text = f"Plan: {title} (ID: {self.active_plan_id})\n"
-            plan_text += "=" * len(plan_text) + "\n\n"
-
-            plan_text += (
-                f"Progress: {completed}/{total} steps completed ({progress:.1f}%)\n"
-            )
-            plan_text += f"Status: {status_counts[PlanStepStatus.COMPLETED.value]} completed, {status_counts[PlanStepStatus.IN_PROGRESS.value]} in progress, "
-            plan_text += f"{status_counts[PlanStepStatus.BLOCKED.value]} blocked, {status_counts[PlanStepStatus.NOT_STARTED.value]} not started\n\n"
-            plan_text += "Steps:\n"
-
-            status_marks = PlanStepStatus.get_status_marks()
-
-            for i, (step, status, notes) in enumerate(
-                zip(steps, step_statuses, step_notes)
-            ):
-                # Use status marks to indicate step status
-                status_mark = status_marks.get(
-                    status, status_marks[PlanStepStatus.NOT_STARTED.value]
-                )
-
-                plan_text += f"{i}. {status_mark} {step}\n"
-                if notes:
-                    plan_text += f"   Notes: {notes}\n"
-
-            return plan_text
+            return self.planning_tool.plans[self.active_plan_id].render()
         except Exception as e:
             logger.error(f"Error generating plan text from storage: {e}")
             return f"Error: Unable to retrieve plan with ID {self.active_plan_id}"
@@ -0,0 +1,279 @@
+"""Shared, connection-pooled HTTP transport for LLM API clients."""
+import asyncio
+import time
+import weakref
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+from httpx._utils import get_environment_proxies
+
+from app.config import LLMSettings
+from app.logger import logger
+
+
+# httpcore trace events that mark the moment a request got a usable connection
+_CONNECTION_READY_EVENTS = (
+    "connection.connect_tcp.started",
+    "connection.connect_unix_socket.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+_CONNECTION_OPENED_EVENTS = (
+    "connection.connect_tcp.complete",
+    "connection.connect_unix_socket.complete",
+)
+
+
+class PoolMetrics:
+    """Counters describing how an HTTP connection pool is being used."""
+
+    def __init__(self, limits: httpx.Limits, http2: bool):
+        self.limits = limits
+        self.http2 = http2
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections_opened = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        # Connection pools of every transport reporting here (one per event
+        # loop and proxy); pools of closed loops drop out with their transport
+        self._pools: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+    def request_started(self) -> None:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+
+    def record_wait(self, seconds: float) -> None:
+        self.total_wait_time += seconds
+        self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current pool metrics as a plain dict."""
+        connections = [conn for pool in list(self._pools) for conn in pool.connections]
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "connections": len(connections),
+            "idle_connections": idle,
+            "connections_opened": self.connections_opened,
+            "total_wait_time": round(self.total_wait_time, 6),
+            "avg_wait_time": round(self.total_wait_time / self.requests, 6)
+            if self.requests
+            else 0.0,
+            "max_wait_time": round(self.max_wait_time, 6),
+        }
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body wrapper that reports when the connection is released."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport and records pool usage metrics."""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, metrics: PoolMetrics):
+        self._transport = transport
+        self.metrics = metrics
+        pool = getattr(transport, "_pool", None)
+        if pool is not None:
+            metrics._pools.add(pool)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        connection_ready = False
+        user_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal connection_ready
+            if not connection_ready and event_name in _CONNECTION_READY_EVENTS:
+                connection_ready = True
+                self.metrics.record_wait(time.perf_counter() - start)
+            if event_name in _CONNECTION_OPENED_EVENTS:
+                self.metrics.connections_opened += 1
+            if user_trace is not None:
+                await user_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self.metrics.request_started()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.metrics.request_finished()
+            raise
+
+        response.stream = _TrackedStream(response.stream, self.metrics.request_finished)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """Transport that keeps a separate connection pool per event loop.
+
+    Pooled connections are bound to the loop that opened them, while LLM
+    instances (and the shared client) outlive a single ``asyncio.run``. Each
+    loop lazily gets its own transport from the factory instead.
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncBaseTransport]):
+        self._factory = factory
+        self._transports: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = self._transports[loop] = self._factory()
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # Only connections of the running loop can be closed from here; those of
+        # other loops are dropped and released when their loop goes away
+        loop = asyncio.get_running_loop()
+        transport = self._transports.pop(loop, None)
+        self._transports.clear()
+        if transport is not None:
+            await transport.aclose()
+
+
+_PoolKey = Tuple[bool, int, int, float]
+
+_shared_clients: Dict[_PoolKey, httpx.AsyncClient] = {}
+_shared_metrics: Dict[_PoolKey, PoolMetrics] = {}
+
+
+def _pool_key(llm_config: LLMSettings) -> _PoolKey:
+    return (
+        llm_config.http2,
+        llm_config.max_connections,
+        llm_config.max_keepalive_connections,
+        llm_config.keepalive_expiry,
+    )
+
+
+def _resolve_http2(http2: bool) -> bool:
+    """Get the effective HTTP/2 flag, which needs the optional 'h2' package."""
+    if not http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning(
+            "HTTP/2 requested for LLM clients but the 'h2' package is not installed, "
+            "falling back to HTTP/1.1"
+        )
+        return False
+    return True
+
+
+def _pooled_transport(
+    limits: httpx.Limits,
+    http2: bool,
+    metrics: PoolMetrics,
+    proxy: Optional[str] = None,
+) -> _LoopLocalTransport:
+    return _LoopLocalTransport(
+        lambda: InstrumentedTransport(
+            httpx.AsyncHTTPTransport(limits=limits, http2=http2, proxy=proxy),
+            metrics,
+        )
+    )
+
+
+def get_shared_http_client(llm_config: LLMSettings) -> httpx.AsyncClient:
+    """
+    Get the process-wide httpx client for the given pool settings.
+
+    All LLM instances whose settings share the same pool configuration reuse one
+    client, so connections (and TLS sessions) to the same base_url are pooled
+    across agents and flows instead of being opened per LLM instance.
+    Connections are pooled per event loop, and HTTP(S)_PROXY, ALL_PROXY and
+    NO_PROXY from the environment are honoured as by a default httpx client.
+    """
+    key = _pool_key(llm_config)
+    client = _shared_clients.get(key)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=llm_config.max_connections,
+            max_keepalive_connections=llm_config.max_keepalive_connections,
+            keepalive_expiry=llm_config.keepalive_expiry,
+        )
+        http2 = _resolve_http2(llm_config.http2)
+        metrics = PoolMetrics(limits, http2=http2)
+        # Passing a transport turns off httpx's own proxy handling, so the
+        # environment proxies are mounted here; None routes to the direct pool
+        mounts = {
+            pattern: None
+            if proxy is None
+            else _pooled_transport(limits, http2, metrics, proxy=proxy)
+            for pattern, proxy in get_environment_proxies().items()
+        }
+        client = httpx.AsyncClient(
+            transport=_pooled_transport(limits, http2, metrics),
+            mounts=mounts,
+            timeout=httpx.Timeout(timeout=600.0, connect=5.0),
+            follow_redirects=True,
+        )
+        _shared_clients[key] = client
+        _shared_metrics[key] = metrics
+    return client
+
+
+def get_pool_metrics(llm_config: Optional[LLMSettings] = None) -> Dict[str, Any]:
+    """
+    Get connection pool metrics.
+
+    Args:
+        llm_config: Settings of the pool to report; all pools are reported if omitted
+
+    Returns:
+        Dict[str, Any]: The metrics of one pool, or metrics of every pool keyed by
+        a readable pool name
+    """
+    if llm_config is not None:
+        metrics = _shared_metrics.get(_pool_key(llm_config))
+        return metrics.snapshot() if metrics else {}
+
+    return {
+        f"http2={key[0]},max_connections={key[1]},max_keepalive={key[2]}": metrics.snapshot()
+        for key, metrics in _shared_metrics.items()
+    }
+
+
+async def close_shared_http_clients() -> None:
+    """Close all shared HTTP clients and their pooled connections."""
+    for client in _shared_clients.values():
+        await client.aclose()
+    _shared_clients.clear()
+    _shared_metrics.clear()
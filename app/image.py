@@ -0,0 +1,156 @@
+"""Cheap inspection and resizing of base64 images sent to multimodal models."""
+import base64
+import binascii
+import io
+import struct
+from typing import Optional, Tuple
+
+from app.logger import logger
+
+
+# Base64 prefix lengths to try when looking for the image header; JPEG metadata
+# segments (EXIF, ICC profiles) can push the frame header past the first bytes
+_HEADER_PREFIXES = (4096, 65536, None)
+
+# Largest size the model is sent at for each detail level
+_DETAIL_MAX_SIZE = {"low": 512, "high": 2048}
+_HIGH_DETAIL_SHORT_SIDE = 768
+
+_JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF
+}
+
+
+def image_mime_type(data: bytes) -> str:
+    """Guess the MIME type of an image from its magic bytes (JPEG if unknown)."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def _jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # Markers without length
+            offset += 2
+            continue
+        (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def image_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from a PNG, GIF, WebP or JPEG header without decoding pixels.
+
+    Returns None if the format is unknown or the header is not in `data`.
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            width = int.from_bytes(data[24:27], "little") + 1
+            height = int.from_bytes(data[27:30], "little") + 1
+            return width, height
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and len(data) >= 25:
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        return None
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_dimensions(data)
+    return None
+
+
+def base64_image_dimensions(base64_image: str) -> Optional[Tuple[int, int]]:
+    """Read image dimensions from base64 data, decoding only as much as needed."""
+    for prefix in _HEADER_PREFIXES:
+        chunk = base64_image if prefix is None else base64_image[:prefix]
+        try:
+            data = base64.b64decode(chunk[: len(chunk) // 4 * 4])
+        except (binascii.Error, ValueError):
+            return None
+        dimensions = image_dimensions(data)
+        if dimensions or prefix is None or prefix >= len(base64_image):
+            return dimensions
+    return None
+
+
+def data_uri_dimensions(url: str) -> Optional[Tuple[int, int]]:
+    """Read image dimensions from a base64 data URI, or None for other URLs."""
+    if not url.startswith("data:"):
+        return None
+    header, _, payload = url.partition(",")
+    if not header.endswith(";base64"):
+        return None
+    return base64_image_dimensions(payload)
+
+
+def base64_mime_type(base64_image: str) -> str:
+    """Guess the MIME type of base64 image data from its first bytes."""
+    try:
+        return image_mime_type(base64.b64decode(base64_image[:16]))
+    except (binascii.Error, ValueError):
+        return "image/jpeg"
+
+
+def _target_size(width: int, height: int, detail: str) -> Tuple[int, int]:
+    max_size = _DETAIL_MAX_SIZE[detail]
+    scale = min(1.0, max_size / max(width, height))
+    if detail == "high":
+        scale = min(scale, _HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def downscale_base64_image(base64_image: str, detail: str) -> str:
+    """
+    Downscale an image to the largest size the model uses at a detail level.
+
+    The model resizes larger images itself, so this only saves bytes and does
+    not change what the model sees. Returns the input unchanged if it is already
+    small enough, cannot be parsed, or Pillow is not installed.
+    """
+    if detail not in _DETAIL_MAX_SIZE:
+        return base64_image
+    dimensions = base64_image_dimensions(base64_image)
+    if not dimensions:
+        return base64_image
+    size = _target_size(*dimensions, detail)
+    if size == tuple(dimensions):
+        return base64_image
+
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.debug("Pillow is not installed, sending images at full size")
+        return base64_image
+
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(base64_image))) as image:
+            resized = image.convert("RGB").resize(size, Image.LANCZOS)
+        output = io.BytesIO()
+        resized.save(output, format="JPEG", quality=85)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to downscale image, sending it at full size: {e}")
+        return base64_image
+    return base64.b64encode(output.getvalue()).decode("ascii")
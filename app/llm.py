@@ -1,5 +1,18 @@
+import asyncio
+import functools
+import json
 import math
-from typing import Dict, List, Optional, Union
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import tiktoken
 from openai import (
@@ -10,18 +23,31 @@ from openai import (
     OpenAIError,
     RateLimitError,
 )
-from openai.types.chat import ChatCompletion, ChatCompletionMessage
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_random_exponential,
+from openai.types.chat import (
+    ChatCompletion,
+    ChatCompletionChunk,
+    ChatCompletionMessage,
+    ChatCompletionMessageToolCall,
 )
+from openai.types.chat.chat_completion_chunk import ChoiceDelta
+from openai.types.chat.chat_completion_message_tool_call import Function
+from pydantic import ValidationError
 
-from app.bedrock import BedrockClient
+from app.blob_store import blob_store
 from app.config import LLMSettings, config
 from app.exceptions import TokenLimitExceeded
+from app.http_pool import get_pool_metrics, get_shared_http_client
+from app.image import (
+    base64_mime_type,
+    data_uri_dimensions,
+    downscale_base64_image,
+)
+from app.llm_batch import BatchResult, run_batch_job
+from app.llm_cache import get_response_cache
 from app.logger import logger  # Assuming a logger is set up in your app
+from app.metrics import llm_metrics, record_llm_call
+from app.rate_limit import get_rate_limiter
+from app.retry_policy import RetryStats, llm_retry
 from app.schema import (
     ROLE_VALUES,
     TOOL_CHOICE_TYPE,
@@ -29,6 +55,7 @@ from app.schema import (
     Message,
     ToolChoice,
 )
+from app.transcript import get_transcript_recorder
 
 
 REASONING_MODELS = ["o1", "o3-mini"]
@@ -42,6 +69,27 @@ MULTIMODAL_MODELS = [
 ]
 
 
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model: str) -> tiktoken.Encoding:
+    """Load the tiktoken encoding of a model once per process."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # If the model is not in tiktoken's presets, use cl100k_base as default
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _sent_image_ref(image_ref: str, image_detail: Optional[str]) -> str:
+    """Blob store reference of an image as sent, downscaled to the detail level"""
+    if not image_detail:
+        return image_ref
+    return blob_store.derive(
+        image_ref,
+        f"detail={image_detail}",
+        lambda data: downscale_base64_image(data, image_detail),
+    )
+
+
 class TokenCounter:
     # Token constants
     BASE_MESSAGE_TOKENS = 4
@@ -61,7 +109,9 @@ class TokenCounter:
         """Calculate tokens for a text string"""
         return 0 if not text else len(self.tokenizer.encode(text))
 
-    def count_image(self, image_item: dict) -> int:
+    def count_image(
+        self, image_item: dict, dimensions: Optional[Tuple[int, int]] = None
+    ) -> int:
         """
         Calculate tokens for an image based on detail level and dimensions
 
@@ -72,7 +122,9 @@ class TokenCounter:
         3. Count 512px tiles (170 tokens each)
         4. Add 85 tokens
         """
-        detail = image_item.get("detail", "medium")
+        image_url = image_item.get("image_url")
+        image_url = image_url if isinstance(image_url, dict) else {"url": image_url}
+        detail = image_url.get("detail") or image_item.get("detail", "medium")
 
         # For low detail, always return fixed token count
         if detail == "low":
@@ -82,10 +134,16 @@ class TokenCounter:
         # OpenAI doesn't specify a separate calculation for medium
 
         # For high detail, calculate based on dimensions if available
-        if detail == "high" or detail == "medium":
-            # If dimensions are provided in the image_item
-            if "dimensions" in image_item:
-                width, height = image_item["dimensions"]
+        if detail in ("high", "medium", "auto"):
+            # Use the dimensions carried with the image, or read them from the
+            # header of an inline image
+            dimensions = (
+                dimensions
+                or image_item.get("dimensions")
+                or data_uri_dimensions(image_url.get("url") or "")
+            )
+            if dimensions:
+                width, height = dimensions
                 return self._calculate_high_detail_tokens(width, height)
 
         return (
@@ -100,8 +158,8 @@ class TokenCounter:
             width = int(width * scale)
             height = int(height * scale)
 
-        # Step 2: Scale so shortest side is HIGH_DETAIL_TARGET_SHORT_SIDE
-        scale = self.HIGH_DETAIL_TARGET_SHORT_SIDE / min(width, height)
+        # Step 2: Scale down so shortest side is at most HIGH_DETAIL_TARGET_SHORT_SIDE
+        scale = min(1.0, self.HIGH_DETAIL_TARGET_SHORT_SIDE / min(width, height))
         scaled_width = int(width * scale)
         scaled_height = int(height * scale)
 
@@ -115,8 +173,16 @@ class TokenCounter:
             total_tiles * self.HIGH_DETAIL_TILE_TOKENS
         ) + self.LOW_DETAIL_IMAGE_TOKENS
 
-    def count_content(self, content: Union[str, List[Union[str, dict]]]) -> int:
-        """Calculate tokens for message content"""
+    def count_content(
+        self,
+        content: Union[str, List[Union[str, dict]]],
+        image_dimensions: Optional[List[Optional[Tuple[int, int]]]] = None,
+    ) -> int:
+        """Calculate tokens for message content
+
+        `image_dimensions` are the known (width, height) of the content's images,
+        in order, or None where unknown.
+        """
         if not content:
             return 0
 
@@ -124,6 +190,7 @@ class TokenCounter:
             return self.count_text(content)
 
         token_count = 0
+        image_index = 0
         for item in content:
             if isinstance(item, str):
                 token_count += self.count_text(item)
@@ -131,7 +198,13 @@ class TokenCounter:
                 if "text" in item:
                     token_count += self.count_text(item["text"])
                 elif "image_url" in item:
-                    token_count += self.count_image(item)
+                    dimensions = (
+                        image_dimensions[image_index]
+                        if image_dimensions and image_index < len(image_dimensions)
+                        else None
+                    )
+                    image_index += 1
+                    token_count += self.count_image(item, dimensions)
         return token_count
 
     def count_tool_calls(self, tool_calls: List[dict]) -> int:
@@ -144,29 +217,37 @@ class TokenCounter:
                 token_count += self.count_text(function.get("arguments", ""))
         return token_count
 
-    def count_message_tokens(self, messages: List[dict]) -> int:
-        """Calculate the total number of tokens in a message list"""
-        total_tokens = self.FORMAT_TOKENS  # Base format tokens
+    def count_single_message(
+        self,
+        message: dict,
+        image_dimensions: Optional[List[Optional[Tuple[int, int]]]] = None,
+    ) -> int:
+        """Calculate the number of tokens of one formatted message, excluding format tokens"""
+        tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
 
-        for message in messages:
-            tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
+        # Add role tokens
+        tokens += self.count_text(message.get("role", ""))
 
-            # Add role tokens
-            tokens += self.count_text(message.get("role", ""))
+        # Add content tokens
+        if "content" in message:
+            tokens += self.count_content(message["content"], image_dimensions)
 
-            # Add content tokens
-            if "content" in message:
-                tokens += self.count_content(message["content"])
+        # Add tool calls tokens
+        if "tool_calls" in message:
+            tokens += self.count_tool_calls(message["tool_calls"])
 
-            # Add tool calls tokens
-            if "tool_calls" in message:
-                tokens += self.count_tool_calls(message["tool_calls"])
+        # Add name and tool_call_id tokens
+        tokens += self.count_text(message.get("name", ""))
+        tokens += self.count_text(message.get("tool_call_id", ""))
 
-            # Add name and tool_call_id tokens
-            tokens += self.count_text(message.get("name", ""))
-            tokens += self.count_text(message.get("tool_call_id", ""))
+        return tokens
 
-            total_tokens += tokens
+    def count_message_tokens(self, messages: List[dict]) -> int:
+        """Calculate the total number of tokens in a message list"""
+        total_tokens = self.FORMAT_TOKENS  # Base format tokens
+
+        for message in messages:
+            total_tokens += self.count_single_message(message)
 
         return total_tokens
 
@@ -188,7 +269,12 @@ class LLM:
     ):
         if not hasattr(self, "client"):  # Only initialize if not already initialized
             llm_config = llm_config or config.llm
-            llm_config = llm_config.get(config_name, llm_config["default"])
+            llm_config = (
+                llm_config[config_name]
+                if config_name in llm_config
+                else llm_config["default"]
+            )
+            self.config_name = config_name
             self.model = llm_config.model
             self.max_tokens = llm_config.max_tokens
             self.temperature = llm_config.temperature
@@ -200,32 +286,70 @@ class LLM:
             # Add token counting related attributes
             self.total_input_tokens = 0
             self.total_completion_tokens = 0
+            self.total_cached_tokens = 0
+            self.last_usage: Dict[str, int] = {}
+            self.llm_config = llm_config
             self.max_input_tokens = (
                 llm_config.max_input_tokens
                 if hasattr(llm_config, "max_input_tokens")
                 else None
             )
+            # Per-request budget that agent context is compacted to fit
+            self.max_context_tokens = llm_config.max_context_tokens
+            # Only the most recent images of a conversation are sent
+            self.max_images = llm_config.max_images
+            self.image_detail = llm_config.image_detail
 
-            # Initialize tokenizer
-            try:
-                self.tokenizer = tiktoken.encoding_for_model(self.model)
-            except KeyError:
-                # If the model is not in tiktoken's presets, use cl100k_base as default
-                self.tokenizer = tiktoken.get_encoding("cl100k_base")
+            # Initialize tokenizer, shared by all LLMs of the same model
+            self.tokenizer = get_tokenizer(self.model)
 
+            # All OpenAI-compatible clients share one pooled HTTP transport
+            self.http_client = get_shared_http_client(llm_config)
             if self.api_type == "azure":
                 self.client = AsyncAzureOpenAI(
                     base_url=self.base_url,
                     api_key=self.api_key,
                     api_version=self.api_version,
+                    http_client=self.http_client,
                 )
             elif self.api_type == "aws":
+                # boto3 is only imported when a Bedrock model is configured
+                from app.bedrock import BedrockClient
+
                 self.client = BedrockClient()
             else:
-                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+                self.client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    http_client=self.http_client,
+                )
 
             self.token_counter = TokenCounter(self.tokenizer)
 
+            # Requests of the same config_name share one client-side rate limiter
+            self.rate_limiter = get_rate_limiter(config_name, llm_config)
+
+            # Opt-in persistent cache for repeated identical requests
+            self.response_cache = get_response_cache(llm_config)
+
+            # Opt-in JSONL transcript of exchanges, replayable by app.mock_llm
+            self.transcript_recorder = get_transcript_recorder(llm_config)
+
+            # Only transient errors are retried, within a per-call deadline
+            self.retry_max_attempts = llm_config.retry_max_attempts
+            self.retry_deadline = llm_config.retry_deadline
+            self.retry_stats = RetryStats()
+
+            # Fan-out of independent prompts through ask_batch
+            self.batch_concurrency = llm_config.batch_concurrency
+            self.batch_completion_window = llm_config.batch_completion_window
+            self.batch_poll_interval = llm_config.batch_poll_interval
+
+    @property
+    def pool_metrics(self) -> dict:
+        """Metrics of the shared HTTP connection pool used by this LLM"""
+        return get_pool_metrics(self.llm_config)
+
     def count_tokens(self, text: str) -> int:
         """Calculate the number of tokens in a text"""
         if not text:
@@ -235,17 +359,126 @@ class LLM:
     def count_message_tokens(self, messages: List[dict]) -> int:
         return self.token_counter.count_message_tokens(messages)
 
-    def update_token_count(self, input_tokens: int, completion_tokens: int = 0) -> None:
+    def format_and_count_messages(
+        self, messages: List[Union[dict, Message]], supports_images: bool = False
+    ) -> Tuple[List[dict], int]:
+        """
+        Format messages for the LLM and count their input tokens.
+
+        Token counts of Message objects are cached on the message itself, keyed by
+        tokenizer, so a growing history only encodes the messages added since the
+        previous call instead of re-tokenizing the whole conversation.
+
+        Returns:
+            Tuple[List[dict], int]: The formatted messages and their token count
+        """
+        formatted_messages = []
+        input_tokens = TokenCounter.FORMAT_TOKENS
+        image_flags = self._image_flags(messages, supports_images, self.max_images)
+
+        for message, with_image in zip(messages, image_flags):
+            formatted = self._format_message(message, with_image, self.image_detail)
+            if formatted is None:
+                continue
+            formatted_messages.append(formatted)
+            input_tokens += self._count_formatted(message, formatted, with_image)
+
+        return formatted_messages, input_tokens
+
+    def count_message(
+        self, message: Union[dict, Message], supports_images: bool = False
+    ) -> int:
+        """Count the tokens of a single message, using its cached count if any."""
+        if isinstance(message, Message):
+            tokens = message.get_token_count(self._token_cache_key(supports_images))
+            if tokens is not None:
+                return tokens
+
+        formatted = self._format_message(message, supports_images, self.image_detail)
+        if formatted is None:
+            return 0
+        return self._count_formatted(message, formatted, supports_images)
+
+    def _count_formatted(
+        self, message: Union[dict, Message], formatted: dict, supports_images: bool
+    ) -> int:
+        if not isinstance(message, Message):
+            return self.token_counter.count_single_message(formatted)
+
+        cache_key = self._token_cache_key(supports_images)
+        tokens = message.get_token_count(cache_key)
+        if tokens is None:
+            # Dimensions are kept with the image in the blob store, so its
+            # header is not parsed again
+            dimensions = (
+                [blob_store.dimensions(_sent_image_ref(message.image_ref, self.image_detail))]
+                if supports_images and message.image_ref
+                else None
+            )
+            tokens = self.token_counter.count_single_message(formatted, dimensions)
+            message.set_token_count(cache_key, tokens)
+        return tokens
+
+    def _token_cache_key(self, supports_images: bool) -> tuple:
+        # Image tokens depend on the detail level images are sent at
+        return (
+            self.tokenizer.name,
+            supports_images,
+            self.image_detail if supports_images else None,
+        )
+
+    def count_tools_tokens(self, tools: List[dict]) -> int:
+        """Calculate the number of tokens of tool descriptions.
+
+        When tools come from ToolCollection.to_params(), the cost is memoized on
+        the params list so unchanged schemas are only encoded once per tokenizer.
+        """
+        token_counts = getattr(tools, "token_counts", None)
+        if token_counts is not None and self.tokenizer.name in token_counts:
+            return token_counts[self.tokenizer.name]
+
+        tools_tokens = sum(self.count_tokens(str(tool)) for tool in tools)
+        if token_counts is not None:
+            token_counts[self.tokenizer.name] = tools_tokens
+        return tools_tokens
+
+    def update_token_count(
+        self, input_tokens: int, completion_tokens: int = 0, cached_tokens: int = 0
+    ) -> None:
         """Update token counts"""
         # Only track tokens if max_input_tokens is set
         self.total_input_tokens += input_tokens
         self.total_completion_tokens += completion_tokens
+        self.total_cached_tokens += cached_tokens
+        self.last_usage = {
+            "input_tokens": input_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+        }
+        # Input tokens were reserved before sending, completion tokens are debited now
+        self.rate_limiter.record_usage(completion_tokens)
+        llm_metrics.record_tokens(input_tokens, completion_tokens, cached_tokens)
         logger.info(
-            f"Token usage: Input={input_tokens}, Completion={completion_tokens}, "
+            f"Token usage: Input={input_tokens}, Completion={completion_tokens}, Cached={cached_tokens}, "
             f"Cumulative Input={self.total_input_tokens}, Cumulative Completion={self.total_completion_tokens}, "
+            f"Cumulative Cached={self.total_cached_tokens}, "
             f"Total={input_tokens + completion_tokens}, Cumulative Total={self.total_input_tokens + self.total_completion_tokens}"
         )
 
+    def record_usage(self, usage: Any) -> None:
+        """Update token counts from the usage payload of a response.
+
+        Input tokens served from the provider's prompt cache are taken from
+        `prompt_tokens_details.cached_tokens` when the provider reports them.
+        """
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        self.update_token_count(
+            usage.prompt_tokens, usage.completion_tokens or 0, cached_tokens
+        )
+
     def check_token_limit(self, input_tokens: int) -> bool:
         """Check if token limits are exceeded"""
         if self.max_input_tokens is not None:
@@ -265,14 +498,23 @@ class LLM:
 
     @staticmethod
     def format_messages(
-        messages: List[Union[dict, Message]], supports_images: bool = False
+        messages: List[Union[dict, Message]],
+        supports_images: bool = False,
+        max_images: Optional[int] = None,
+        image_detail: Optional[str] = None,
     ) -> List[dict]:
         """
         Format messages for LLM by converting them to OpenAI message format.
 
+        The format of a Message object is cached on it, so the returned dicts
+        must be treated as read-only. Images are only materialized as data URIs
+        for the last `max_images` messages that carry one.
+
         Args:
             messages: List of messages that can be either dict or Message objects
             supports_images: Flag indicating if the target model supports image inputs
+            max_images: Maximum number of most recent images to include (None for all)
+            image_detail: Detail level to request and downscale images to, if any
 
         Returns:
             List[dict]: List of formatted messages in OpenAI format
@@ -290,74 +532,320 @@ class LLM:
             >>> formatted = LLM.format_messages(msgs)
         """
         formatted_messages = []
+        image_flags = LLM._image_flags(messages, supports_images, max_images)
 
-        for message in messages:
-            # Convert Message objects to dictionaries
-            if isinstance(message, Message):
-                message = message.to_dict()
-
-            if isinstance(message, dict):
-                # If message is a dict, ensure it has required fields
-                if "role" not in message:
-                    raise ValueError("Message dict must contain 'role' field")
-
-                # Process base64 images if present and model supports images
-                if supports_images and message.get("base64_image"):
-                    # Initialize or convert content to appropriate format
-                    if not message.get("content"):
-                        message["content"] = []
-                    elif isinstance(message["content"], str):
-                        message["content"] = [
-                            {"type": "text", "text": message["content"]}
-                        ]
-                    elif isinstance(message["content"], list):
-                        # Convert string items to proper text objects
-                        message["content"] = [
-                            (
-                                {"type": "text", "text": item}
-                                if isinstance(item, str)
-                                else item
-                            )
-                            for item in message["content"]
-                        ]
-
-                    # Add the image to content
-                    message["content"].append(
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{message['base64_image']}"
-                            },
-                        }
-                    )
+        for message, with_image in zip(messages, image_flags):
+            formatted = LLM._format_message(message, with_image, image_detail)
+            if formatted is not None:
+                formatted_messages.append(formatted)
 
-                    # Remove the base64_image field
-                    del message["base64_image"]
-                # If model doesn't support images but message has base64_image, handle gracefully
-                elif not supports_images and message.get("base64_image"):
-                    # Just remove the base64_image field and keep the text content
-                    del message["base64_image"]
+        return formatted_messages
 
-                if "content" in message or "tool_calls" in message:
-                    formatted_messages.append(message)
-                # else: do not include the message
-            else:
-                raise TypeError(f"Unsupported message type: {type(message)}")
+    @staticmethod
+    def _image_flags(
+        messages: List[Union[dict, Message]],
+        supports_images: bool,
+        max_images: Optional[int] = None,
+    ) -> List[bool]:
+        """Whether each message should be formatted with its image"""
+        flags = [supports_images] * len(messages)
+        if supports_images and max_images is not None:
+            remaining = max_images
+            for index in range(len(messages) - 1, -1, -1):
+                message = messages[index]
+                has_image = (
+                    message.has_image
+                    if isinstance(message, Message)
+                    else bool(message.get("base64_image") or message.get("image_ref"))
+                )
+                if not has_image:
+                    continue
+                flags[index] = remaining > 0
+                remaining -= 1
+        return flags
 
-        # Validate all messages have required fields
-        for msg in formatted_messages:
-            if msg["role"] not in ROLE_VALUES:
-                raise ValueError(f"Invalid role: {msg['role']}")
+    @staticmethod
+    def _format_message(
+        message: Union[dict, Message],
+        supports_images: bool = False,
+        image_detail: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Format one message, or return None if it has nothing to send"""
+        # Convert Message objects to dictionaries, reusing their cached format
+        source = None
+        if isinstance(message, Message):
+            cached = message.get_formatted(supports_images)
+            if cached is not None:
+                return cached
+            source = message
+            message = message.to_dict()
+
+        if not isinstance(message, dict):
+            raise TypeError(f"Unsupported message type: {type(message)}")
+
+        # If message is a dict, ensure it has required fields
+        if "role" not in message:
+            raise ValueError("Message dict must contain 'role' field")
+        if message["role"] not in ROLE_VALUES:
+            raise ValueError(f"Invalid role: {message['role']}")
+
+        # Images are kept by reference until they are actually sent
+        image_ref = message.pop("image_ref", None)
+        if image_ref and supports_images:
+            message["base64_image"] = blob_store.get(
+                _sent_image_ref(image_ref, image_detail)
+            )
 
-        return formatted_messages
+        # Process base64 images if present and model supports images
+        has_image = bool(message.get("base64_image"))
+        if supports_images and has_image:
+            # Initialize or convert content to appropriate format
+            if not message.get("content"):
+                message["content"] = []
+            elif isinstance(message["content"], str):
+                message["content"] = [{"type": "text", "text": message["content"]}]
+            elif isinstance(message["content"], list):
+                # Convert string items to proper text objects
+                message["content"] = [
+                    ({"type": "text", "text": item} if isinstance(item, str) else item)
+                    for item in message["content"]
+                ]
+
+            # Add the image to content
+            base64_image = message["base64_image"]
+            image_url = {
+                "url": f"data:{base64_mime_type(base64_image)};base64,{base64_image}"
+            }
+            if image_detail:
+                image_url["detail"] = image_detail
+            message["content"].append({"type": "image_url", "image_url": image_url})
+
+            # Remove the base64_image field
+            del message["base64_image"]
+        # If model doesn't support images but message has base64_image, handle gracefully
+        elif not supports_images and has_image:
+            # Just remove the base64_image field and keep the text content
+            del message["base64_image"]
+
+        if "content" not in message and "tool_calls" not in message:
+            return None  # do not include the message
+
+        # Data URIs are rebuilt when needed rather than kept alive on the message
+        if source is not None and not (supports_images and has_image):
+            source.set_formatted(supports_images, message)
+        return message
+
+    def _image_url(
+        self, image_url: dict
+    ) -> Tuple[dict, Optional[Tuple[int, int]]]:
+        """
+        Apply the configured detail level to an image_url, downscaling inline
+        images. Returns it with the dimensions of an inline image as sent.
+        """
+        url = image_url["url"]
+        header, _, payload = url.partition(",")
+        if not (url.startswith("data:") and header.endswith(";base64")):
+            if self.image_detail and not image_url.get("detail"):
+                image_url = {**image_url, "detail": self.image_detail}
+            return image_url, None
+
+        # Inline images go through the blob store, which keeps their dimensions
+        # and the downscaled copy
+        sent_ref = blob_store.put(payload)
+        if self.image_detail and not image_url.get("detail"):
+            resized_ref = _sent_image_ref(sent_ref, self.image_detail)
+            if resized_ref != sent_ref:
+                resized = blob_store.get(resized_ref)
+                url = f"data:{base64_mime_type(resized)};base64,{resized}"
+                sent_ref = resized_ref
+            image_url = {**image_url, "url": url, "detail": self.image_detail}
+        return image_url, blob_store.dimensions(sent_ref)
+
+    async def _create_completion(self, params: dict, input_tokens: int) -> Any:
+        """Send a non-streaming chat completion request within the rate limits."""
+        queued_at = time.perf_counter()
+        async with self.rate_limiter.limit(input_tokens):
+            llm_metrics.record_queue_wait(time.perf_counter() - queued_at)
+            return await self.client.chat.completions.create(**params)
+
+    async def _iter_stream(
+        self, params: dict, input_tokens: int
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        """Open a streaming chat completion within the rate limits and yield its chunks."""
+        queued_at = time.perf_counter()
+        async with self.rate_limiter.limit(input_tokens):
+            llm_metrics.record_queue_wait(time.perf_counter() - queued_at)
+            response = await self.client.chat.completions.create(**params)
+            async for chunk in response:
+                yield chunk
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    async def _stream_completion(
+        self, params: dict, input_tokens: int
+    ) -> AsyncIterator[ChoiceDelta]:
+        """
+        Run a streaming chat completion and yield its deltas as they arrive.
+
+        Usage is taken from the final usage chunk; if the endpoint does not send
+        one, completion tokens are estimated from the streamed text instead.
+        Nothing is recorded for a request that fails before its first chunk, so
+        retried attempts are not charged.
+        """
+        params = {**params, "stream": True, "stream_options": {"include_usage": True}}
+        usage = None
+        received = False
+        completion_parts = []
+        try:
+            async for chunk in self._iter_stream(params, input_tokens):
+                received = True
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                llm_metrics.record_first_token()
+                if delta.content:
+                    completion_parts.append(delta.content)
+                yield delta
+        finally:
+            if usage:
+                self.record_usage(usage)
+            elif received:
+                completion_tokens = self.count_tokens("".join(completion_parts))
+                logger.info(
+                    f"Estimated completion tokens for streaming response: {completion_tokens}"
+                )
+                self.update_token_count(input_tokens, completion_tokens)
+
+    async def astream(
+        self,
+        messages: List[Union[dict, Message]],
+        system_msgs: Optional[List[Union[dict, Message]]] = None,
+        temperature: Optional[float] = None,
+        tools: Optional[List[dict]] = None,
+        tool_choice: TOOL_CHOICE_TYPE = ToolChoice.AUTO,  # type: ignore
+        **kwargs,
+    ) -> AsyncIterator[ChoiceDelta]:
+        """
+        Stream a response from the LLM, yielding deltas as they are generated.
+
+        Each yielded delta carries the new `content` text and, when tools are
+        given, incremental `tool_calls` fragments (index, id, name, arguments).
+        The stream is not retried once it has started yielding.
+
+        Args:
+            messages: List of conversation messages
+            system_msgs: Optional system messages to prepend
+            temperature: Sampling temperature for the response
+            tools: Optional list of tools the model may call
+            tool_choice: Tool choice strategy, used only with tools
+            **kwargs: Additional completion arguments
+
+        Yields:
+            ChoiceDelta: Incremental content and tool call deltas
+
+        Raises:
+            TokenLimitExceeded: If token limits are exceeded
+            ValueError: If tool_choice or messages are invalid
+        """
+        if tools and tool_choice not in TOOL_CHOICE_VALUES:
+            raise ValueError(f"Invalid tool_choice: {tool_choice}")
+
+        supports_images = self.model in MULTIMODAL_MODELS
+        if system_msgs:
+            messages = list(system_msgs) + list(messages)
+        messages, input_tokens = self.format_and_count_messages(
+            messages, supports_images
+        )
+        if tools:
+            input_tokens += self.count_tools_tokens(tools)
+
+        if not self.check_token_limit(input_tokens):
+            raise TokenLimitExceeded(self.get_limit_error_message(input_tokens))
+
+        params = {"model": self.model, "messages": messages, **kwargs}
+        if tools:
+            params["tools"] = tools
+            params["tool_choice"] = tool_choice
+
+        if self.model in REASONING_MODELS:
+            params["max_completion_tokens"] = self.max_tokens
+        else:
+            params["max_tokens"] = self.max_tokens
+            params["temperature"] = (
+                temperature if temperature is not None else self.temperature
+            )
+
+        async for delta in self._stream_completion(params, input_tokens):
+            yield delta
+
+    async def _stream_tool_completion(
+        self,
+        params: dict,
+        input_tokens: int,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], Any]] = None,
+    ) -> ChatCompletionMessage:
+        """
+        Stream a tool-calling completion and assemble the final message.
+
+        A tool call is handed to `on_tool_call` as soon as its arguments form a
+        complete JSON document, or when the next tool call starts, so callers can
+        begin executing it while the model is still generating later calls.
+        """
+        content_parts = []
+        calls: Dict[int, dict] = {}
+        dispatched = set()
+
+        def to_tool_call(call: dict) -> ChatCompletionMessageToolCall:
+            return ChatCompletionMessageToolCall(
+                id=call["id"],
+                type="function",
+                function=Function(name=call["name"], arguments=call["arguments"]),
+            )
+
+        def dispatch(index: int, force: bool = False) -> None:
+            if on_tool_call is None or index in dispatched:
+                return
+            call = calls[index]
+            if not force:
+                try:
+                    json.loads(call["arguments"] or "{}")
+                except json.JSONDecodeError:
+                    return
+            dispatched.add(index)
+            on_tool_call(to_tool_call(call))
+
+        async for delta in self._stream_completion(params, input_tokens):
+            if delta.content:
+                content_parts.append(delta.content)
+
+            for fragment in delta.tool_calls or []:
+                if fragment.index not in calls:
+                    # A new call starting means the earlier calls are complete
+                    for index in sorted(calls):
+                        dispatch(index, force=True)
+                    calls[fragment.index] = {"id": "", "name": "", "arguments": ""}
+
+                call = calls[fragment.index]
+                if fragment.id:
+                    call["id"] = fragment.id
+                if fragment.function:
+                    call["name"] += fragment.function.name or ""
+                    call["arguments"] += fragment.function.arguments or ""
+                if call["arguments"].rstrip().endswith("}"):
+                    dispatch(fragment.index)
+
+        for index in sorted(calls):
+            dispatch(index, force=True)
+
+        tool_calls = [to_tool_call(calls[index]) for index in sorted(calls)]
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(content_parts) or None,
+            tool_calls=tool_calls or None,
+        )
+
+    @record_llm_call
+    @llm_retry
     async def ask(
         self,
         messages: List[Union[dict, Message]],
@@ -387,15 +875,13 @@ class LLM:
             # Check if the model supports images
             supports_images = self.model in MULTIMODAL_MODELS
 
-            # Format system and user messages with image support check
+            # Format system and user messages with image support check,
+            # reusing cached per-message token counts
             if system_msgs:
-                system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
-            else:
-                messages = self.format_messages(messages, supports_images)
-
-            # Calculate input token count
-            input_tokens = self.count_message_tokens(messages)
+                messages = list(system_msgs) + list(messages)
+            messages, input_tokens = self.format_and_count_messages(
+                messages, supports_images
+            )
 
             # Check if token limits are exceeded
             if not self.check_token_limit(input_tokens):
@@ -416,46 +902,56 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
+            # Serve identical requests from the response cache when enabled
+            cache_key = None
+            if self.response_cache:
+                cache_key = self.response_cache.make_key(
+                    "ask", params, endpoint=f"{self.api_type}:{self.base_url}"
+                )
+                cached_response = await self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    logger.info("Using cached LLM response")
+                    llm_metrics.record_cache_hit()
+                    return cached_response
+
             if not stream:
                 # Non-streaming request
-                response = await self.client.chat.completions.create(
-                    **params, stream=False
+                response = await self._create_completion(
+                    {**params, "stream": False}, input_tokens
                 )
 
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
 
                 # Update token counts
-                self.update_token_count(
-                    response.usage.prompt_tokens, response.usage.completion_tokens
-                )
+                self.record_usage(response.usage)
 
-                return response.choices[0].message.content
-
-            # Streaming request, For streaming, update estimated token count before making the request
-            self.update_token_count(input_tokens)
+                if cache_key:
+                    await self.response_cache.set(
+                        cache_key, response.choices[0].message.content
+                    )
+                if self.transcript_recorder:
+                    self.transcript_recorder.record(
+                        "ask", params, response.choices[0].message, self.last_usage
+                    )
 
-            response = await self.client.chat.completions.create(**params, stream=True)
+                return response.choices[0].message.content
 
+            # Streaming request, token usage is recorded from the final usage chunk
             collected_messages = []
-            completion_text = ""
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                completion_text += chunk_message
-                print(chunk_message, end="", flush=True)
+            async for delta in self._stream_completion(params, input_tokens):
+                collected_messages.append(delta.content or "")
 
-            print()  # Newline after streaming
             full_response = "".join(collected_messages).strip()
             if not full_response:
                 raise ValueError("Empty response from streaming LLM")
 
-            # estimate completion tokens for streaming response
-            completion_tokens = self.count_tokens(completion_text)
-            logger.info(
-                f"Estimated completion tokens for streaming response: {completion_tokens}"
-            )
-            self.total_completion_tokens += completion_tokens
+            if cache_key:
+                await self.response_cache.set(cache_key, full_response)
+            if self.transcript_recorder:
+                self.transcript_recorder.record(
+                    "ask", params, full_response, self.last_usage
+                )
 
             return full_response
 
@@ -478,13 +974,162 @@ class LLM:
             logger.exception(f"Unexpected error in ask")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    async def ask_batch(
+        self,
+        prompts: List[List[Union[dict, Message]]],
+        system_msgs: Optional[List[Union[dict, Message]]] = None,
+        temperature: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        use_batch_api: bool = False,
+    ) -> List[BatchResult]:
+        """
+        Send many independent prompts and collect their responses in order.
+
+        Identical prompt sets are sent once and share their result. Requests go
+        through `ask` (rate limits, retries, response cache) with at most
+        `max_concurrency` in flight, or, with `use_batch_api`, are submitted as
+        one job to the endpoint's Batch API and awaited. A failed prompt set is
+        reported in its result and does not fail the others.
+
+        Args:
+            prompts: One list of conversation messages per request
+            system_msgs: Optional system messages to prepend to every request
+            temperature (float): Sampling temperature for the responses
+            max_concurrency (int): Requests in flight at once (defaults to batch_concurrency)
+            use_batch_api (bool): Submit the requests as one Batch API job
+
+        Returns:
+            List[BatchResult]: One result per prompt set, in input order
+
+        Raises:
+            BatchError: If a Batch API job fails as a whole
+        """
+        supports_images = self.model in MULTIMODAL_MODELS
+        system_msgs = list(system_msgs or [])
+
+        # Deduplicate on the wire format of the full request
+        unique: Dict[str, int] = {}
+        owners: List[int] = []
+        for index, messages in enumerate(prompts):
+            formatted, _ = self.format_and_count_messages(
+                system_msgs + list(messages), supports_images
+            )
+            key = json.dumps(
+                formatted,
+                sort_keys=True,
+                ensure_ascii=False,
+            )
+            owners.append(unique.setdefault(key, index))
+        first_indices = sorted(set(owners))
+        if len(first_indices) < len(prompts):
+            logger.info(
+                f"Batch of {len(prompts)} prompts has {len(first_indices)} unique requests"
+            )
+
+        if use_batch_api:
+            responses = await self._ask_batch_api(
+                {index: prompts[index] for index in first_indices},
+                system_msgs,
+                temperature,
+            )
+        else:
+            semaphore = asyncio.Semaphore(max_concurrency or self.batch_concurrency)
+
+            async def run(index: int) -> BatchResult:
+                async with semaphore:
+                    try:
+                        response = await self.ask(
+                            prompts[index],
+                            system_msgs=system_msgs or None,
+                            stream=False,
+                            temperature=temperature,
+                        )
+                    except Exception as e:
+                        return BatchResult(index=index, error=f"{type(e).__name__}: {e}")
+                return BatchResult(index=index, response=response)
+
+            results = await asyncio.gather(*(run(index) for index in first_indices))
+            responses = {result.index: result for result in results}
+
+        failed = sum(1 for index in first_indices if not responses[index].ok)
+        if failed:
+            logger.warning(f"{failed} of {len(first_indices)} batch requests failed")
+        return [
+            responses[owner]
+            if owner == index
+            else responses[owner].model_copy(
+                update={"index": index, "duplicate_of": owner}
+            )
+            for index, owner in enumerate(owners)
+        ]
+
+    async def _ask_batch_api(
+        self,
+        prompts: Dict[int, List[Union[dict, Message]]],
+        system_msgs: List[Union[dict, Message]],
+        temperature: Optional[float],
+    ) -> Dict[int, BatchResult]:
+        """Run prompts as one Batch API job, reporting per-request failures"""
+        if self.api_type == "aws":
+            raise ValueError("The Batch API is not supported for Bedrock models")
+
+        supports_images = self.model in MULTIMODAL_MODELS
+        results: Dict[int, BatchResult] = {}
+        requests: Dict[str, dict] = {}
+        for index, messages in prompts.items():
+            formatted, input_tokens = self.format_and_count_messages(
+                system_msgs + list(messages), supports_images
+            )
+            if not self.check_token_limit(input_tokens):
+                # Report the over-limit prompt and submit the rest
+                results[index] = BatchResult(
+                    index=index,
+                    error=f"TokenLimitExceeded: {self.get_limit_error_message(input_tokens)}",
+                )
+                continue
+            body = {"model": self.model, "messages": formatted}
+            if self.model in REASONING_MODELS:
+                body["max_completion_tokens"] = self.max_tokens
+            else:
+                body["max_tokens"] = self.max_tokens
+                body["temperature"] = (
+                    temperature if temperature is not None else self.temperature
+                )
+            requests[str(index)] = body
+
+        if not requests:
+            return results
+        outcomes = await run_batch_job(
+            self.client,
+            requests,
+            completion_window=self.batch_completion_window,
+            poll_interval=self.batch_poll_interval,
+        )
+
+        for custom_id, outcome in outcomes.items():
+            index = int(custom_id)
+            if "error" in outcome:
+                results[index] = BatchResult(index=index, error=outcome["error"])
+                continue
+            try:
+                response = ChatCompletion.model_validate(outcome["response"])
+            except ValidationError as e:
+                results[index] = BatchResult(
+                    index=index, error=f"ValidationError: Invalid batch response: {e}"
+                )
+                continue
+            self.record_usage(response.usage)
+            content = response.choices[0].message.content if response.choices else None
+            if not content:
+                results[index] = BatchResult(
+                    index=index, error="ValueError: Empty or invalid response from LLM"
+                )
+            else:
+                results[index] = BatchResult(index=index, response=content)
+        return results
+
+    @record_llm_call
+    @llm_retry
     async def ask_with_images(
         self,
         messages: List[Union[dict, Message]],
@@ -521,7 +1166,9 @@ class LLM:
                 )
 
             # Format messages with image support
-            formatted_messages = self.format_messages(messages, supports_images=True)
+            formatted_messages = self.format_messages(
+                messages, supports_images=True, max_images=self.max_images
+            )
 
             # Ensure the last message is from the user to attach images
             if not formatted_messages or formatted_messages[-1]["role"] != "user":
@@ -529,29 +1176,40 @@ class LLM:
                     "The last message must be from the user to attach images"
                 )
 
-            # Process the last user message to include images
-            last_message = formatted_messages[-1]
+            # Process the last user message to include images, on a copy since
+            # formatted messages may be cached on their Message
+            last_message = dict(formatted_messages[-1])
+            formatted_messages[-1] = last_message
 
             # Convert content to multimodal format if needed
             content = last_message["content"]
             multimodal_content = (
                 [{"type": "text", "text": content}]
                 if isinstance(content, str)
-                else content
+                else list(content)
                 if isinstance(content, list)
                 else []
             )
 
-            # Add images to content
+            # Add images to content, keeping the dimensions of each image in
+            # the content for token counting
+            image_dimensions = [
+                None
+                for item in multimodal_content
+                if isinstance(item, dict) and "image_url" in item
+            ]
             for image in images:
                 if isinstance(image, str):
+                    image = {"url": image}
+                if isinstance(image, dict) and "url" in image:
+                    image_url, dimensions = self._image_url(image)
                     multimodal_content.append(
-                        {"type": "image_url", "image_url": {"url": image}}
+                        {"type": "image_url", "image_url": image_url}
                     )
-                elif isinstance(image, dict) and "url" in image:
-                    multimodal_content.append({"type": "image_url", "image_url": image})
+                    image_dimensions.append(dimensions)
                 elif isinstance(image, dict) and "image_url" in image:
                     multimodal_content.append(image)
+                    image_dimensions.append(None)
                 else:
                     raise ValueError(f"Unsupported image format: {image}")
 
@@ -568,7 +1226,9 @@ class LLM:
                 all_messages = formatted_messages
 
             # Calculate tokens and check limits
-            input_tokens = self.count_message_tokens(all_messages)
+            input_tokens = self.count_message_tokens(
+                all_messages[:-1]
+            ) + self.token_counter.count_single_message(last_message, image_dimensions)
             if not self.check_token_limit(input_tokens):
                 raise TokenLimitExceeded(self.get_limit_error_message(input_tokens))
 
@@ -590,25 +1250,19 @@ class LLM:
 
             # Handle non-streaming request
             if not stream:
-                response = await self.client.chat.completions.create(**params)
+                response = await self._create_completion(params, input_tokens)
 
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
 
-                self.update_token_count(response.usage.prompt_tokens)
+                self.record_usage(response.usage)
                 return response.choices[0].message.content
 
             # Handle streaming request
-            self.update_token_count(input_tokens)
-            response = await self.client.chat.completions.create(**params)
-
             collected_messages = []
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                print(chunk_message, end="", flush=True)
+            async for delta in self._stream_completion(params, input_tokens):
+                collected_messages.append(delta.content or "")
 
-            print()  # Newline after streaming
             full_response = "".join(collected_messages).strip()
 
             if not full_response:
@@ -634,13 +1288,8 @@ class LLM:
             logger.error(f"Unexpected error in ask_with_images: {e}")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @record_llm_call
+    @llm_retry
     async def ask_tool(
         self,
         messages: List[Union[dict, Message]],
@@ -649,6 +1298,8 @@ class LLM:
         tools: Optional[List[dict]] = None,
         tool_choice: TOOL_CHOICE_TYPE = ToolChoice.AUTO,  # type: ignore
         temperature: Optional[float] = None,
+        stream: bool = False,
+        on_tool_call: Optional[Callable[[ChatCompletionMessageToolCall], Any]] = None,
         **kwargs,
     ) -> ChatCompletionMessage | None:
         """
@@ -661,6 +1312,12 @@ class LLM:
             tools: List of tools to use
             tool_choice: Tool choice strategy
             temperature: Sampling temperature for the response
+            stream: Whether to stream the response and assemble tool calls from deltas
+            on_tool_call: Called with each tool call as soon as its arguments are
+                complete while streaming, before the rest of the response arrives.
+                If a failed stream is retried, calls of the failed attempt may
+                already have been handed off and arrive again under new ids, so
+                only calls without side effects should be started from it.
             **kwargs: Additional completion arguments
 
         Returns:
@@ -680,23 +1337,16 @@ class LLM:
             # Check if the model supports images
             supports_images = self.model in MULTIMODAL_MODELS
 
-            # Format messages
+            # Format messages, reusing cached per-message token counts
             if system_msgs:
-                system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
-            else:
-                messages = self.format_messages(messages, supports_images)
-
-            # Calculate input token count
-            input_tokens = self.count_message_tokens(messages)
+                messages = list(system_msgs) + list(messages)
+            messages, input_tokens = self.format_and_count_messages(
+                messages, supports_images
+            )
 
             # If there are tools, calculate token count for tool descriptions
-            tools_tokens = 0
             if tools:
-                for tool in tools:
-                    tools_tokens += self.count_tokens(str(tool))
-
-            input_tokens += tools_tokens
+                input_tokens += self.count_tools_tokens(tools)
 
             # Check if token limits are exceeded
             if not self.check_token_limit(input_tokens):
@@ -728,23 +1378,48 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
-            params["stream"] = False  # Always use non-streaming for tool requests
-            response: ChatCompletion = await self.client.chat.completions.create(
-                **params
-            )
+            # Serve identical requests from the response cache when enabled
+            cache_key = None
+            if self.response_cache:
+                cache_key = self.response_cache.make_key(
+                    "ask_tool", params, endpoint=f"{self.api_type}:{self.base_url}"
+                )
+                cached_response = await self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    logger.info("Using cached LLM tool response")
+                    llm_metrics.record_cache_hit()
+                    return ChatCompletionMessage.model_validate_json(cached_response)
+
+            if stream:
+                # Assemble tool calls from deltas, handing each one off when complete
+                message = await self._stream_tool_completion(
+                    params, input_tokens, on_tool_call
+                )
+            else:
+                params["stream"] = False
+                response: ChatCompletion = await self._create_completion(
+                    params, input_tokens
+                )
 
-            # Check if response is valid
-            if not response.choices or not response.choices[0].message:
-                print(response)
-                # raise ValueError("Invalid or empty response from LLM")
-                return None
+                # Check if response is valid
+                if not response.choices or not response.choices[0].message:
+                    print(response)
+                    # raise ValueError("Invalid or empty response from LLM")
+                    return None
 
-            # Update token counts
-            self.update_token_count(
-                response.usage.prompt_tokens, response.usage.completion_tokens
-            )
+                # Update token counts
+                self.record_usage(response.usage)
+
+                message = response.choices[0].message
+
+            if cache_key and isinstance(message, ChatCompletionMessage):
+                await self.response_cache.set(cache_key, message.model_dump_json())
+            if self.transcript_recorder and message is not None:
+                self.transcript_recorder.record(
+                    "ask_tool", params, message, self.last_usage
+                )
 
-            return response.choices[0].message
+            return message
 
         except TokenLimitExceeded:
             # Re-raise token limit errors without logging
@@ -0,0 +1,120 @@
+"""Offline batch jobs through the OpenAI-compatible Batch API (/v1/batches)."""
+import asyncio
+import io
+import json
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.logger import logger
+
+
+BATCH_TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchResult(BaseModel):
+    """Outcome of one prompt set of a batch, in submission order."""
+
+    index: int = Field(..., description="Position of the prompt set in the batch")
+    response: Optional[str] = Field(None, description="Response text on success")
+    error: Optional[str] = Field(None, description="Error description on failure")
+    duplicate_of: Optional[int] = Field(
+        None, description="Index of the identical prompt set whose result was reused"
+    )
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BatchError(Exception):
+    """Raised when a batch job as a whole fails, expires or is cancelled."""
+
+
+def _batch_file(requests: Dict[str, dict]) -> io.BytesIO:
+    lines = (
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            },
+            ensure_ascii=False,
+        )
+        for custom_id, body in requests.items()
+    )
+    data = io.BytesIO("\n".join(lines).encode("utf-8"))
+    data.name = "batch.jsonl"
+    return data
+
+
+async def _read_file(client: Any, file_id: Optional[str]) -> List[dict]:
+    if not file_id:
+        return []
+    content = await client.files.content(file_id)
+    lines = []
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            lines.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            # The request of an unreadable line is reported as having no result
+            logger.warning(f"Skipping malformed line of batch file {file_id}: {e}")
+    return lines
+
+
+async def run_batch_job(
+    client: Any,
+    requests: Dict[str, dict],
+    completion_window: str = "24h",
+    poll_interval: float = 10.0,
+) -> Dict[str, dict]:
+    """
+    Submit chat completion requests as one batch job and wait for it to finish.
+
+    Args:
+        client: An AsyncOpenAI-compatible client
+        requests: Chat completion request bodies keyed by custom ID
+        completion_window: Time window the provider may take to finish the job
+        poll_interval: Seconds between job status checks
+
+    Returns:
+        Dict[str, dict]: Per custom ID, either {"response": <response body>} or
+        {"error": <error description>}
+
+    Raises:
+        BatchError: If the job fails, expires or is cancelled as a whole
+    """
+    input_file = await client.files.create(file=_batch_file(requests), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window=completion_window,
+    )
+    logger.info(f"Submitted batch job {batch.id} with {len(requests)} requests")
+
+    while batch.status not in BATCH_TERMINAL_STATES:
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" and not batch.output_file_id:
+        raise BatchError(f"Batch job {batch.id} ended with status {batch.status}")
+
+    results: Dict[str, dict] = {}
+    for line in await _read_file(client, batch.output_file_id):
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code", 200) >= 400:
+            results[line["custom_id"]] = {
+                "error": json.dumps(line.get("error") or response.get("body"))
+            }
+        else:
+            results[line["custom_id"]] = {"response": response.get("body") or {}}
+    for line in await _read_file(client, batch.error_file_id):
+        results[line["custom_id"]] = {"error": json.dumps(line.get("error"))}
+
+    for custom_id in requests.keys() - results.keys():
+        results[custom_id] = {"error": f"No result in batch job {batch.id}"}
+    logger.info(f"Batch job {batch.id} finished with status {batch.status}")
+    return results
@@ -0,0 +1,159 @@
+"""Persistent on-disk cache for LLM completions."""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.config import LLMSettings, config
+from app.logger import logger
+
+
+class ResponseCache:
+    """A SQLite-backed completion cache with TTL and size-based LRU eviction.
+
+    Entries are keyed by a stable hash of the request (see `make_key`). Reads
+    refresh an entry's access time; once the store grows past `max_entries` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(
+        self, path: Path, ttl: Optional[float] = None, max_entries: int = 10000
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+
+    @staticmethod
+    def make_key(
+        namespace: str, params: Dict[str, Any], endpoint: Optional[str] = None
+    ) -> str:
+        """Build a stable cache key from the request parameters.
+
+        Transport-only parameters (stream, timeout) do not change the completion
+        and are left out of the key. `endpoint` identifies the serving endpoint
+        (API type and base URL), so that endpoints serving a model of the same
+        name do not share completions.
+        """
+        payload = {
+            k: v for k, v in params.items() if k not in ("stream", "timeout")
+        }
+        encoded = json.dumps(
+            [namespace, endpoint, payload],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+            return value
+
+    def _set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+
+    async def get(self, key: str) -> Optional[str]:
+        """Get a cached value, or None on a miss or an expired entry"""
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache read failed: {e}")
+            return None
+
+    async def set(self, key: str, value: str) -> None:
+        """Store a value, evicting least recently used entries beyond the size limit"""
+        try:
+            await asyncio.to_thread(self._set, key, value)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache write failed: {e}")
+
+    def clear(self) -> None:
+        """Remove all cached entries"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters of this process"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_response_caches: Dict[Path, ResponseCache] = {}
+
+
+def get_response_cache(llm_config: LLMSettings) -> Optional[ResponseCache]:
+    """Get the response cache for the given settings, or None if caching is off."""
+    if not llm_config.cache_enabled:
+        return None
+
+    path = (
+        Path(llm_config.cache_path)
+        if llm_config.cache_path
+        else config.workspace_root / ".cache" / "llm_responses.sqlite"
+    )
+    if path not in _response_caches:
+        _response_caches[path] = ResponseCache(
+            path, ttl=llm_config.cache_ttl, max_entries=llm_config.cache_max_entries
+        )
+    return _response_caches[path]
@@ -0,0 +1,326 @@
+"""LLM variant that routes requests across several configured endpoints."""
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from openai import BadRequestError, UnprocessableEntityError
+from openai.types.chat import ChatCompletionChunk
+
+from app.config import LLMRouterSettings, config
+from app.llm import LLM
+from app.logger import logger
+from app.metrics import llm_metrics
+from app.rate_limit import RateLimiter
+
+
+def _ewma(current: Optional[float], sample: float, alpha: float) -> float:
+    return sample if current is None else alpha * sample + (1 - alpha) * current
+
+
+class Endpoint:
+    """One routed LLM configuration and its observed health.
+
+    Streaming requests are measured by their time to first chunk and kept apart
+    from the full response latency of non-streaming requests, since the two are
+    not comparable.
+    """
+
+    def __init__(self, name: str, llm: LLM, weight: float = 1.0, window: int = 200):
+        self.name = name
+        self.llm = llm
+        self.weight = weight
+
+        self.latency_ewma: Optional[float] = None
+        self.ttft_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.latencies: deque = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.cooldown_until = 0.0
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def record_success(self, latency: float, alpha: float, stream: bool = False) -> None:
+        """Record a success; `latency` is the time to first chunk for streams"""
+        self.requests += 1
+        if stream:
+            self.ttft_ewma = _ewma(self.ttft_ewma, latency, alpha)
+        else:
+            self.latencies.append(latency)
+            self.latency_ewma = _ewma(self.latency_ewma, latency, alpha)
+        self.error_ewma = (1 - alpha) * self.error_ewma
+        self.cooldown_until = 0.0
+
+    def record_failure(self, alpha: float, cooldown: float) -> None:
+        self.requests += 1
+        self.failures += 1
+        self.error_ewma = alpha + (1 - alpha) * self.error_ewma
+        self.cooldown_until = time.monotonic() + cooldown
+
+    def latency_quantile(self, quantile: float, min_samples: int) -> Optional[float]:
+        """Observed latency quantile, or None until enough samples were seen"""
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def expected_latency(self, stream: bool = False) -> float:
+        """Latency estimate penalized by the error rate; unmeasured endpoints go first"""
+        latency = self.ttft_ewma if stream else self.latency_ewma
+        if latency is None:
+            return 0.0
+        return latency / max(0.01, 1.0 - self.error_ewma)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "model": self.llm.model,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "latency_ewma": round(self.latency_ewma, 3)
+            if self.latency_ewma is not None
+            else None,
+            "ttft_ewma": round(self.ttft_ewma, 3) if self.ttft_ewma is not None else None,
+            "error_ewma": round(self.error_ewma, 3),
+            "cooling_down": self.cooling_down,
+        }
+
+
+class LLMRouter(LLM):
+    """
+    An LLM that sends each request to one of several endpoints.
+
+    Endpoints are named `[llm.*]` configurations, so OpenAI-compatible, Azure and
+    Bedrock configurations can be mixed. Failed requests fail over to the next
+    endpoint, and with hedging enabled a non-streaming request that runs past an
+    endpoint's latency quantile is duplicated to the next endpoint, keeping
+    whichever answer arrives first. Prompt formatting, token limits and the
+    response cache follow the first endpoint's configuration.
+    """
+
+    _instances: Dict[str, "LLMRouter"] = {}
+
+    def __new__(
+        cls,
+        config_name: str = "router",
+        router_config: Optional[LLMRouterSettings] = None,
+    ):
+        if config_name not in cls._instances:
+            instance = object.__new__(cls)
+            instance.__init__(config_name, router_config)
+            cls._instances[config_name] = instance
+        return cls._instances[config_name]
+
+    def __init__(
+        self,
+        config_name: str = "router",
+        router_config: Optional[LLMRouterSettings] = None,
+    ):
+        if hasattr(self, "endpoints"):  # Only initialize if not already initialized
+            return
+
+        router_config = router_config or config.llm_router
+        if router_config is None or not router_config.endpoints:
+            raise ValueError("LLM router requires at least one endpoint")
+        weights = router_config.weights or [1.0] * len(router_config.endpoints)
+        if len(weights) != len(router_config.endpoints):
+            raise ValueError("LLM router weights must match its endpoints")
+
+        self.router_config = router_config
+        self.endpoints = [
+            Endpoint(name, LLM(config_name=name), weight)
+            for name, weight in zip(router_config.endpoints, weights)
+        ]
+        super().__init__(config_name=router_config.endpoints[0])
+        self.config_name = config_name
+
+        # Requests are rate limited by the endpoint they are sent to
+        self.rate_limiter = RateLimiter()
+        self.hedged_requests = 0
+
+    def _ranked_endpoints(self, stream: bool = False) -> List[Endpoint]:
+        """Endpoints in the order to try them, cooling-down endpoints last."""
+        strategy = self.router_config.strategy
+        if strategy == "weighted":
+            # Weighted sampling without replacement, discounted by recent errors
+            ranked = sorted(
+                self.endpoints,
+                key=lambda ep: random.random()
+                ** (1.0 / max(1e-6, ep.weight * (1.0 - ep.error_ewma))),
+                reverse=True,
+            )
+        elif strategy == "fastest":
+            ranked = sorted(
+                self.endpoints, key=lambda ep: ep.expected_latency(stream)
+            )
+        else:
+            ranked = list(self.endpoints)
+        return sorted(ranked, key=lambda ep: ep.cooling_down)
+
+    @staticmethod
+    def _should_fail_over(error: Exception) -> bool:
+        """Malformed requests would fail the same way on every endpoint."""
+        return not isinstance(
+            error, (BadRequestError, UnprocessableEntityError, ValueError, TypeError)
+        )
+
+    def _record_failure(self, endpoint: Endpoint, error: Exception) -> None:
+        endpoint.record_failure(
+            self.router_config.ewma_alpha, self.router_config.failure_cooldown
+        )
+        logger.warning(f"LLM endpoint '{endpoint.name}' failed: {error!r}")
+
+    async def _call_endpoint(
+        self, endpoint: Endpoint, params: dict, input_tokens: int
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            response = await endpoint.llm._create_completion(
+                {**params, "model": endpoint.llm.model}, input_tokens
+            )
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            raise
+        endpoint.record_success(
+            time.perf_counter() - start, self.router_config.ewma_alpha
+        )
+        llm_metrics.record_endpoint(endpoint.name)
+        usage = getattr(response, "usage", None)
+        if usage:
+            endpoint.llm.rate_limiter.record_usage(usage.completion_tokens)
+        return response
+
+    def _hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        if not self.router_config.hedge:
+            return None
+        quantile = endpoint.latency_quantile(
+            self.router_config.hedge_quantile, self.router_config.hedge_min_samples
+        )
+        return quantile if quantile is not None else self.router_config.hedge_delay
+
+    async def _create_completion(self, params: dict, input_tokens: int) -> Any:
+        """Send the request with failover and, if enabled, one hedged duplicate."""
+        candidates = iter(self._ranked_endpoints())
+        pending: Dict[asyncio.Task, Endpoint] = {}
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        def launch() -> bool:
+            endpoint = next(candidates, None)
+            if endpoint is None:
+                return False
+            task = asyncio.create_task(
+                self._call_endpoint(endpoint, params, input_tokens)
+            )
+            pending[task] = endpoint
+            return True
+
+        launch()
+        started_at = time.perf_counter()
+        try:
+            while pending:
+                timeout = None
+                if not hedged and len(pending) == 1:
+                    delay = self._hedge_delay(next(iter(pending.values())))
+                    if delay is not None:
+                        timeout = max(0.0, delay - (time.perf_counter() - started_at))
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    slow_endpoint = next(iter(pending.values()))
+                    if launch():
+                        slow_endpoint.hedges += 1
+                        self.hedged_requests += 1
+                        logger.info(
+                            f"LLM endpoint '{slow_endpoint.name}' is slow, sending a hedged request"
+                        )
+                    continue
+
+                for task in done:
+                    pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+                    if not self._should_fail_over(error):
+                        raise error
+                    last_error = error
+
+                if not pending:
+                    launch()
+                    started_at = time.perf_counter()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def _iter_stream(
+        self, params: dict, input_tokens: int
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        """Stream from the first healthy endpoint, failing over until a chunk arrives.
+
+        Streams are not hedged, and once chunks have been yielded an error is
+        raised rather than restarting the response on another endpoint.
+        """
+        last_error: Optional[Exception] = None
+        for endpoint in self._ranked_endpoints(stream=True):
+            start = time.perf_counter()
+            first_chunk_at = None
+            try:
+                async for chunk in endpoint.llm._iter_stream(
+                    {**params, "model": endpoint.llm.model}, input_tokens
+                ):
+                    if first_chunk_at is None:
+                        first_chunk_at = time.perf_counter()
+                        llm_metrics.record_endpoint(endpoint.name)
+                    usage = getattr(chunk, "usage", None)
+                    if usage:
+                        endpoint.llm.rate_limiter.record_usage(usage.completion_tokens)
+                    yield chunk
+            except Exception as e:
+                self._record_failure(endpoint, e)
+                if first_chunk_at is not None or not self._should_fail_over(e):
+                    raise
+                last_error = e
+                continue
+
+            endpoint.record_success(
+                (first_chunk_at or time.perf_counter()) - start,
+                self.router_config.ewma_alpha,
+                stream=True,
+            )
+            return
+
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-endpoint health and routing counters."""
+        return {
+            "hedged_requests": self.hedged_requests,
+            "endpoints": {ep.name: ep.snapshot() for ep in self.endpoints},
+        }
+
+
+def get_llm(config_name: str = "default") -> LLM:
+    """
+    Get the LLM for an agent or flow.
+
+    A named [llm.<config_name>] configuration is used as is. Otherwise, when
+    the [llm_router] section sets use_for_agents, requests go through the router.
+    """
+    router_config = config.llm_router
+    if (
+        router_config is not None
+        and router_config.use_for_agents
+        and (config_name == "default" or config_name not in config.llm)
+    ):
+        return LLMRouter()
+    return LLM(config_name=config_name)
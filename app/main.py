@@ -1,8 +1,10 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 
+from app.metrics import prometheus, ring_buffer
 from app.routers import homework, knowledge, crawler
 
 # 加载环境变量
@@ -32,6 +34,16 @@ app.include_router(crawler.router, prefix="/api/crawler", tags=["内容爬虫"])
 async def root():
     return {"message": "欢迎使用学习辅助AI Agent"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """LLM调用指标（Prometheus文本格式）"""
+    return prometheus.render()
+
+@app.get("/api/metrics/llm")
+async def llm_metrics_summary():
+    """最近LLM调用的汇总统计"""
+    return ring_buffer.summary()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,296 @@
+"""Per-call telemetry for the LLM layer: latency, queueing, tokens and retries."""
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.config import config
+from app.logger import logger
+
+
+class LLMCallRecord(BaseModel):
+    """Telemetry of one ask/ask_tool/ask_with_images call, across its retries."""
+
+    timestamp: float = Field(default_factory=time.time)
+    method: str
+    model: str
+    endpoint: Optional[str] = None
+    agent: Optional[str] = None
+    flow: Optional[str] = None
+    step: Optional[int] = None
+    stream: bool = False
+    queue_wait: float = 0.0
+    time_to_first_token: Optional[float] = None
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    retries: int = 0
+    cache_hit: bool = False
+    error: Optional[str] = None
+
+
+class MetricsExporter(ABC):
+    """Receives every finished call record."""
+
+    @abstractmethod
+    def export(self, record: LLMCallRecord) -> None:
+        """Handle one finished call record"""
+
+
+class RingBufferExporter(MetricsExporter):
+    """Keeps the most recent records in memory for in-process inspection."""
+
+    def __init__(self, capacity: int = 1000):
+        self._records: Deque[LLMCallRecord] = deque(maxlen=capacity)
+
+    def export(self, record: LLMCallRecord) -> None:
+        self._records.append(record)
+
+    def records(self, **labels: Any) -> List[LLMCallRecord]:
+        """Return buffered records, optionally filtered by field values"""
+        return [
+            record
+            for record in self._records
+            if all(getattr(record, key) == value for key, value in labels.items())
+        ]
+
+    def summary(self, **labels: Any) -> Dict[str, Any]:
+        """Aggregate buffered records: counts, token totals and latency percentiles"""
+        records = self.records(**labels)
+        latencies = sorted(record.latency for record in records)
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+
+        return {
+            "calls": len(records),
+            "errors": sum(1 for record in records if record.error),
+            "retries": sum(record.retries for record in records),
+            "prompt_tokens": sum(record.prompt_tokens for record in records),
+            "completion_tokens": sum(record.completion_tokens for record in records),
+            "cached_tokens": sum(record.cached_tokens for record in records),
+            "queue_wait": round(sum(record.queue_wait for record in records), 3),
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_p99": percentile(0.99),
+        }
+
+
+class JSONLExporter(MetricsExporter):
+    """Appends each record as one JSON line to a file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, record: LLMCallRecord) -> None:
+        line = record.model_dump_json() + "\n"
+        try:
+            with self._lock, self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to write LLM metrics to {self.path}: {e}")
+
+
+_LabelKey = Tuple[str, str, str, str]
+
+
+class PrometheusExporter(MetricsExporter):
+    """Aggregates records into Prometheus counters and latency histograms."""
+
+    LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+    LABELS = ("method", "model", "endpoint", "agent")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[_LabelKey, List[float]]] = {}
+
+    def _inc(self, name: str, labels: _LabelKey, value: float = 1) -> None:
+        series = self._counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def _observe(self, name: str, labels: _LabelKey, value: float) -> None:
+        # Per-bucket counts followed by the sum and the total count
+        series = self._histograms.setdefault(name, {})
+        buckets = series.setdefault(labels, [0.0] * (len(self.LATENCY_BUCKETS) + 2))
+        for i, bound in enumerate(self.LATENCY_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+        buckets[-2] += value
+        buckets[-1] += 1
+
+    def export(self, record: LLMCallRecord) -> None:
+        labels = tuple(str(getattr(record, name) or "") for name in self.LABELS)
+        with self._lock:
+            self._inc("llm_requests_total", labels)
+            if record.error:
+                self._inc("llm_request_errors_total", labels)
+            if record.cache_hit:
+                self._inc("llm_response_cache_hits_total", labels)
+            self._inc("llm_retries_total", labels, record.retries)
+            self._inc("llm_prompt_tokens_total", labels, record.prompt_tokens)
+            self._inc("llm_completion_tokens_total", labels, record.completion_tokens)
+            self._inc("llm_cached_tokens_total", labels, record.cached_tokens)
+            self._inc("llm_queue_wait_seconds_total", labels, record.queue_wait)
+            self._observe("llm_request_latency_seconds", labels, record.latency)
+            if record.time_to_first_token is not None:
+                self._observe(
+                    "llm_time_to_first_token_seconds",
+                    labels,
+                    record.time_to_first_token,
+                )
+
+    @classmethod
+    def _format_labels(cls, labels: _LabelKey, **extra: str) -> str:
+        pairs = list(zip(cls.LABELS, labels)) + list(extra.items())
+        escaped = (
+            (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in pairs
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+    def render(self) -> str:
+        """Render all series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, buckets in series.items():
+                    for bound, count in zip(self.LATENCY_BUCKETS, buckets):
+                        bucket_labels = self._format_labels(labels, le=str(bound))
+                        lines.append(f"{name}_bucket{bucket_labels} {count}")
+                    inf_labels = self._format_labels(labels, le="+Inf")
+                    lines.append(f"{name}_bucket{inf_labels} {buckets[-1]}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {buckets[-2]}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {buckets[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+# The record of the LLM call running in the current task, and the labels of the
+# agent step or flow it runs in
+_current_record: ContextVar[Optional[LLMCallRecord]] = ContextVar(
+    "llm_call_record", default=None
+)
+_labels: ContextVar[Dict[str, Any]] = ContextVar("llm_metrics_labels", default={})
+
+
+@contextmanager
+def metrics_labels(**labels: Any):
+    """Attach agent/flow/step labels to LLM calls made within the block."""
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_record() -> Optional[LLMCallRecord]:
+    """The record of the LLM call in progress, if any"""
+    return _current_record.get()
+
+
+class LLMMetrics:
+    """Dispatches finished call records to the registered exporters."""
+
+    def __init__(self):
+        self.exporters: List[MetricsExporter] = []
+
+    def add_exporter(self, exporter: MetricsExporter) -> MetricsExporter:
+        self.exporters.append(exporter)
+        return exporter
+
+    def emit(self, record: LLMCallRecord) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logger.warning(f"LLM metrics exporter {type(exporter).__name__} failed: {e}")
+
+    def record_queue_wait(self, seconds: float) -> None:
+        record = _current_record.get()
+        if record is not None:
+            record.queue_wait += seconds
+
+    def record_first_token(self) -> None:
+        record = _current_record.get()
+        if record is not None and record.time_to_first_token is None:
+            record.time_to_first_token = time.time() - record.timestamp
+
+    def record_tokens(
+        self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0
+    ) -> None:
+        record = _current_record.get()
+        if record is not None:
+            record.prompt_tokens += prompt_tokens
+            record.completion_tokens += completion_tokens
+            record.cached_tokens += cached_tokens
+
+    def record_retry(self) -> None:
+        record = _current_record.get()
+        if record is not None:
+            record.retries += 1
+
+    def record_endpoint(self, endpoint: str) -> None:
+        record = _current_record.get()
+        if record is not None:
+            record.endpoint = endpoint
+
+    def record_cache_hit(self) -> None:
+        record = _current_record.get()
+        if record is not None:
+            record.cache_hit = True
+
+
+llm_metrics = LLMMetrics()
+ring_buffer = llm_metrics.add_exporter(
+    RingBufferExporter(config.metrics_config.ring_buffer_size)
+)
+prometheus = llm_metrics.add_exporter(PrometheusExporter())
+if config.metrics_config.jsonl_path:
+    llm_metrics.add_exporter(JSONLExporter(config.metrics_config.jsonl_path))
+
+
+def record_llm_call(func: Callable) -> Callable:
+    """Record telemetry of an LLM request method, including all its retries.
+
+    Apply outside the retry decorator so one record covers the whole call.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        record = LLMCallRecord(
+            method=func.__name__,
+            model=self.model,
+            endpoint=getattr(self, "config_name", None),
+            stream=bool(kwargs.get("stream", False)),
+            **_labels.get(),
+        )
+        token = _current_record.set(record)
+        start = time.perf_counter()
+        try:
+            return await func(self, *args, **kwargs)
+        except BaseException as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.latency = time.perf_counter() - start
+            _current_record.reset(token)
+            llm_metrics.emit(record)
+
+    return wrapper
@@ -0,0 +1,334 @@
+"""
+OpenAI-compatible stand-in LLM server for offline load testing and benchmarks.
+
+Serves /v1/chat/completions (plain, streaming and tool calls) by replaying a
+transcript recorded with the `transcript_path` LLM setting, or a scripted
+sequence of responses, with configurable latency distributions.
+
+Usage:
+    python -m app.mock_llm --transcript transcript.jsonl --latency lognormal:-1,0.5
+
+Point an [llm.*] configuration's base_url at http://127.0.0.1:8001/v1 to use it.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app.logger import logger
+from app.transcript import load_transcript, request_key
+
+
+class LatencyModel:
+    """
+    A latency distribution in seconds, parsed from "<kind>:<params>".
+
+    Supported: fixed:S, uniform:LOW,HIGH, normal:MEAN,STD, lognormal:MU,SIGMA
+    (of the underlying normal) and exponential:MEAN. Samples are never negative.
+    """
+
+    KINDS = {
+        "fixed": 1,
+        "uniform": 2,
+        "normal": 2,
+        "lognormal": 2,
+        "exponential": 1,
+    }
+
+    def __init__(self, kind: str = "fixed", params: Optional[List[float]] = None):
+        params = params if params is not None else [0.0]
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"Invalid latency distribution: {kind}:{params}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, params = spec.partition(":")
+        try:
+            values = [float(value) for value in params.split(",")] if params else None
+        except ValueError:
+            raise ValueError(f"Invalid latency distribution: {spec}")
+        return cls(kind, values)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(*self.params)
+        else:
+            value = rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+def _estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def _conversation_id(messages: List[dict]) -> str:
+    """Identify a conversation by its first user message"""
+    first_user = next(
+        (message.get("content") for message in messages if message.get("role") == "user"),
+        None,
+    )
+    encoded = json.dumps(first_user, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class MockLLM:
+    """
+    Chooses the response to each request.
+
+    A request whose messages and tools match a recorded exchange gets the
+    recorded response (the n-th match gets the n-th recording). Otherwise each
+    conversation, identified by its first user message, walks the scripted
+    responses from the start; when they run out it falls back to a plain text
+    reply. Replies are deterministic for a given seed.
+    """
+
+    def __init__(
+        self,
+        entries: Optional[List[dict]] = None,
+        latency: Optional[LatencyModel] = None,
+        token_latency: Optional[LatencyModel] = None,
+        seed: int = 0,
+        loop: bool = False,
+    ):
+        self.latency = latency or LatencyModel()
+        self.token_latency = token_latency or LatencyModel()
+        self.loop = loop
+        self.rng = random.Random(seed)
+        self.recorded: Dict[str, List[dict]] = {}
+        self.script: List[dict] = []
+        for entry in entries or []:
+            if entry.get("key"):
+                self.recorded.setdefault(entry["key"], []).append(entry["response"])
+            else:
+                self.script.append(entry["response"])
+        self._recorded_cursor: Dict[str, int] = {}
+        self._script_cursor: Dict[str, int] = {}
+        self.requests = 0
+
+    def respond(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the assistant message {"content", "tool_calls"} for a request"""
+        self.requests += 1
+        messages = body.get("messages", [])
+
+        key = request_key(messages, body.get("tools"))
+        if key in self.recorded:
+            responses = self.recorded[key]
+            cursor = self._recorded_cursor.get(key, 0)
+            self._recorded_cursor[key] = cursor + 1
+            return self._normalize(responses[min(cursor, len(responses) - 1)])
+
+        conversation = _conversation_id(messages)
+        cursor = self._script_cursor.get(conversation, 0)
+        if self.script and (cursor < len(self.script) or self.loop):
+            self._script_cursor[conversation] = cursor + 1
+            return self._normalize(self.script[cursor % len(self.script)])
+
+        last = next(
+            (m.get("content") for m in reversed(messages) if m.get("role") == "user"),
+            "",
+        )
+        return {"content": f"Mock response to: {str(last)[:200]}", "tool_calls": None}
+
+    def new_id(self, prefix: str, bits: int = 96) -> str:
+        """A response or tool call id drawn from the seeded generator"""
+        return f"{prefix}{self.rng.getrandbits(bits):0{bits // 4}x}"
+
+    def _normalize(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        tool_calls = []
+        for call in response.get("tool_calls") or []:
+            function = call.get("function", call)
+            arguments = function.get("arguments", {})
+            if not isinstance(arguments, str):
+                arguments = json.dumps(arguments, ensure_ascii=False)
+            tool_calls.append(
+                {
+                    "id": call.get("id") or self.new_id("call_"),
+                    "type": "function",
+                    "function": {"name": function["name"], "arguments": arguments},
+                }
+            )
+        return {"content": response.get("content"), "tool_calls": tool_calls or None}
+
+    def usage(self, body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, int]:
+        prompt_tokens = _estimate_tokens(
+            json.dumps([body.get("messages"), body.get("tools")], default=str)
+        )
+        completion_tokens = _estimate_tokens(
+            (message["content"] or "")
+            + "".join(
+                call["function"]["name"] + call["function"]["arguments"]
+                for call in message["tool_calls"] or []
+            )
+        )
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+
+def _completion(body: dict, message: dict, usage: dict, completion_id: str) -> dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", **message},
+                "finish_reason": "tool_calls" if message["tool_calls"] else "stop",
+            }
+        ],
+        "usage": usage,
+    }
+
+
+def _split(text: str, size: int) -> List[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+
+async def _stream(
+    mock: MockLLM, body: dict, message: dict, usage: dict
+) -> AsyncIterator[str]:
+    completion_id = mock.new_id("chatcmpl-", 128)
+    created = int(time.time())
+
+    def chunk(delta: dict, finish_reason: Optional[str] = None, **extra) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            **extra,
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def pause() -> None:
+        delay = mock.token_latency.sample(mock.rng)
+        if delay:
+            await asyncio.sleep(delay)
+
+    yield chunk({"role": "assistant", "content": ""})
+    if message["content"]:
+        for piece in _split(message["content"], 16):
+            await pause()
+            yield chunk({"content": piece})
+    for index, call in enumerate(message["tool_calls"] or []):
+        await pause()
+        yield chunk(
+            {
+                "tool_calls": [
+                    {
+                        "index": index,
+                        "id": call["id"],
+                        "type": "function",
+                        "function": {"name": call["function"]["name"], "arguments": ""},
+                    }
+                ]
+            }
+        )
+        for piece in _split(call["function"]["arguments"], 32):
+            await pause()
+            yield chunk(
+                {"tool_calls": [{"index": index, "function": {"arguments": piece}}]}
+            )
+    yield chunk({}, "tool_calls" if message["tool_calls"] else "stop")
+
+    if (body.get("stream_options") or {}).get("include_usage"):
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body.get("model", "mock"),
+            "choices": [],
+            "usage": usage,
+        }
+        yield f"data: {json.dumps(payload)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_app(mock: MockLLM) -> FastAPI:
+    """Build the FastAPI app serving the mock"""
+    app = FastAPI(title="Mock LLM")
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        message = mock.respond(body)
+        usage = mock.usage(body, message)
+
+        # Time to first byte, before either the full response or the first chunk
+        delay = mock.latency.sample(mock.rng)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if body.get("stream"):
+            return StreamingResponse(
+                _stream(mock, body, message, usage), media_type="text/event-stream"
+            )
+        return _completion(body, message, usage, mock.new_id("chatcmpl-", 128))
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": mock.requests}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--transcript", help="Recorded transcript or scripted responses (JSONL)")
+    parser.add_argument(
+        "--latency", default="fixed:0", help="Response latency distribution, e.g. uniform:0.2,0.8"
+    )
+    parser.add_argument(
+        "--token-latency", default="fixed:0", help="Delay between streamed chunks"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--loop", action="store_true", help="Repeat the scripted responses when they run out"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    entries = load_transcript(args.transcript) if args.transcript else []
+    mock = MockLLM(
+        entries,
+        latency=LatencyModel.parse(args.latency),
+        token_latency=LatencyModel.parse(args.token_latency),
+        seed=args.seed,
+        loop=args.loop,
+    )
+    logger.info(
+        f"Mock LLM serving {len(mock.recorded)} recorded requests and "
+        f"{len(mock.script)} scripted responses on {args.host}:{args.port}"
+    )
+    uvicorn.run(create_app(mock), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
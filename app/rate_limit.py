@@ -0,0 +1,157 @@
+"""Client-side rate limiting and concurrency control for LLM requests."""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from app.config import LLMSettings
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `capacity` units per `period` seconds.
+
+    Waiters are served in FIFO order, so a large reservation is not starved by a
+    stream of small ones.
+    """
+
+    def __init__(self, capacity: int, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    @property
+    def available(self) -> float:
+        """Units currently available without waiting"""
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, amount: float) -> float:
+        """Reserve `amount` units, waiting until they are available.
+
+        Reservations larger than the bucket are clamped to its capacity so they
+        can eventually proceed.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def consume(self, amount: float) -> None:
+        """Debit units that were used without a reservation (may go negative)."""
+        self._refill()
+        self._tokens -= amount
+
+
+class RateLimiter:
+    """Requests/min and tokens/min budgets plus a cap on in-flight requests."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrent_requests: Optional[int] = None,
+    ):
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._semaphore = (
+            asyncio.Semaphore(max_concurrent_requests)
+            if max_concurrent_requests
+            else None
+        )
+
+        self.requests = 0
+        self.waiting = 0
+        self.in_flight = 0
+        self.total_wait_time = 0.0
+        self.last_wait_time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.request_bucket or self.token_bucket or self._semaphore)
+
+    @asynccontextmanager
+    async def limit(self, tokens: int = 0):
+        """Wait for request and token budget, then hold an in-flight slot.
+
+        Args:
+            tokens: Estimated input tokens of the request, reserved before sending
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        self.waiting += 1
+        acquired = False
+        try:
+            if self.request_bucket:
+                await self.request_bucket.acquire(1)
+            if self.token_bucket and tokens:
+                await self.token_bucket.acquire(tokens)
+            if self._semaphore:
+                await self._semaphore.acquire()
+                acquired = True
+        except BaseException:
+            self.waiting -= 1
+            raise
+
+        self.waiting -= 1
+        self.last_wait_time = time.perf_counter() - start
+        self.total_wait_time += self.last_wait_time
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if acquired:
+                self._semaphore.release()
+
+    def record_usage(self, tokens: int) -> None:
+        """Debit tokens that were not reserved up front, e.g. completion tokens."""
+        if self.token_bucket and tokens:
+            self.token_bucket.consume(tokens)
+
+    def stats(self) -> Dict[str, float]:
+        """Return queueing statistics of this limiter."""
+        return {
+            "requests": self.requests,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "total_wait_time": round(self.total_wait_time, 6),
+        }
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(config_name: str, llm_config: LLMSettings) -> RateLimiter:
+    """Get the rate limiter shared by all LLM instances of a config_name."""
+    if config_name not in _rate_limiters:
+        _rate_limiters[config_name] = RateLimiter(
+            requests_per_minute=llm_config.requests_per_minute,
+            tokens_per_minute=llm_config.tokens_per_minute,
+            max_concurrent_requests=llm_config.max_concurrent_requests,
+        )
+    return _rate_limiters[config_name]
@@ -0,0 +1,166 @@
+"""Retry policy for LLM API calls.
+
+Only transient failures (timeouts, connection errors, 408/409/429/5xx responses
+and provider throttling) are retried. The wait honors `Retry-After` and
+rate-limit reset headers, and every call has a deadline budget across all of
+its attempts.
+"""
+import asyncio
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import APIConnectionError, APIStatusError
+from tenacity import RetryCallState, retry, retry_if_exception, wait_random_exponential
+
+from app.exceptions import TokenLimitExceeded
+from app.logger import logger
+from app.metrics import llm_metrics
+
+
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+TRANSIENT_AWS_ERROR_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+_backoff = wait_random_exponential(min=1, max=60)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Check if an error is worth retrying."""
+    if isinstance(exc, (TokenLimitExceeded, ValueError, TypeError)):
+        return False
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in TRANSIENT_STATUS_CODES
+    if isinstance(exc, APIConnectionError):  # Includes APITimeoutError
+        return True
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+
+    # botocore ClientError carries the error code in its response dict
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in TRANSIENT_AWS_ERROR_CODES
+
+    return False
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse rate-limit reset durations such as '20ms', '1s' or '6m0s'."""
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    """Get the server-requested delay in seconds from an error response, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    if getattr(exc, "status_code", None) == 429:
+        resets = [
+            _parse_duration(headers.get(name, ""))
+            for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        if resets:
+            return max(resets)
+
+    return None
+
+
+class RetryStats:
+    """Retry counters of an LLM instance, per method."""
+
+    def __init__(self):
+        self.retries: Dict[str, int] = {}
+        self.wait_time: Dict[str, float] = {}
+        self.gave_up: Dict[str, int] = {}
+
+    def record_retry(self, method: str, wait: float) -> None:
+        self.retries[method] = self.retries.get(method, 0) + 1
+        self.wait_time[method] = self.wait_time.get(method, 0.0) + wait
+
+    def record_give_up(self, method: str) -> None:
+        self.gave_up[method] = self.gave_up.get(method, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the counters as a plain dict."""
+        return {
+            "retries": dict(self.retries),
+            "wait_time": {k: round(v, 3) for k, v in self.wait_time.items()},
+            "gave_up": dict(self.gave_up),
+        }
+
+
+def _llm(retry_state: RetryCallState) -> Any:
+    """The LLM instance whose method is being retried."""
+    return retry_state.args[0]
+
+
+def _wait(retry_state: RetryCallState) -> float:
+    exc = retry_state.outcome.exception()
+    retry_after = get_retry_after(exc) if exc else None
+    return retry_after if retry_after is not None else _backoff(retry_state)
+
+
+def _stop(retry_state: RetryCallState) -> bool:
+    llm = _llm(retry_state)
+    elapsed = retry_state.seconds_since_start or 0.0
+    upcoming_sleep = retry_state.upcoming_sleep or 0.0
+
+    give_up = retry_state.attempt_number >= llm.retry_max_attempts or (
+        llm.retry_deadline is not None and elapsed + upcoming_sleep > llm.retry_deadline
+    )
+    if give_up:
+        llm.retry_stats.record_give_up(retry_state.fn.__name__)
+    return give_up
+
+
+def _before_sleep(retry_state: RetryCallState) -> None:
+    method = retry_state.fn.__name__
+    wait = retry_state.upcoming_sleep or 0.0
+    _llm(retry_state).retry_stats.record_retry(method, wait)
+    llm_metrics.record_retry()
+    logger.warning(
+        f"Retrying {method} in {wait:.1f}s after attempt {retry_state.attempt_number} "
+        f"failed: {retry_state.outcome.exception()!r}"
+    )
+
+
+# Decorator for LLM request methods taking `self` as first argument
+llm_retry = retry(
+    retry=retry_if_exception(is_transient_error),
+    wait=_wait,
+    stop=_stop,
+    before_sleep=_before_sleep,
+)
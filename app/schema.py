@@ -1,6 +1,8 @@
+from collections import deque
 from enum import Enum
-from typing import Any, List, Literal, Optional, Union
-from pydantic import BaseModel, Field
+from typing import Any, Deque, Dict, Hashable, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+
 
 class Role(str, Enum):
     SYSTEM = "system"
@@ -37,6 +39,18 @@ class ToolCall(BaseModel):
     type: str = "function"
     function: Function
 
+def _blob_store():
+    # Imported on first use: the blob store needs the config, which core
+    # message types should not
+    from app.blob_store import blob_store
+
+    return blob_store
+
+
+def _put_image(base64_image: Optional[str]) -> Optional[str]:
+    return _blob_store().put(base64_image) if base64_image else None
+
+
 class Message(BaseModel):
     role: ROLE_TYPE = Field(...)  # type: ignore
     content: Optional[str] = Field(default=None)
@@ -44,6 +58,63 @@ class Message(BaseModel):
     name: Optional[str] = Field(default=None)
     tool_call_id: Optional[str] = Field(default=None)
     base64_image: Optional[str] = Field(default=None)
+    # Reference to the image in the blob store; set instead of base64_image
+    image_ref: Optional[str] = Field(default=None)
+
+    # Token counts keyed by tokenizer, filled lazily by LLM when the message is counted
+    _token_counts: Dict[Hashable, int] = PrivateAttr(default_factory=dict)
+    # Wire-format dicts: the plain dict, and the LLM request formats by image support
+    _wire: Optional[dict] = PrivateAttr(default=None)
+    _formatted: Dict[bool, dict] = PrivateAttr(default_factory=dict)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        # Any change to a public field invalidates the cached token counts and
+        # wire formats. Mutating nested objects in place does not, so assign a
+        # new value instead.
+        if not name.startswith("_"):
+            self._token_counts.clear()
+            self._wire = None
+            self._formatted.clear()
+
+    @model_validator(mode="before")
+    @classmethod
+    def _store_image(cls, data: Any) -> Any:
+        """Move an inline base64 image into the blob store"""
+        if isinstance(data, dict) and data.get("base64_image"):
+            data = {
+                **data,
+                "image_ref": _blob_store().put(data["base64_image"]),
+                "base64_image": None,
+            }
+        return data
+
+    @property
+    def has_image(self) -> bool:
+        return bool(self.image_ref or self.base64_image)
+
+    @property
+    def image_data(self) -> Optional[str]:
+        """The base64 image of this message, loaded from the blob store if needed"""
+        if self.image_ref:
+            return _blob_store().get(self.image_ref)
+        return self.base64_image
+
+    def get_token_count(self, key: Hashable) -> Optional[int]:
+        """Get the cached token count for a tokenizer key, if any"""
+        return self._token_counts.get(key)
+
+    def set_token_count(self, key: Hashable, count: int) -> None:
+        """Cache the token count of this message for a tokenizer key"""
+        self._token_counts[key] = count
+
+    def get_formatted(self, supports_images: bool) -> Optional[dict]:
+        """Get the cached LLM request format of this message, if any"""
+        return self._formatted.get(supports_images)
+
+    def set_formatted(self, supports_images: bool, formatted: dict) -> None:
+        """Cache the LLM request format of this message; it must not be mutated"""
+        self._formatted[supports_images] = formatted
 
     def __add__(self, other) -> List["Message"]:
         """支持 Message + list 或 Message + Message 的操作"""
@@ -66,50 +137,69 @@ class Message(BaseModel):
             )
 
     def to_dict(self) -> dict:
-        """Convert message to dictionary format"""
-        message = {"role": self.role}
-        if self.content is not None:
-            message["content"] = self.content
-        if self.tool_calls is not None:
-            message["tool_calls"] = [tool_call.dict() for tool_call in self.tool_calls]
-        if self.name is not None:
-            message["name"] = self.name
-        if self.tool_call_id is not None:
-            message["tool_call_id"] = self.tool_call_id
-        if self.base64_image is not None:
-            message["base64_image"] = self.base64_image
-        return message
+        """Convert message to dictionary format
+
+        The dict is built once and cached until a field is reassigned; callers
+        get a shallow copy they may modify.
+        """
+        if self._wire is None:
+            message = {"role": self.role}
+            if self.content is not None:
+                message["content"] = self.content
+            if self.tool_calls is not None:
+                message["tool_calls"] = [
+                    tool_call.model_dump() for tool_call in self.tool_calls
+                ]
+            if self.name is not None:
+                message["name"] = self.name
+            if self.tool_call_id is not None:
+                message["tool_call_id"] = self.tool_call_id
+            if self.base64_image is not None:
+                message["base64_image"] = self.base64_image
+            if self.image_ref is not None:
+                message["image_ref"] = self.image_ref
+            self._wire = message
+        return dict(self._wire)
+
+    # The factories below build messages from trusted values without running
+    # validation; external input should go through Message(...) instead.
 
     @classmethod
     def user_message(
         cls, content: str, base64_image: Optional[str] = None
     ) -> "Message":
         """Create a user message"""
-        return cls(role=Role.USER, content=content, base64_image=base64_image)
+        return cls.model_construct(
+            role=Role.USER.value, content=content, image_ref=_put_image(base64_image)
+        )
 
     @classmethod
     def system_message(cls, content: str) -> "Message":
         """Create a system message"""
-        return cls(role=Role.SYSTEM, content=content)
+        return cls.model_construct(role=Role.SYSTEM.value, content=content)
 
     @classmethod
     def assistant_message(
         cls, content: Optional[str] = None, base64_image: Optional[str] = None
     ) -> "Message":
         """Create an assistant message"""
-        return cls(role=Role.ASSISTANT, content=content, base64_image=base64_image)
+        return cls.model_construct(
+            role=Role.ASSISTANT.value,
+            content=content,
+            image_ref=_put_image(base64_image),
+        )
 
     @classmethod
     def tool_message(
         cls, content: str, name, tool_call_id: str, base64_image: Optional[str] = None
     ) -> "Message":
         """Create a tool message"""
-        return cls(
-            role=Role.TOOL,
+        return cls.model_construct(
+            role=Role.TOOL.value,
             content=content,
             name=name,
             tool_call_id=tool_call_id,
-            base64_image=base64_image,
+            image_ref=_put_image(base64_image),
         )
 
     @classmethod
@@ -128,39 +218,109 @@ class Message(BaseModel):
             base64_image: Optional base64 encoded image
         """
         formatted_calls = [
-            {"id": call.id, "function": call.function.model_dump(), "type": "function"}
+            ToolCall.model_construct(
+                id=call.id,
+                type="function",
+                function=Function.model_construct(
+                    name=call.function.name, arguments=call.function.arguments
+                ),
+            )
             for call in tool_calls
         ]
-        return cls(
-            role=Role.ASSISTANT,
+        return cls.model_construct(
+            role=Role.ASSISTANT.value,
             content=content,
             tool_calls=formatted_calls,
-            base64_image=base64_image,
+            image_ref=_put_image(base64_image),
             **kwargs,
         )
 
 
+# Tool calls that end a run rather than act, and so never indicate a loop
+_UNFINGERPRINTED_TOOLS = {"terminate"}
+
+
+def _fingerprint(message: Message) -> Optional[int]:
+    """Hash of an assistant message's content and tool calls; None if it has neither"""
+    calls = tuple(
+        (call.function.name, call.function.arguments)
+        for call in message.tool_calls or ()
+        if call.function.name not in _UNFINGERPRINTED_TOOLS
+    )
+    if not (message.content or calls):
+        return None
+    return hash((message.content or "", calls))
+
+
 class Memory(BaseModel):
     messages: List[Message] = Field(default_factory=list)
     max_messages: int = Field(default=100)
 
+    # Fingerprints of the assistant messages, oldest first. Kept in step by the
+    # methods below; assigning `messages` rebuilds them, but mutating the list
+    # in place does not.
+    _fingerprints: Deque[Optional[int]] = PrivateAttr(default_factory=deque)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._index()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name == "messages":
+            self._index()
+
+    def _index(self) -> None:
+        self._fingerprints = deque()
+        for message in self.messages:
+            self._add_fingerprint(message)
+
+    def _add_fingerprint(self, message: Message) -> None:
+        if message.role != Role.ASSISTANT:
+            return
+        self._fingerprints.append(_fingerprint(message))
+
     def add_message(self, message: Message) -> None:
         """Add a message to memory"""
         self.messages.append(message)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        self._add_fingerprint(message)
+        self._trim()
 
     def add_messages(self, messages: List[Message]) -> None:
         """Add multiple messages to memory"""
         self.messages.extend(messages)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        for message in messages:
+            self._add_fingerprint(message)
+        self._trim()
+
+    def _trim(self) -> None:
+        """Keep at most max_messages, never starting on an orphaned tool result"""
+        if len(self.messages) <= self.max_messages:
+            return
+        start = len(self.messages) - self.max_messages
+        while start < len(self.messages) and self.messages[start].role == Role.TOOL:
+            start += 1
+        for message in self.messages[:start]:
+            if message.role == Role.ASSISTANT:
+                self._fingerprints.popleft()
+        del self.messages[:start]
 
     def clear(self) -> None:
         """Clear all messages"""
         self.messages.clear()
+        self._fingerprints.clear()
+
+    def duplicate_count(self, window: int) -> int:
+        """Number of the `window` assistant messages before the latest one that
+        have the same content and tool calls as it"""
+        if not self._fingerprints or self._fingerprints[-1] is None:
+            return 0
+        recent = self.recent_fingerprints(window + 1)
+        return recent[:-1].count(recent[-1])
+
+    def recent_fingerprints(self, n: int) -> List[Optional[int]]:
+        """Fingerprints of the last n assistant messages, oldest first"""
+        count = len(self._fingerprints)
+        return [self._fingerprints[i] for i in range(max(0, count - n), count)]
 
     def get_recent_messages(self, n: int) -> List[Message]:
         """Get n most recent messages"""
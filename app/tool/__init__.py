@@ -1,13 +1,29 @@
+import importlib
+
 from app.tool.base import BaseTool
-from app.tool.bash import Bash
-from app.tool.browser_use_tool import BrowserUseTool
 from app.tool.create_chat_completion import CreateChatCompletion
 from app.tool.planning import PlanningTool
-from app.tool.str_replace_editor import StrReplaceEditor
 from app.tool.terminate import Terminate
 from app.tool.tool_collection import ToolCollection
-from app.tool.web_search import WebSearch
-from app.tool.crawl4ai import Crawl4aiTool
+
+
+# Tools with heavy dependencies (browser_use, docker, crawl4ai, search clients)
+# are imported on first access
+_LAZY_TOOLS = {
+    "Bash": "app.tool.bash",
+    "BrowserUseTool": "app.tool.browser_use_tool",
+    "StrReplaceEditor": "app.tool.str_replace_editor",
+    "WebSearch": "app.tool.web_search",
+    "Crawl4aiTool": "app.tool.crawl4ai",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_TOOLS:
+        value = getattr(importlib.import_module(_LAZY_TOOLS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
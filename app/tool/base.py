@@ -8,6 +8,9 @@ class BaseTool(ABC, BaseModel):
     name: str
     description: str
     parameters: Optional[dict] = None
+    # Whether calls of this tool have no side effects, so they may run concurrently
+    # with other parallel-safe calls and start before the response is complete
+    parallel_safe: bool = False
 
     class Config:
         arbitrary_types_allowed = True
@@ -61,6 +61,7 @@ class Crawl4aiTool(BaseTool):
         },
         "required": ["urls"],
     }
+    parallel_safe: bool = True
 
     async def execute(
         self,
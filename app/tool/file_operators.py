@@ -6,7 +6,6 @@ from typing import Optional, Protocol, Tuple, Union, runtime_checkable
 
 from app.config import SandboxSettings
 from app.exceptions import ToolError
-from app.sandbox.client import SANDBOX_CLIENT
 
 
 PathLike = Union[str, Path]
@@ -97,7 +96,16 @@ class SandboxFileOperator(FileOperator):
     """File operations implementation for sandbox environment."""
 
     def __init__(self):
-        self.sandbox_client = SANDBOX_CLIENT
+        self._sandbox_client = None
+
+    @property
+    def sandbox_client(self):
+        # Imported on first use so that loading file tools does not import docker
+        if self._sandbox_client is None:
+            from app.sandbox.client import SANDBOX_CLIENT
+
+            self._sandbox_client = SANDBOX_CLIENT
+        return self._sandbox_client
 
     async def _ensure_sandbox_initialized(self):
         """Ensure sandbox is initialized."""
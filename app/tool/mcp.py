@@ -1,28 +1,32 @@
 from contextlib import AsyncExitStack
-from typing import Dict, List, Optional
-
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.types import ListToolsResult, TextContent
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from app.logger import logger
 from app.tool.base import BaseTool, ToolResult
 from app.tool.tool_collection import ToolCollection
 
 
+# The mcp package is imported when a server is first used
+if TYPE_CHECKING:
+    from mcp import ClientSession
+    from mcp.types import ListToolsResult
+
+
 class MCPClientTool(BaseTool):
     """Represents a tool proxy that can be called on the MCP server from the client side."""
 
-    session: Optional[ClientSession] = None
+    session: Optional[Any] = None  # mcp.ClientSession
     server_id: str = ""  # Add server identifier
     original_name: str = ""
+    parallel_safe: bool = True
 
     async def execute(self, **kwargs) -> ToolResult:
         """Execute the tool by making a remote call to the MCP server."""
         if not self.session:
             return ToolResult(error="Not connected to MCP server")
 
+        from mcp.types import TextContent
+
         try:
             logger.info(f"Executing tool: {self.original_name}")
             result = await self.session.call_tool(self.original_name, kwargs)
@@ -39,7 +43,7 @@ class MCPClients(ToolCollection):
     A collection of tools that connects to multiple MCP servers and manages available tools through the Model Context Protocol.
     """
 
-    sessions: Dict[str, ClientSession] = {}
+    sessions: Dict[str, "ClientSession"] = {}
     exit_stacks: Dict[str, AsyncExitStack] = {}
     description: str = "MCP client tools for server interaction"
 
@@ -58,6 +62,9 @@ class MCPClients(ToolCollection):
         if server_id in self.sessions:
             await self.disconnect(server_id)
 
+        from mcp import ClientSession
+        from mcp.client.sse import sse_client
+
         exit_stack = AsyncExitStack()
         self.exit_stacks[server_id] = exit_stack
 
@@ -81,6 +88,9 @@ class MCPClients(ToolCollection):
         if server_id in self.sessions:
             await self.disconnect(server_id)
 
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
         exit_stack = AsyncExitStack()
         self.exit_stacks[server_id] = exit_stack
 
@@ -121,6 +131,7 @@ class MCPClients(ToolCollection):
 
         # Update tools tuple
         self.tools = tuple(self.tool_map.values())
+        self.invalidate_params()
         logger.info(
             f"Connected to server {server_id} with tools: {[tool.name for tool in response.tools]}"
         )
@@ -144,8 +155,10 @@ class MCPClients(ToolCollection):
 
         return sanitized
 
-    async def list_tools(self) -> ListToolsResult:
+    async def list_tools(self) -> "ListToolsResult":
         """List all available tools."""
+        from mcp.types import ListToolsResult
+
         tools_result = ListToolsResult(tools=[])
         for session in self.sessions.values():
             response = await session.list_tools()
@@ -182,6 +195,7 @@ class MCPClients(ToolCollection):
                         if v.server_id != server_id
                     }
                     self.tools = tuple(self.tool_map.values())
+                    self.invalidate_params()
                     logger.info(f"Disconnected from MCP server {server_id}")
                 except Exception as e:
                     logger.error(f"Error disconnecting from server {server_id}: {e}")
@@ -191,4 +205,5 @@ class MCPClients(ToolCollection):
                 await self.disconnect(sid)
             self.tool_map = {}
             self.tools = tuple()
+            self.invalidate_params()
             logger.info("Disconnected from all MCP servers")
@@ -1,5 +1,8 @@
 # tool/planning.py
-from typing import Dict, List, Literal, Optional
+import re
+from typing import Any, Dict, List, Literal, Optional, Set
+
+from pydantic import BaseModel, Field, PrivateAttr
 
 from app.exceptions import ToolError
 from app.tool.base import BaseTool, ToolResult
@@ -11,6 +14,203 @@ The tool provides functionality for creating plans, updating plan steps, and tra
 """
 
 
+STEP_STATUSES = ["not_started", "in_progress", "completed", "blocked"]
+ACTIVE_STATUSES = ("not_started", "in_progress")
+STATUS_SYMBOLS = {
+    "not_started": "[ ]",
+    "in_progress": "[→]",
+    "completed": "[✓]",
+    "blocked": "[!]",
+}
+
+# Step type tag in a step's text, e.g. "[SEARCH] Find sources"
+STEP_TYPE_PATTERN = re.compile(r"\[([A-Z_]+)\]")
+
+
+def _sequential_dependencies(step_count: int) -> List[List[int]]:
+    return [[i - 1] if i > 0 else [] for i in range(step_count)]
+
+
+class Plan(BaseModel):
+    """
+    A plan with per-step status, notes and dependencies.
+
+    Status counts, the set of steps ready to run and the rendered text are kept
+    up to date incrementally, so marking a step costs O(its dependents) rather
+    than a pass over the whole plan. Dict-style access (`plan["steps"]`,
+    `plan.get(...)`) is supported for code written against the former plain-dict
+    plans. Assigning a field rebuilds the indexes; mutating a list in place does
+    not, so assign a new list or use `set_status`.
+    """
+
+    plan_id: str
+    title: str
+    steps: List[str]
+    step_statuses: List[str] = Field(default_factory=list)
+    step_notes: List[str] = Field(default_factory=list)
+    step_dependencies: Optional[List[List[int]]] = None
+
+    _status_counts: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _step_types: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _dependents: List[List[int]] = PrivateAttr(default_factory=list)
+    _pending_dependencies: List[int] = PrivateAttr(default_factory=list)
+    _ready: Set[int] = PrivateAttr(default_factory=set)
+    _lines: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _text: Optional[str] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rebuild()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in ("plan_id", "title"):
+            self._text = None
+        elif not name.startswith("_"):
+            self._rebuild()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in type(self).model_fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in type(self).model_fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in type(self).model_fields
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in type(self).model_fields else default
+
+    def _rebuild(self) -> None:
+        """Recompute all indexes and drop the rendered text"""
+        count = len(self.steps)
+        # Pad per-step lists of plans built with missing entries
+        if len(self.step_statuses) < count:
+            self.step_statuses.extend(["not_started"] * (count - len(self.step_statuses)))
+        if len(self.step_notes) < count:
+            self.step_notes.extend([""] * (count - len(self.step_notes)))
+
+        statuses = self.step_statuses
+        dependencies = self.dependencies
+        self._status_counts = {status: 0 for status in STEP_STATUSES}
+        for status in statuses[:count]:
+            self._status_counts[status] = self._status_counts.get(status, 0) + 1
+
+        self._step_types = []
+        for step in self.steps:
+            match = STEP_TYPE_PATTERN.search(step)
+            self._step_types.append(match.group(1).lower() if match else None)
+
+        self._dependents = [[] for _ in range(count)]
+        self._pending_dependencies = [0] * count
+        for i, depends_on in enumerate(dependencies):
+            for dep in depends_on:
+                self._dependents[dep].append(i)
+                if statuses[dep] != "completed":
+                    self._pending_dependencies[i] += 1
+        self._ready = {
+            i
+            for i in range(count)
+            if statuses[i] in ACTIVE_STATUSES and not self._pending_dependencies[i]
+        }
+        self._lines = [None] * count
+        self._text = None
+
+    @property
+    def dependencies(self) -> List[List[int]]:
+        """Dependencies of each step; sequential if none were given"""
+        if self.step_dependencies is None or len(self.step_dependencies) != len(
+            self.steps
+        ):
+            return _sequential_dependencies(len(self.steps))
+        return self.step_dependencies
+
+    @property
+    def status_counts(self) -> Dict[str, int]:
+        return dict(self._status_counts)
+
+    def step_type(self, index: int) -> Optional[str]:
+        """Lower-cased type tag of a step, e.g. 'search' for '[SEARCH] Find sources'"""
+        return self._step_types[index]
+
+    def ready_steps(self) -> List[int]:
+        """Active steps with all their dependencies completed, in plan order"""
+        return sorted(self._ready)
+
+    def _update_ready(self, index: int) -> None:
+        if (
+            self.step_statuses[index] in ACTIVE_STATUSES
+            and not self._pending_dependencies[index]
+        ):
+            self._ready.add(index)
+        else:
+            self._ready.discard(index)
+
+    def set_status(self, index: int, status: str) -> None:
+        """Set a step's status, updating counts and ready steps incrementally"""
+        old_status = self.step_statuses[index]
+        if old_status == status:
+            return
+        self.step_statuses[index] = status
+        self._status_counts[old_status] = self._status_counts.get(old_status, 0) - 1
+        self._status_counts[status] = self._status_counts.get(status, 0) + 1
+
+        if "completed" in (old_status, status):
+            delta = -1 if status == "completed" else 1
+            for dependent in self._dependents[index]:
+                self._pending_dependencies[dependent] += delta
+                self._update_ready(dependent)
+        self._update_ready(index)
+        self._lines[index] = None
+        self._text = None
+
+    def set_notes(self, index: int, notes: str) -> None:
+        self.step_notes[index] = notes
+        self._lines[index] = None
+        self._text = None
+
+    def _render_step(self, index: int) -> str:
+        status = self.step_statuses[index]
+        line = f"{index}. {STATUS_SYMBOLS.get(status, '[ ]')} {self.steps[index]}\n"
+        depends_on = self.dependencies[index]
+        if depends_on != ([index - 1] if index > 0 else []):
+            line += f"   Depends on: {', '.join(str(dep) for dep in depends_on) or 'none'}\n"
+        if self.step_notes[index]:
+            line += f"   Notes: {self.step_notes[index]}\n"
+        return line
+
+    def render(self) -> str:
+        """The plan as text; cached until a step changes, re-rendering only changed steps"""
+        if self._text is not None:
+            return self._text
+
+        output = f"Plan: {self.title} (ID: {self.plan_id})\n"
+        output += "=" * len(output) + "\n\n"
+
+        counts = self._status_counts
+        total_steps = len(self.steps)
+        completed = counts["completed"]
+        output += f"Progress: {completed}/{total_steps} steps completed "
+        if total_steps > 0:
+            output += f"({completed / total_steps * 100:.1f}%)\n"
+        else:
+            output += "(0%)\n"
+        output += (
+            f"Status: {completed} completed, {counts['in_progress']} in progress, "
+            f"{counts['blocked']} blocked, {counts['not_started']} not started\n\n"
+        )
+        output += "Steps:\n"
+
+        for i, line in enumerate(self._lines):
+            if line is None:
+                self._lines[i] = self._render_step(i)
+        self._text = output + "".join(self._lines)
+        return self._text
+
+
 class PlanningTool(BaseTool):
     """
     A planning tool that allows the agent to create and manage plans for solving complex tasks.
@@ -48,6 +248,11 @@ class PlanningTool(BaseTool):
                 "type": "array",
                 "items": {"type": "string"},
             },
+            "step_dependencies": {
+                "description": "For each step, the 0-based indices of the steps that must be completed before it. Steps whose dependencies are completed can run in parallel. Optional for create and update commands; if omitted, each step depends on the previous one.",
+                "type": "array",
+                "items": {"type": "array", "items": {"type": "integer"}},
+            },
             "step_index": {
                 "description": "Index of the step to update (0-based). Required for mark_step command.",
                 "type": "integer",
@@ -66,7 +271,7 @@ class PlanningTool(BaseTool):
         "additionalProperties": False,
     }
 
-    plans: dict = {}  # Dictionary to store plans by plan_id
+    plans: Dict[str, Plan] = {}  # Dictionary to store plans by plan_id
     _current_plan_id: Optional[str] = None  # Track the current active plan
 
     async def execute(
@@ -78,6 +283,7 @@ class PlanningTool(BaseTool):
         plan_id: Optional[str] = None,
         title: Optional[str] = None,
         steps: Optional[List[str]] = None,
+        step_dependencies: Optional[List[List[int]]] = None,
         step_index: Optional[int] = None,
         step_status: Optional[
             Literal["not_started", "in_progress", "completed", "blocked"]
@@ -93,15 +299,16 @@ class PlanningTool(BaseTool):
         - plan_id: Unique identifier for the plan
         - title: Title for the plan (used with create command)
         - steps: List of steps for the plan (used with create command)
+        - step_dependencies: Indices each step depends on (used with create and update commands)
         - step_index: Index of the step to update (used with mark_step command)
         - step_status: Status to set for a step (used with mark_step command)
         - step_notes: Additional notes for a step (used with mark_step command)
         """
 
         if command == "create":
-            return self._create_plan(plan_id, title, steps)
+            return self._create_plan(plan_id, title, steps, step_dependencies)
         elif command == "update":
-            return self._update_plan(plan_id, title, steps)
+            return self._update_plan(plan_id, title, steps, step_dependencies)
         elif command == "list":
             return self._list_plans()
         elif command == "get":
@@ -118,7 +325,11 @@ class PlanningTool(BaseTool):
             )
 
     def _create_plan(
-        self, plan_id: Optional[str], title: Optional[str], steps: Optional[List[str]]
+        self,
+        plan_id: Optional[str],
+        title: Optional[str],
+        steps: Optional[List[str]],
+        step_dependencies: Optional[List[List[int]]] = None,
     ) -> ToolResult:
         """Create a new plan with the given ID, title, and steps."""
         if not plan_id:
@@ -142,13 +353,16 @@ class PlanningTool(BaseTool):
             )
 
         # Create a new plan with initialized step statuses
-        plan = {
-            "plan_id": plan_id,
-            "title": title,
-            "steps": steps,
-            "step_statuses": ["not_started"] * len(steps),
-            "step_notes": [""] * len(steps),
-        }
+        plan = Plan(
+            plan_id=plan_id,
+            title=title,
+            steps=steps,
+            step_statuses=["not_started"] * len(steps),
+            step_notes=[""] * len(steps),
+            step_dependencies=self._validate_dependencies(
+                step_dependencies, len(steps)
+            ),
+        )
 
         self.plans[plan_id] = plan
         self._current_plan_id = plan_id  # Set as active plan
@@ -158,7 +372,11 @@ class PlanningTool(BaseTool):
         )
 
     def _update_plan(
-        self, plan_id: Optional[str], title: Optional[str], steps: Optional[List[str]]
+        self,
+        plan_id: Optional[str],
+        title: Optional[str],
+        steps: Optional[List[str]],
+        step_dependencies: Optional[List[List[int]]] = None,
     ) -> ToolResult:
         """Update an existing plan with new title or steps."""
         if not plan_id:
@@ -170,7 +388,7 @@ class PlanningTool(BaseTool):
         plan = self.plans[plan_id]
 
         if title:
-            plan["title"] = title
+            plan.title = title
 
         if steps:
             if not isinstance(steps, list) or not all(
@@ -181,9 +399,9 @@ class PlanningTool(BaseTool):
                 )
 
             # Preserve existing step statuses for unchanged steps
-            old_steps = plan["steps"]
-            old_statuses = plan["step_statuses"]
-            old_notes = plan["step_notes"]
+            old_steps = plan.steps
+            old_statuses = plan.step_statuses
+            old_notes = plan.step_notes
 
             # Create new step statuses and notes
             new_statuses = []
@@ -198,9 +416,24 @@ class PlanningTool(BaseTool):
                     new_statuses.append("not_started")
                     new_notes.append("")
 
-            plan["steps"] = steps
-            plan["step_statuses"] = new_statuses
-            plan["step_notes"] = new_notes
+            new_dependencies = self._validate_dependencies(
+                step_dependencies, len(steps)
+            )
+            # Replace all per-step fields at once so the indexes are rebuilt once
+            updated = plan.model_copy(
+                update={
+                    "steps": steps,
+                    "step_statuses": new_statuses,
+                    "step_notes": new_notes,
+                    "step_dependencies": new_dependencies,
+                }
+            )
+            updated._rebuild()
+            self.plans[plan_id] = plan = updated
+        elif step_dependencies is not None:
+            plan.step_dependencies = self._validate_dependencies(
+                step_dependencies, len(plan.steps)
+            )
 
         return ToolResult(
             output=f"Plan updated successfully: {plan_id}\n\n{self._format_plan(plan)}"
@@ -216,12 +449,10 @@ class PlanningTool(BaseTool):
         output = "Available plans:\n"
         for plan_id, plan in self.plans.items():
             current_marker = " (active)" if plan_id == self._current_plan_id else ""
-            completed = sum(
-                1 for status in plan["step_statuses"] if status == "completed"
-            )
-            total = len(plan["steps"])
+            completed = plan.status_counts["completed"]
+            total = len(plan.steps)
             progress = f"{completed}/{total} steps completed"
-            output += f"• {plan_id}{current_marker}: {plan['title']} - {progress}\n"
+            output += f"• {plan_id}{current_marker}: {plan.title} - {progress}\n"
 
         return ToolResult(output=output)
 
@@ -278,31 +509,67 @@ class PlanningTool(BaseTool):
 
         plan = self.plans[plan_id]
 
-        if step_index < 0 or step_index >= len(plan["steps"]):
+        if step_index < 0 or step_index >= len(plan.steps):
             raise ToolError(
-                f"Invalid step_index: {step_index}. Valid indices range from 0 to {len(plan['steps'])-1}."
+                f"Invalid step_index: {step_index}. Valid indices range from 0 to {len(plan.steps)-1}."
             )
 
-        if step_status and step_status not in [
-            "not_started",
-            "in_progress",
-            "completed",
-            "blocked",
-        ]:
+        if step_status and step_status not in STEP_STATUSES:
             raise ToolError(
                 f"Invalid step_status: {step_status}. Valid statuses are: not_started, in_progress, completed, blocked"
             )
 
         if step_status:
-            plan["step_statuses"][step_index] = step_status
+            plan.set_status(step_index, step_status)
 
         if step_notes:
-            plan["step_notes"][step_index] = step_notes
+            plan.set_notes(step_index, step_notes)
 
         return ToolResult(
             output=f"Step {step_index} updated in plan '{plan_id}'.\n\n{self._format_plan(plan)}"
         )
 
+    @staticmethod
+    def _validate_dependencies(
+        step_dependencies: Optional[List[List[int]]], step_count: int
+    ) -> List[List[int]]:
+        """Check step dependencies, defaulting to each step depending on the previous one."""
+        if step_dependencies is None:
+            return _sequential_dependencies(step_count)
+
+        if not isinstance(step_dependencies, list) or len(step_dependencies) != step_count:
+            raise ToolError(
+                "Parameter `step_dependencies` must have one list of step indices per step"
+            )
+        dependencies = []
+        for i, depends_on in enumerate(step_dependencies):
+            if not isinstance(depends_on, list) or not all(
+                isinstance(dep, int) and 0 <= dep < step_count and dep != i
+                for dep in depends_on
+            ):
+                raise ToolError(
+                    f"Invalid dependencies for step {i}: {depends_on}. Dependencies must be indices of other steps."
+                )
+            dependencies.append(sorted(set(depends_on)))
+
+        # Reject cycles: repeatedly remove steps whose dependencies are all removed
+        remaining = set(range(step_count))
+        while remaining:
+            free = {i for i in remaining if not remaining.intersection(dependencies[i])}
+            if not free:
+                raise ToolError(
+                    f"Step dependencies contain a cycle between steps: {sorted(remaining)}"
+                )
+            remaining -= free
+        return dependencies
+
+    def get_ready_steps(self, plan_id: str) -> List[int]:
+        """
+        Indices of the steps that can run now: not completed or blocked, with all
+        their dependencies completed.
+        """
+        return self.plans[plan_id].ready_steps()
+
     def _delete_plan(self, plan_id: Optional[str]) -> ToolResult:
         """Delete a plan."""
         if not plan_id:
@@ -319,45 +586,6 @@ class PlanningTool(BaseTool):
 
         return ToolResult(output=f"Plan '{plan_id}' has been deleted.")
 
-    def _format_plan(self, plan: Dict) -> str:
+    def _format_plan(self, plan: Plan) -> str:
         """Format a plan for display."""
-        output = f"Plan: {plan['title']} (ID: {plan['plan_id']})\n"
-        output += "=" * len(output) + "\n\n"
-
-        # Calculate progress statistics
-        total_steps = len(plan["steps"])
-        completed = sum(1 for status in plan["step_statuses"] if status == "completed")
-        in_progress = sum(
-            1 for status in plan["step_statuses"] if status == "in_progress"
-        )
-        blocked = sum(1 for status in plan["step_statuses"] if status == "blocked")
-        not_started = sum(
-            1 for status in plan["step_statuses"] if status == "not_started"
-        )
-
-        output += f"Progress: {completed}/{total_steps} steps completed "
-        if total_steps > 0:
-            percentage = (completed / total_steps) * 100
-            output += f"({percentage:.1f}%)\n"
-        else:
-            output += "(0%)\n"
-
-        output += f"Status: {completed} completed, {in_progress} in progress, {blocked} blocked, {not_started} not started\n\n"
-        output += "Steps:\n"
-
-        # Add each step with its status and notes
-        for i, (step, status, notes) in enumerate(
-            zip(plan["steps"], plan["step_statuses"], plan["step_notes"])
-        ):
-            status_symbol = {
-                "not_started": "[ ]",
-                "in_progress": "[→]",
-                "completed": "[✓]",
-                "blocked": "[!]",
-            }.get(status, "[ ]")
-
-            output += f"{i}. {status_symbol} {step}\n"
-            if notes:
-                output += f"   Notes: {notes}\n"
-
-        return output
+        return plan.render()
@@ -1,11 +1,19 @@
 """Collection classes for managing multiple tools."""
-from typing import Any, Dict, List
+from typing import Any, Dict, Hashable, List
 
 from app.exceptions import ToolError
 from app.logger import logger
 from app.tool.base import BaseTool, ToolFailure, ToolResult
 
 
+class ToolParams(list):
+    """Serialized tool schemas, memoizing their token cost per tokenizer."""
+
+    def __init__(self, params: List[Dict[str, Any]]):
+        super().__init__(params)
+        self.token_counts: Dict[Hashable, int] = {}
+
+
 class ToolCollection:
     """A collection of defined tools."""
 
@@ -15,12 +23,33 @@ class ToolCollection:
     def __init__(self, *tools: BaseTool):
         self.tools = tools
         self.tool_map = {tool.name: tool for tool in tools}
+        self._params: Dict[bool, ToolParams] = {}
 
     def __iter__(self):
         return iter(self.tools)
 
-    def to_params(self) -> List[Dict[str, Any]]:
-        return [tool.to_param() for tool in self.tools]
+    def to_params(self, sort_by_name: bool = False) -> List[Dict[str, Any]]:
+        """Return the tool schemas, serialized once until the tool set changes.
+
+        Args:
+            sort_by_name: Order schemas by tool name instead of insertion order, so
+                the serialized tools do not depend on when each tool was added
+        """
+        params = self._params.get(sort_by_name)
+        if params is None:
+            tools = (
+                sorted(self.tools, key=lambda tool: tool.name)
+                if sort_by_name
+                else self.tools
+            )
+            params = self._params[sort_by_name] = ToolParams(
+                [tool.to_param() for tool in tools]
+            )
+        return params
+
+    def invalidate_params(self) -> None:
+        """Drop the memoized schemas after the tool set or a tool schema changed."""
+        self._params = {}
 
     async def execute(
         self, *, name: str, tool_input: Dict[str, Any] = None
@@ -59,6 +88,7 @@ class ToolCollection:
 
         self.tools += (tool,)
         self.tool_map[tool.name] = tool
+        self.invalidate_params()
         return self
 
     def add_tools(self, *tools: BaseTool):
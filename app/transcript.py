@@ -0,0 +1,106 @@
+"""JSONL transcripts of LLM exchanges, recorded from live runs and replayed offline."""
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import LLMSettings
+from app.logger import logger
+
+
+def request_key(messages: List[dict], tools: Optional[List[dict]] = None) -> str:
+    """Stable key of a request, used to find its recorded response on replay."""
+    encoded = json.dumps(
+        [messages, tools or None], sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class TranscriptRecorder:
+    """
+    Appends request/response pairs to a JSONL file.
+
+    Each line holds the request messages and tools, its key, and the assistant
+    message returned (content and tool calls) with its token usage.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        method: str,
+        params: Dict[str, Any],
+        message: Any,
+        usage: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """Record one exchange; `message` is a ChatCompletionMessage or a string"""
+        if isinstance(message, str):
+            response = {"content": message, "tool_calls": None}
+        else:
+            response = {
+                "content": message.content,
+                "tool_calls": [call.model_dump() for call in message.tool_calls]
+                if message.tool_calls
+                else None,
+            }
+        entry = {
+            "timestamp": time.time(),
+            "method": method,
+            "model": params.get("model"),
+            "key": request_key(params.get("messages", []), params.get("tools")),
+            "request": {
+                "messages": params.get("messages", []),
+                "tools": params.get("tools"),
+                "tool_choice": params.get("tool_choice"),
+            },
+            "response": response,
+            "usage": usage,
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock, self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to record LLM transcript to {self.path}: {e}")
+
+
+def load_transcript(path: Path) -> List[dict]:
+    """
+    Load a transcript or a scripted response sequence.
+
+    Lines are either recorded exchanges (with a "response" field) or bare
+    scripted responses such as {"content": "...", "tool_calls": [...]}, where a
+    tool call may give "arguments" as an object. Scripted responses get no key
+    and are replayed in order.
+    """
+    entries = []
+    with Path(path).open(encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid transcript line {line_number}: {e}")
+            if "response" not in entry:
+                entry = {"key": None, "response": entry}
+            entries.append(entry)
+    return entries
+
+
+_recorders: Dict[Path, TranscriptRecorder] = {}
+
+
+def get_transcript_recorder(llm_config: LLMSettings) -> Optional[TranscriptRecorder]:
+    """Get the transcript recorder for the given settings, or None if recording is off."""
+    if not llm_config.transcript_path:
+        return None
+    path = Path(llm_config.transcript_path)
+    if path not in _recorders:
+        _recorders[path] = TranscriptRecorder(path)
+    return _recorders[path]
@@ -0,0 +1,138 @@
+"""
+Benchmark: end-to-end throughput of the agent loop against the mock LLM server.
+
+Starts app.mock_llm in-process, then runs concurrent ToolCallAgent sessions
+whose LLM points at it. Every session replays the same script: a number of
+create_chat_completion tool calls followed by terminate. Reports wall time,
+agent steps and LLM requests per second, and latency percentiles of the LLM
+calls from the in-process metrics buffer. No network access is needed.
+
+Usage:
+    python -m benchmarks.agent_loop [--sessions 16] [--steps 10] [--latency lognormal:-2,0.5]
+"""
+import argparse
+import asyncio
+import time
+
+import uvicorn
+
+from app.agent.toolcall import ToolCallAgent
+from app.config import config
+from app.llm import LLM
+from app.metrics import ring_buffer
+from app.mock_llm import LatencyModel, MockLLM, create_app
+
+
+def _script(steps: int) -> list:
+    script = [
+        {
+            "response": {
+                "content": f"Working on step {step}",
+                "tool_calls": [
+                    {
+                        "name": "create_chat_completion",
+                        "arguments": {"response": f"Result of step {step}"},
+                    }
+                ],
+            }
+        }
+        for step in range(steps)
+    ]
+    script.append(
+        {
+            "response": {
+                "content": "Done",
+                "tool_calls": [{"name": "terminate", "arguments": {"status": "success"}}],
+            }
+        }
+    )
+    return script
+
+
+async def run_benchmark(
+    sessions: int = 16,
+    steps: int = 10,
+    latency: str = "fixed:0",
+    token_latency: str = "fixed:0",
+    seed: int = 0,
+    port: int = 8011,
+) -> dict:
+    """Run the benchmark and return its raw results; port 0 picks a free port."""
+    mock = MockLLM(
+        _script(steps),
+        latency=LatencyModel.parse(latency),
+        token_latency=LatencyModel.parse(token_latency),
+        seed=seed,
+    )
+    server = uvicorn.Server(
+        uvicorn.Config(create_app(mock), host="127.0.0.1", port=port, log_level="warning")
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    settings = config.llm["default"].model_copy(
+        update={
+            "api_type": "openai",
+            "base_url": f"http://127.0.0.1:{port}/v1",
+            "api_key": "mock",
+            "cache_enabled": False,
+            "transcript_path": None,
+            "max_input_tokens": None,
+        }
+    )
+    llm = LLM(config_name="mock", llm_config={"default": settings, "mock": settings})
+    agents = [ToolCallAgent(llm=llm, max_steps=steps + 2) for _ in range(sessions)]
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(agent.run(f"Benchmark session {i}") for i, agent in enumerate(agents))
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        server.should_exit = True
+        await server_task
+
+    return {
+        "elapsed": elapsed,
+        "agent_steps": sum(agent.current_step for agent in agents),
+        "llm_requests": mock.requests,
+        "latency": ring_buffer.summary(model=llm.model),
+    }
+
+
+async def _run(args: argparse.Namespace) -> None:
+    result = await run_benchmark(
+        sessions=args.sessions,
+        steps=args.steps,
+        latency=args.latency,
+        token_latency=args.token_latency,
+        seed=args.seed,
+        port=args.port,
+    )
+    elapsed = result["elapsed"]
+    summary = result["latency"]
+    print(f"sessions={args.sessions} steps/session={args.steps + 1} wall={elapsed:.2f}s")
+    print(f"agent steps/s: {result['agent_steps'] / elapsed:,.1f}")
+    print(f"LLM requests/s: {result['llm_requests'] / elapsed:,.1f}")
+    print(
+        f"LLM latency p50={summary['latency_p50']}s p95={summary['latency_p95']}s "
+        f"p99={summary['latency_p99']}s errors={summary['errors']}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--latency", default="lognormal:-2,0.5")
+    parser.add_argument("--token-latency", default="fixed:0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8011)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: cold import time of agent entry points, with a regression budget.
+
+Imports each module in a fresh interpreter under `python -X importtime` and
+reports the median cumulative import time over several runs. Also checks that
+heavy optional dependencies (browser_use, playwright, docker, mcp, pandas,
+boto3, crawl4ai) are not imported until a tool that needs them is used.
+Exits with status 1 if a module is over budget or imports a heavy dependency,
+so it can guard startup time in CI. Most of the budget is the openai SDK,
+which every entry point loads through app.llm (about 0.9s of the total).
+
+Usage:
+    python -m benchmarks.import_time [--budget-ms 2000] [--runs 5] [module ...]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+
+DEFAULT_MODULES = ["app.agent.manus", "app.agent.toolcall", "app.flow.planning"]
+HEAVY_MODULES = [
+    "browser_use",
+    "playwright",
+    "docker",
+    "mcp",
+    "pandas",
+    "boto3",
+    "crawl4ai",
+]
+
+
+def _import_time_ms(module: str) -> float:
+    """Cumulative import time of a module in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def _heavy_imports(module: str) -> List[str]:
+    """Heavy dependencies loaded as a side effect of importing a module"""
+    code = (
+        f"import sys, json, {module}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _measure(module: str, runs: int) -> Tuple[float, List[str]]:
+    times = [_import_time_ms(module) for _ in range(runs)]
+    return statistics.median(times), _heavy_imports(module)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=2000.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<24} {'median ms':>10} {'budget':>8}  heavy imports")
+    for module in args.modules:
+        median_ms, heavy = _measure(module, args.runs)
+        over_budget = median_ms > args.budget_ms
+        failed = failed or over_budget or bool(heavy)
+        status = "OVER" if over_budget else "ok"
+        print(
+            f"{module:<24} {median_ms:>10.1f} {status:>8}  {', '.join(heavy) or '-'}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: message construction and per-step formatting cost of agent memory.
+
+Simulates concurrent ToolCallAgent sessions where every step appends an assistant
+tool call and its observation, then formats the whole history for the next
+request. Compares the previous behavior (validated construction, dicts rebuilt
+for every message on every step) with the current one (unvalidated factories,
+wire-format dicts cached per message).
+
+Usage:
+    python -m benchmarks.message_memory [--sessions 8] [--steps 200]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from app.llm import LLM
+from app.schema import Memory, Message, Role
+
+
+def _legacy_to_dict(message: Message) -> dict:
+    """Message.to_dict as it was before wire dicts were cached"""
+    result = {"role": message.role}
+    if message.content is not None:
+        result["content"] = message.content
+    if message.tool_calls is not None:
+        result["tool_calls"] = [call.model_dump() for call in message.tool_calls]
+    if message.name is not None:
+        result["name"] = message.name
+    if message.tool_call_id is not None:
+        result["tool_call_id"] = message.tool_call_id
+    return result
+
+
+def _legacy_step(step: int, observation: str) -> List[Message]:
+    call_id = f"call_{step}"
+    return [
+        Message(
+            role=Role.ASSISTANT,
+            content=f"Thinking about step {step}",
+            tool_calls=[
+                {
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": "web_search", "arguments": '{"q": "x"}'},
+                }
+            ],
+        ),
+        Message(role=Role.TOOL, content=observation, name="web_search", tool_call_id=call_id),
+    ]
+
+
+def _current_step(step: int, observation: str) -> List[Message]:
+    call_id = f"call_{step}"
+    call = ChatCompletionMessageToolCall(
+        id=call_id,
+        type="function",
+        function=Function(name="web_search", arguments='{"q": "x"}'),
+    )
+    return [
+        Message.from_tool_calls(tool_calls=[call], content=f"Thinking about step {step}"),
+        Message.tool_message(content=observation, name="web_search", tool_call_id=call_id),
+    ]
+
+
+def _run(
+    make_step: Callable[[int, str], List[Message]],
+    format_history: Callable[[List[Message]], List[dict]],
+    sessions: int,
+    steps: int,
+    observation: str,
+) -> dict:
+    memories = [Memory(max_messages=10 * steps) for _ in range(sessions)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    for step in range(steps):
+        for memory in memories:
+            memory.add_messages(make_step(step, observation))
+            format_history(memory.messages)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mib": peak / 2**20}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--observation-chars", type=int, default=2000)
+    args = parser.parse_args()
+
+    observation = ("observation text " * args.observation_chars)[: args.observation_chars]
+    results = {
+        "previous": _run(
+            _legacy_step,
+            lambda history: LLM.format_messages([_legacy_to_dict(m) for m in history]),
+            args.sessions,
+            args.steps,
+            observation,
+        ),
+        "current": _run(
+            _current_step, LLM.format_messages, args.sessions, args.steps, observation
+        ),
+    }
+
+    formatted = args.sessions * args.steps * (args.steps + 1)
+    print(f"{'variant':>10} {'seconds':>9} {'msgs/s':>12} {'peak MiB':>9}")
+    for name, result in results.items():
+        rate = formatted / result["seconds"]
+        print(
+            f"{name:>10} {result['seconds']:>9.2f} {rate:>12,.0f} {result['peak_mib']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
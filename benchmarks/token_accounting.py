@@ -0,0 +1,65 @@
+"""
+Benchmark: per-step input token accounting cost as the agent history grows.
+
+Simulates a ToolCallAgent run where every step appends an assistant tool call and
+its tool observation, then measures how long the input token count of the whole
+history takes per step, with and without the per-message token cache.
+
+Usage:
+    python -m benchmarks.token_accounting [--steps 30] [--observation-chars 4000]
+"""
+import argparse
+import time
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from app.llm import LLM
+from app.schema import Memory, Message
+
+
+def _make_step(step: int, observation_chars: int) -> list[Message]:
+    call = ChatCompletionMessageToolCall(
+        id=f"call_{step}",
+        type="function",
+        function=Function(name="web_search", arguments=f'{{"query": "topic {step}"}}'),
+    )
+    observation = (f"result line {step} " * observation_chars)[:observation_chars]
+    return [
+        Message.from_tool_calls(tool_calls=[call], content=f"Thinking about step {step}"),
+        Message.tool_message(
+            content=observation, name="web_search", tool_call_id=f"call_{step}"
+        ),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--observation-chars", type=int, default=4000)
+    args = parser.parse_args()
+
+    llm = LLM()
+    memory = Memory(max_messages=10_000)
+    memory.add_message(Message.user_message("Research the given topics"))
+    system_msgs = [Message.system_message("You are a helpful agent.")]
+
+    print(f"{'step':>4} {'messages':>8} {'uncached ms':>12} {'cached ms':>10}")
+    for step in range(1, args.steps + 1):
+        memory.add_messages(_make_step(step, args.observation_chars))
+        messages = system_msgs + memory.messages
+
+        start = time.perf_counter()
+        uncached = llm.count_message_tokens(llm.format_messages(messages))
+        uncached_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        _, cached = llm.format_and_count_messages(messages)
+        cached_ms = (time.perf_counter() - start) * 1000
+
+        assert cached == uncached, (cached, uncached)
+        print(f"{step:>4} {len(messages):>8} {uncached_ms:>12.2f} {cached_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
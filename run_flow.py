@@ -1,23 +1,26 @@
+import argparse
 import asyncio
 import time
+from typing import Optional
 
-from app.agent.data_analysis import DataAnalysis
 from app.agent.manus import Manus
 from app.config import config
 from app.flow.flow_factory import FlowFactory, FlowType
 from app.logger import logger
 
 
-async def run_flow():
+async def run_flow(resume_plan_id: Optional[str] = None):
     agents = {
         "manus": Manus(),
     }
     if config.run_flow_config.use_data_analysis_agent:
+        from app.agent.data_analysis import DataAnalysis
+
         agents["data_analysis"] = DataAnalysis()
     try:
-        prompt = input("Enter your prompt: ")
+        prompt = "" if resume_plan_id else input("Enter your prompt: ")
 
-        if prompt.strip().isspace() or not prompt:
+        if not resume_plan_id and (prompt.strip().isspace() or not prompt):
             logger.warning("Empty prompt provided.")
             return
 
@@ -30,7 +33,7 @@ async def run_flow():
         try:
             start_time = time.time()
             result = await asyncio.wait_for(
-                flow.execute(prompt),
+                flow.execute(prompt, resume_plan_id=resume_plan_id),
                 timeout=3600,  # 60 minute timeout for the entire execution
             )
             elapsed_time = time.time() - start_time
@@ -41,6 +44,11 @@ async def run_flow():
             logger.info(
                 "Operation terminated due to timeout. Please try a simpler request."
             )
+            if flow.checkpoint_store:
+                logger.info(
+                    f"Completed steps are checkpointed; continue with: "
+                    f"python run_flow.py --resume {flow.active_plan_id}"
+                )
 
     except KeyboardInterrupt:
         logger.info("Operation cancelled by user.")
@@ -49,4 +57,9 @@ async def run_flow():
 
 
 if __name__ == "__main__":
-    asyncio.run(run_flow())
+    parser = argparse.ArgumentParser(description="Run the planning flow")
+    parser.add_argument(
+        "--resume", metavar="PLAN_ID", help="Resume a checkpointed plan by its ID"
+    )
+    args = parser.parse_args()
+    asyncio.run(run_flow(args.resume))
@@ -0,0 +1,16 @@
+import pytest
+
+try:
+    from benchmarks.agent_loop import run_benchmark
+except FileNotFoundError:  # app.config needs config/config.toml
+    pytest.skip("no configuration file in config/", allow_module_level=True)
+
+
+@pytest.mark.asyncio
+async def test_agent_loop_benchmark_smoke():
+    result = await run_benchmark(sessions=1, steps=1, port=0)
+
+    # One scripted tool call step, then terminate
+    assert result["agent_steps"] == 2
+    assert result["llm_requests"] == 2
+    assert result["latency"]["errors"] == 0
@@ -0,0 +1,79 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+try:
+    from app.config import config
+    from app.llm import LLM
+    from app.schema import Message
+except FileNotFoundError:  # app.config needs config/config.toml
+    pytest.skip("no configuration file in config/", allow_module_level=True)
+
+
+def _output_line(custom_id: str, body: dict) -> str:
+    return json.dumps(
+        {"custom_id": custom_id, "response": {"status_code": 200, "body": body}}
+    )
+
+
+class FakeBatchClient:
+    """The files and batches endpoints of a client, serving a fixed output file"""
+
+    def __init__(self, output: str):
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=None)
+        self._output = output
+
+    async def _create_file(self, file, purpose):
+        return SimpleNamespace(id="file-input")
+
+    async def _content(self, file_id):
+        return SimpleNamespace(text=self._output)
+
+    async def _create_batch(self, **kwargs):
+        return SimpleNamespace(
+            id="batch-1",
+            status="completed",
+            output_file_id="file-output",
+            error_file_id=None,
+        )
+
+
+@pytest.mark.asyncio
+async def test_batch_api_reports_an_invalid_output_line_per_request():
+    settings = config.llm["default"].model_copy(
+        update={"api_type": "openai", "cache_enabled": False, "transcript_path": None}
+    )
+    llm = LLM(config_name="batch_api", llm_config={"default": settings})
+    completion = {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": settings.model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "first"},
+                "finish_reason": "stop",
+            }
+        ],
+    }
+    llm.client = FakeBatchClient(
+        "\n".join(
+            [
+                _output_line("0", completion),
+                _output_line("1", {"choices": "not a list"}),
+                "{not json",
+            ]
+        )
+    )
+
+    results = await llm.ask_batch(
+        [[Message.user_message(f"Prompt {i}")] for i in range(3)],
+        use_batch_api=True,
+    )
+
+    assert results[0].response == "first"
+    assert results[1].error.startswith("ValidationError")
+    assert results[2].error == "No result in batch job batch-1"
@@ -0,0 +1,82 @@
+import httpx
+import pytest
+from openai.types.chat import ChatCompletionChunk
+
+try:
+    from app.agent.toolcall import ToolCallAgent
+    from app.config import config
+    from app.llm import LLM
+    from app.tool import Terminate, ToolCollection
+    from app.tool.base import BaseTool
+except FileNotFoundError:  # app.config needs config/config.toml
+    pytest.skip("no configuration file in config/", allow_module_level=True)
+
+
+class RecordingTool(BaseTool):
+    description: str = "Records its calls"
+    parameters: dict = {"type": "object", "properties": {}}
+    calls: list = []
+
+    async def execute(self, **kwargs) -> str:
+        self.calls.append(kwargs)
+        return f"{self.name} done"
+
+
+def _chunk(index: int, call_id: str, name: str) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "test",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {
+                        "tool_calls": [
+                            {
+                                "index": index,
+                                "id": call_id,
+                                "type": "function",
+                                "function": {"name": name, "arguments": "{}"},
+                            }
+                        ]
+                    },
+                    "finish_reason": None,
+                }
+            ],
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_failing_after_first_tool_call_runs_side_effects_once():
+    settings = config.llm["default"].model_copy(
+        update={"cache_enabled": False, "transcript_path": None}
+    )
+    llm = LLM(config_name="streamed_tool_calls", llm_config={"default": settings})
+    lookup = RecordingTool(name="lookup", parallel_safe=True, calls=[])
+    write = RecordingTool(name="write", calls=[])
+    attempts = []
+
+    async def iter_stream(params, input_tokens):
+        attempt = len(attempts)
+        attempts.append(attempt)
+        yield _chunk(0, f"lookup_{attempt}", "lookup")
+        yield _chunk(1, f"write_{attempt}", "write")
+        if attempt == 0:
+            raise httpx.ReadError("connection lost mid-stream")
+
+    llm._iter_stream = iter_stream
+    agent = ToolCallAgent(
+        llm=llm,
+        stream_tool_calls=True,
+        available_tools=ToolCollection(lookup, write, Terminate()),
+    )
+
+    assert await agent.think()
+    await agent.act()
+
+    assert len(attempts) == 2
+    assert [call.id for call in agent.tool_calls] == ["lookup_1", "write_1"]
+    assert len(write.calls) == 1